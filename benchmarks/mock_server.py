@@ -0,0 +1,274 @@
+"""
+Local stand-in for a podmanager server, for benchmarks and manual testing.
+
+Serves the endpoints the CLI talks to with generated data:
+
+- POST /api/v1/auth/login returns a JWT that expires in a day.
+- GET /api/v1/infra/common/getNodeList returns the node list, with an ETag so
+  conditional requests get 304 Not Modified.
+- POST /api/v1/infra/getFirmwareVersion and /api/v1/infra/getFru return data for the
+  requested BMC IPs.
+- GET/POST/DELETE /api/v1/provision/osimg list, upload and delete os images, and
+  /api/v1/provision/osimg/uploads implements the chunked upload protocol of cli.upload.
+
+The node count, the size of the padding added to every node and an artificial latency
+per request are configurable. Run it standalone:
+
+    python benchmarks/mock_server.py --port 18080 --nodes 2000 --latency 0.05
+    podmanager-cli login --url http://127.0.0.1:18080 --account admin --password admin
+
+or start it in-process with MockServer(...).start().
+"""
+
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+
+def generate_nodes(count: int, padding: int = 0) -> list:
+    """
+    Generate a node list as returned by getNodeList.
+
+    Args:
+        count (int): Number of nodes.
+        padding (int): Number of extra bytes added to every node in a "Description" field,
+            to simulate larger payloads.
+
+    Returns:
+        list: The nodes.
+    """
+    nodes = []
+    for i in range(count):
+        node = {
+            "Host Name": f"AMI10FFE074{i // 256:02X}{i % 256:02X}",
+            "BMC MAC": f"10:FF:E0:74:{i // 256 % 256:02X}:{i % 256:02X}",
+            "BMC IPv4": f"100.74.{i // 256}.{i % 256}",
+            "Status": "Warning" if i % 3 == 0 else "Health",
+            "Power": {"Status": "Off" if i % 4 == 0 else "On"},
+            "Rack": f"R{i // 40:03d}",
+        }
+        if padding:
+            node["Description"] = "x" * padding
+        nodes.append(node)
+    return nodes
+
+
+def firmware_for(ip: str) -> dict:
+    last = int(ip.rsplit(".", 1)[-1])
+    return {"BMCImage1": f"13.06.{last % 20}", "BMCImage2": "13.06.10", "BIOS1": f"R17_F{30 + last % 5}"}
+
+
+def fru_for(ip: str) -> dict:
+    # FRU records are keyed by their index as a string, as the server returns them
+    return {"0": {"Product": {"ProductName": "R163-Z35-AAH1-000", "SerialNumber": f"GIG{ip.replace('.', '')}"}}}
+
+
+class MockServer:
+    """
+    Threaded HTTP server with the podmanager endpoints used by the CLI.
+
+    Args:
+        port (int): Port to listen on, 0 picks a free one.
+        nodes (int): Number of nodes in the node list.
+        padding (int): Extra bytes per node, see generate_nodes.
+        latency (float): Seconds to wait before answering each request.
+    """
+
+    def __init__(self, port: int = 0, nodes: int = 100, padding: int = 0, latency: float = 0.0):
+        self.nodes = generate_nodes(nodes, padding)
+        self.node_list_body = json.dumps(self.nodes).encode()
+        self.node_list_etag = f'"{hashlib.sha256(self.node_list_body).hexdigest()[:16]}"'
+        self.latency = latency
+        self.images = {
+            i: {
+                "id": i,
+                "os": "ubuntu",
+                "release": "jammy",
+                "name": f"ubuntu/jammy-{i}",
+                "architecture": "amd64",
+                "size": 1024**3 + i,
+                "last_deployed": None,
+            }
+            for i in range(1, 4)
+        }
+        self.uploads = {}
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "MockServer":
+        """Serve requests in a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, obj, status=200, headers=None):
+                body = obj if isinstance(obj, bytes) else json.dumps(obj).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def read_body(self) -> bytes:
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def dispatch(self, method):
+                body = self.read_body()
+                if server.latency:
+                    time.sleep(server.latency)
+                path = urlsplit(self.path).path
+                # Handlers are named after the last path segment, or the one before an id
+                segments = path.strip("/").split("/")[-2:]
+                handler = None
+                for segment in reversed(segments):
+                    handler = getattr(self, f"{method}_{segment}", None)
+                    if handler is not None:
+                        break
+                if handler is None:
+                    return self.send_json({"detail": "Not Found"}, 404)
+                return handler(path, body)
+
+            def do_GET(self):
+                self.dispatch("get")
+
+            def do_POST(self):
+                self.dispatch("post")
+
+            def do_PUT(self):
+                self.dispatch("put")
+
+            def do_DELETE(self):
+                self.dispatch("delete")
+
+            def post_login(self, path, body):
+                from jose import jwt
+
+                token = jwt.encode({"sub": "admin", "exp": int(time.time()) + 86400}, "mock-secret")
+                self.send_json({"access_token": token, "token_type": "bearer"})
+
+            def get_getNodeList(self, path, body):
+                headers = {"ETag": server.node_list_etag}
+                if self.headers.get("If-None-Match") == server.node_list_etag:
+                    self.send_response(304)
+                    self.send_header("ETag", server.node_list_etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                self.send_json(server.node_list_body, headers=headers)
+
+            def post_getFirmwareVersion(self, path, body):
+                self.send_json({ip: firmware_for(ip) for ip in json.loads(body or b"[]")})
+
+            def post_getFru(self, path, body):
+                self.send_json({ip: fru_for(ip) for ip in json.loads(body or b"[]")})
+
+            def get_osimg(self, path, body):
+                with server.lock:
+                    self.send_json(list(server.images.values()))
+
+            def post_osimg(self, path, body):
+                # Multipart upload of a whole image in one request
+                with server.lock:
+                    image_id = max(server.images, default=0) + 1
+                    image = {"id": image_id, "name": f"upload-{image_id}", "size": len(body), "architecture": "amd64"}
+                    server.images[image_id] = image
+                self.send_json(image)
+
+            def delete_osimg(self, path, body):
+                image_id = int(path.rstrip("/").rsplit("/", 1)[-1])
+                with server.lock:
+                    image = server.images.pop(image_id, None)
+                if image is None:
+                    return self.send_json({"detail": "Not Found"}, 404)
+                self.send_json(image)
+
+            def post_uploads(self, path, body):
+                with server.lock:
+                    upload_id = str(len(server.uploads) + 1)
+                    server.uploads[upload_id] = {"meta": json.loads(body), "checksum": hashlib.sha256(), "offset": 0}
+                self.send_json({"upload_id": upload_id, "offset": 0})
+
+            def get_uploads(self, path, body):
+                upload = server.uploads.get(path.rsplit("/", 1)[-1])
+                if upload is None:
+                    return self.send_json({"detail": "Not Found"}, 404)
+                self.send_json({"offset": upload["offset"]})
+
+            def put_uploads(self, path, body):
+                upload = server.uploads.get(path.rsplit("/", 1)[-1])
+                if upload is None:
+                    return self.send_json({"detail": "Not Found"}, 404)
+                start = int(self.headers["Content-Range"].split()[1].split("-")[0])
+                if start != upload["offset"]:
+                    return self.send_json({"offset": upload["offset"]}, 409)
+                upload["checksum"].update(body)
+                upload["offset"] += len(body)
+                self.send_json({"offset": upload["offset"]})
+
+            def post_complete(self, path, body):
+                upload = server.uploads.pop(path.rstrip("/").split("/")[-2], None)
+                if upload is None:
+                    return self.send_json({"detail": "Not Found"}, 404)
+                if json.loads(body).get("sha256") != upload["checksum"].hexdigest():
+                    return self.send_json({"detail": "Checksum mismatch"}, 422)
+                with server.lock:
+                    image_id = max(server.images, default=0) + 1
+                    image = {"id": image_id, "size": upload["offset"], **upload["meta"]}
+                    server.images[image_id] = image
+                self.send_json(image)
+
+        return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=18080, help="Port to listen on (default 18080).")
+    parser.add_argument("--nodes", type=int, default=100, help="Number of nodes in the node list (default 100).")
+    parser.add_argument("--padding", type=int, default=0, help="Extra bytes per node in the node list (default 0).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before each response.")
+    args = parser.parse_args()
+
+    server = MockServer(port=args.port, nodes=args.nodes, padding=args.padding, latency=args.latency)
+    print(f"Serving {args.nodes} nodes on {server.url}", flush=True)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
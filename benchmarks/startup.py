@@ -0,0 +1,105 @@
+"""
+Cold-start benchmark for every podmanager-cli subcommand.
+
+Each subcommand is started in a fresh interpreter with --help, which parses the
+command line and imports whatever the command needs without talking to a server.
+Results can be saved and compared against a baseline so startup regressions fail
+the run:
+
+    python benchmarks/startup.py --save startup.json
+    python benchmarks/startup.py --baseline startup.json --max-regression 0.25
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import click
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT_DIR))
+
+from cli.commands import cli  # noqa: E402
+
+
+def discover_commands(group: click.Group, prefix=()) -> list:
+    """Return the argv prefix of every command and group below the given group."""
+    ctx = click.Context(group)
+    commands = []
+    for name in group.list_commands(ctx):
+        command = group.get_command(ctx, name)
+        commands.append(prefix + (name,))
+        if isinstance(command, click.Group):
+            commands.extend(discover_commands(command, prefix + (name,)))
+    return commands
+
+
+def measure(argv: list, repeat: int) -> dict:
+    """Start the CLI repeat times with the given arguments and return timing statistics in ms."""
+    env = dict(os.environ, PYTHONPATH=str(ROOT_DIR))
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "cli.commands", *argv],
+            cwd=ROOT_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"min": min(samples), "median": statistics.median(samples), "max": max(samples)}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Number of cold starts per subcommand.")
+    parser.add_argument("--save", help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", help="Compare the results with a file written by --save.")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.25,
+        help="Fail when a best-of-repeat time is this fraction slower than the baseline (default 0.25).",
+    )
+    args = parser.parse_args()
+
+    cases = [("--help",), ("--version",)] + [command + ("--help",) for command in discover_commands(cli)]
+    results = {}
+    for argv in cases:
+        name = " ".join(argv)
+        results[name] = measure(list(argv), args.repeat)
+        print(f"{name:45} min {results[name]['min']:8.1f} ms   median {results[name]['median']:8.1f} ms")
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump({"python": sys.version, "repeat": args.repeat, "results": results}, file, indent=2)
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline, "r") as file:
+        baseline = json.load(file)["results"]
+
+    regressions = []
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        # The fastest run is the least affected by other load on the machine
+        change = stats["min"] / baseline[name]["min"] - 1
+        if change > args.max_regression:
+            regressions.append((name, baseline[name]["min"], stats["min"], change))
+
+    for name, before, after, change in regressions:
+        print(f"REGRESSION {name}: {before:.1f} ms -> {after:.1f} ms (+{change:.0%})", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,368 @@
+"""
+End-to-end and per-stage benchmarks of podmanager-cli against a local mock server.
+
+A MockServer (see benchmarks/mock_server.py) is started with the requested node count,
+payload padding and latency, and a throwaway login is created in a temporary working
+directory. Then:
+
+- infra list runs once per output format, plus once with a filter and sort, each in a
+  fresh interpreter with --trace-file, so both the wall time and the per-phase spans
+  (config.load, fetch, filter, sort, render and every HTTP request) are recorded.
+- apply_filters, apply_sorting, every format of format_decorator and the whole
+  filter/sort/render chain of general_decorator are timed in-process on the same
+  generated data.
+- The node list and FRU responses are parsed with json.loads and incrementally with
+  cli.jsonstream, keeping only the listed columns, and the peak memory of each is recorded.
+- provision osimg-upload uploads a generated file, streamed and chunked, and reports
+  throughput.
+
+Results are saved per commit and can be compared against an earlier run:
+
+    python benchmarks/suite.py --nodes 5000 --latency 0.02
+    python benchmarks/suite.py --baseline benchmarks/results/<commit>.json --max-regression 0.25
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT_DIR / "benchmarks" / "results"
+sys.path.insert(0, str(ROOT_DIR))
+sys.path.insert(0, str(ROOT_DIR / "benchmarks"))
+
+from mock_server import MockServer, firmware_for, fru_for, generate_nodes  # noqa: E402
+
+FORMATS = ("raw", "json", "ndjson", "csv", "column", "table")
+COLUMNS = "Host Name,BMC MAC,Fru.0.Product.ProductName,Power.Status,Status,BMC IPv4,Firmware.BMCImage1,Firmware.BIOS1"
+FILTERS = {
+    "equality": ["Status=Warning"],
+    "compound": ["Status=Warning and (Power.Status=Off or Firmware.BMCImage1>=13.06.10)"],
+    "cidr": ["BMC IPv4 in [100.74.0.0/24, 100.74.3.0/24]"],
+}
+SORT_KEYS = {
+    "ip": ("BMC IPv4:desc", None),
+    "version-top20": ("Firmware.BMCImage1:desc,Host Name", 20),
+    "multi": ("Status,Power.Status,BMC IPv4", None),
+}
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def stats_of(samples: list) -> dict:
+    return {"min": min(samples), "median": statistics.median(samples), "max": max(samples)}
+
+
+def time_call(func, repeat: int) -> dict:
+    """Call func repeat times and return timing statistics in ms."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return stats_of(samples)
+
+
+def cli_env(workdir: str) -> dict:
+    """Return the environment for CLI runs, with workdir as home so the login and caches stay in it."""
+    return dict(os.environ, PYTHONPATH=str(ROOT_DIR), HOME=workdir)
+
+
+def run_cli(argv: list, workdir: str, repeat: int) -> dict:
+    """
+    Run the CLI repeat times in fresh interpreters with tracing enabled.
+
+    Returns:
+        dict: Wall time statistics in ms, and under "spans" the median total ms per span name.
+    """
+    env = cli_env(workdir)
+    trace_file = os.path.join(workdir, "trace.json")
+    samples = []
+    spans = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "cli.commands", "--trace-file", trace_file, *argv],
+            cwd=workdir,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        samples.append((time.perf_counter() - start) * 1000)
+
+        with open(trace_file, "r") as file:
+            events = json.load(file)["traceEvents"]
+        totals = {}
+        for event in events:
+            # Ids in request paths differ between runs, e.g. /uploads/3
+            name = re.sub(r"/\d+(?=/|$)", "/{id}", event["name"])
+            totals[name] = totals.get(name, 0.0) + event["dur"] / 1000
+        for name, total in totals.items():
+            spans.setdefault(name, []).append(total)
+
+    result = stats_of(samples)
+    result["spans"] = {name: round(statistics.median(totals), 3) for name, totals in spans.items()}
+    return result
+
+
+def enriched_nodes(count: int, padding: int) -> list:
+    nodes = generate_nodes(count, padding)
+    for node in nodes:
+        node["Firmware"] = firmware_for(node["BMC IPv4"])
+        node["Fru"] = fru_for(node["BMC IPv4"])
+    return nodes
+
+
+def bench_stages(nodes: list, repeat: int) -> dict:
+    """Time the filter, sort and format stages in-process."""
+    from cli.decorator import format_decorator, general_decorator
+    from cli.utils import apply_filters, apply_sorting
+
+    results = {}
+    for name, conditions in FILTERS.items():
+        results[f"apply_filters {name}"] = time_call(lambda: apply_filters(nodes, conditions), repeat)
+    for name, (sort_key, limit) in SORT_KEYS.items():
+        results[f"apply_sorting {name}"] = time_call(lambda: apply_sorting(nodes, sort_key, limit=limit), repeat)
+
+    render = format_decorator()(lambda **kwargs: nodes)
+    for format_type in FORMATS:
+        results[f"format {format_type}"] = time_call(
+            lambda: render(format=format_type, columns=COLUMNS, output=os.devnull), repeat
+        )
+
+    results["format table --max-width"] = time_call(
+        lambda: render(format="table", columns=COLUMNS, max_width=30, output=os.devnull), repeat
+    )
+    # Time to the first screen of --pager, which should not grow with the number of rows
+    from rich.console import Console
+
+    from cli.pager import render_page
+    from cli.table import ColumnTable
+
+    console = Console(file=open(os.devnull, "w"), width=200)
+    results["pager first page"] = time_call(
+        lambda: console.print(render_page(ColumnTable(nodes), COLUMNS.split(","), "bench", 0, 50)), repeat
+    )
+
+    # The whole filter -> sort -> render chain, on the ColumnTable built by filters_decorator
+    pipeline = general_decorator(lambda **kwargs: nodes)
+    for format_type in ("csv", "ndjson"):
+        results[f"pipeline {format_type} filter+sort"] = time_call(
+            lambda: pipeline(
+                format=format_type,
+                columns=COLUMNS,
+                filter=FILTERS["compound"],
+                sort_key=SORT_KEYS["multi"][0],
+                sort_order="asc",
+                output=os.devnull,
+            ),
+            repeat,
+        )
+
+    # Group and aggregate the filtered rows in one pass, instead of exporting every row
+    from cli.aggregate import aggregate, parse_aggregates
+
+    aggregates = parse_aggregates("count,min(BMC IPv4),max(Firmware.BMCImage1),distinct(Status)")
+    results["aggregate group-by"] = time_call(
+        lambda: aggregate(ColumnTable(nodes), ["Firmware.BIOS1", "Power.Status"], aggregates), repeat
+    )
+    return results
+
+
+def measure_peak(func) -> int:
+    """Run func once and return the peak memory it allocated, in KiB."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] // 1024
+    finally:
+        tracemalloc.stop()
+
+
+def bench_parsing(count: int, padding: int, repeat: int) -> dict:
+    """Compare json.loads with incremental parsing and projection of the node list and FRU responses."""
+    from cli.jsonstream import CHUNK_SIZE, build_projection, iter_array, iter_object, project
+    from cli.query import split_path
+
+    nodes = generate_nodes(count, padding)
+    bodies = {
+        "node list": (json.dumps(nodes).encode(), iter_array),
+        "fru": (json.dumps({node["BMC IPv4"]: fru_for(node["BMC IPv4"]) for node in nodes}).encode(), iter_object),
+    }
+    paths = {split_path(column) for column in COLUMNS.split(",")}
+    trees = {
+        "node list": build_projection({path for path in paths if path[0] not in ("Firmware", "Fru")}),
+        "fru": build_projection({path[1:] for path in paths if path[0] == "Fru"}),
+    }
+
+    results = {}
+    for name, (body, iterate) in bodies.items():
+        tree = trees[name]
+
+        def chunks():
+            return (body[i : i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
+
+        def streamed():
+            if iterate is iter_object:
+                return {key: project(value, tree) for key, value in iterate(chunks())}
+            return [project(item, tree) for item in iterate(chunks())]
+
+        def loaded():
+            data = json.loads(b"".join(chunks()))
+            if isinstance(data, dict):
+                return {key: project(value, tree) for key, value in data.items()}
+            return [project(item, tree) for item in data]
+
+        for method, func in (("json.loads", loaded), ("jsonstream", streamed)):
+            result = time_call(func, repeat)
+            result["peak_kib"] = measure_peak(func)
+            results[f"parse {name} {method}"] = result
+    return results
+
+
+def bench_cli(workdir: str, repeat: int, upload_size: int, chunk_size: str) -> dict:
+    """Time infra list per format and osimg-upload throughput end to end."""
+    results = {}
+    for format_type in FORMATS:
+        results[f"infra list --format {format_type}"] = run_cli(
+            ["infra", "list", "--no-cache", "--format", format_type], workdir, repeat
+        )
+    results["infra list --filter --sort-key"] = run_cli(
+        [
+            "infra",
+            "list",
+            "--no-cache",
+            "--format",
+            "csv",
+            "--filter",
+            FILTERS["compound"][0],
+            "--sort-key",
+            SORT_KEYS["multi"][0],
+        ],
+        workdir,
+        repeat,
+    )
+
+    image = os.path.join(workdir, "image.iso")
+    with open(image, "wb") as file:
+        block = os.urandom(1024 * 1024)
+        for _ in range(upload_size):
+            file.write(block)
+
+    upload = ["provision", "osimg-upload", "--osimage", image, "--title", "bench", "--name", "bench"]
+    # Every repeat uploads the same file, which must not be skipped as a duplicate
+    upload += ["--architecture", "amd64", "--format", "json", "--on-duplicate", "upload"]
+    for name, extra in (("stream", []), ("chunked", ["--chunk-size", chunk_size, "--no-resume"])):
+        result = run_cli(upload + extra, workdir, repeat)
+        result["mb_s"] = round(upload_size / (result["min"] / 1000), 1)
+        results[f"osimg-upload {name}"] = result
+    return results
+
+
+def compare(results: dict, baseline: dict, max_regression: float) -> list:
+    regressions = []
+    for name, stats in results.items():
+        if name not in baseline:
+            continue
+        # The fastest run is the least affected by other load on the machine
+        change = stats["min"] / baseline[name]["min"] - 1
+        if change > max_regression:
+            regressions.append((name, baseline[name]["min"], stats["min"], change))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=2000, help="Number of nodes served by the mock (default 2000).")
+    parser.add_argument("--padding", type=int, default=0, help="Extra bytes per node in the node list (default 0).")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the mock waits before each response.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs per benchmark (default 3).")
+    parser.add_argument("--upload-size", type=int, default=64, help="Size of the uploaded image in MiB (default 64).")
+    parser.add_argument("--chunk-size", default="8M", help="Chunk size for the chunked upload (default 8M).")
+    parser.add_argument("--skip-cli", action="store_true", help="Only run the in-process stage benchmarks.")
+    parser.add_argument(
+        "--save",
+        help="Write the results as JSON to this file. Defaults to benchmarks/results/<commit>.json.",
+    )
+    parser.add_argument("--baseline", help="Compare the results with a file written by an earlier run.")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.25,
+        help="Fail when a best-of-repeat time is this fraction slower than the baseline (default 0.25).",
+    )
+    args = parser.parse_args()
+
+    results = bench_stages(enriched_nodes(args.nodes, args.padding), args.repeat)
+    results.update(bench_parsing(args.nodes, args.padding, args.repeat))
+
+    if not args.skip_cli:
+        with tempfile.TemporaryDirectory() as workdir, MockServer(
+            nodes=args.nodes, padding=args.padding, latency=args.latency
+        ) as server:
+            subprocess.run(
+                [sys.executable, "-m", "cli.commands", "login", "--url", server.url]
+                + ["--account", "admin", "--password", "admin"],
+                cwd=workdir,
+                env=cli_env(workdir),
+                stdout=subprocess.DEVNULL,
+                check=True,
+            )
+            results.update(bench_cli(workdir, args.repeat, args.upload_size, args.chunk_size))
+
+    for name, stats in results.items():
+        line = f"{name:45} min {stats['min']:9.1f} ms   median {stats['median']:9.1f} ms"
+        if "mb_s" in stats:
+            line += f"   {stats['mb_s']:8.1f} MiB/s"
+        if "peak_kib" in stats:
+            line += f"   peak {stats['peak_kib']:8d} KiB"
+        print(line)
+        for span, total in stats.get("spans", {}).items():
+            print(f"    {span:41} {total:9.1f} ms")
+
+    commit = current_commit()
+    save = args.save or RESULTS_DIR / f"{commit}.json"
+    Path(save).parent.mkdir(parents=True, exist_ok=True)
+    with open(save, "w") as file:
+        json.dump(
+            {
+                "commit": commit,
+                "python": sys.version,
+                "params": {key: value for key, value in vars(args).items() if key not in ("save", "baseline")},
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+    print(f"Saved results to {save}")
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline, "r") as file:
+        baseline = json.load(file)["results"]
+
+    regressions = compare(results, baseline, args.max_regression)
+    for name, before, after, change in regressions:
+        print(f"REGRESSION {name}: {before:.1f} ms -> {after:.1f} ms (+{change:.0%})", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
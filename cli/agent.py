@@ -0,0 +1,418 @@
+import base64
+import json
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+
+import click
+
+from cli.utils import CONFIG_FILE
+
+AGENT_SOCKET = CONFIG_FILE.parent / "agent.sock"
+AGENT_PID_FILE = CONFIG_FILE.parent / "agent.pid"
+AGENT_LOG_FILE = CONFIG_FILE.parent / "agent.log"
+START_TIMEOUT = 5.0
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Response headers describing the upstream transfer, which no longer apply to the
+# decoded body the agent forwards
+HOP_HEADERS = ("content-encoding", "transfer-encoding", "connection", "keep-alive")
+
+_FRAME_HEADER = struct.Struct("!I")
+
+
+def write_frame(file, data: bytes) -> None:
+    """Write one length-prefixed frame. An empty frame ends a body."""
+    file.write(_FRAME_HEADER.pack(len(data)))
+    file.write(data)
+
+
+def read_frame(file) -> bytes:
+    """
+    Read one length-prefixed frame.
+
+    Raises:
+        EOFError: If the connection closes in the middle of a frame.
+    """
+    header = file.read(_FRAME_HEADER.size)
+    if len(header) < _FRAME_HEADER.size:
+        raise EOFError("Agent connection closed")
+    (length,) = _FRAME_HEADER.unpack(header)
+    data = file.read(length)
+    if len(data) < length:
+        raise EOFError("Agent connection closed")
+    return data
+
+
+class _FrameReader:
+    """
+    File-like response body read from the body frames of an agent connection.
+
+    Used as response.raw, so response.content and response.iter_content() read the
+    body as the agent forwards it, without waiting for the whole of it.
+    """
+
+    def __init__(self, sock, file):
+        self._sock = sock
+        self._file = file
+        self._buffer = b""
+        self._done = False
+
+    def read(self, amt=None, **kwargs) -> bytes:
+        while not self._done and (amt is None or len(self._buffer) < amt):
+            frame = read_frame(self._file)
+            if not frame:
+                self._done = True
+                self.close()
+                break
+            self._buffer += frame
+        if amt is None:
+            data, self._buffer = self._buffer, b""
+        else:
+            data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def stream(self, amt=None, decode_content=None):
+        """Yield the body in pieces of up to amt bytes, like urllib3's HTTPResponse.stream()."""
+        while True:
+            data = self.read(amt or STREAM_CHUNK_SIZE)
+            if not data:
+                return
+            yield data
+
+    def close(self) -> None:
+        self._file.close()
+        self._sock.close()
+
+    def release_conn(self) -> None:
+        self.close()
+
+
+class AgentClient:
+    """
+    Sends requests through a running agent (see the agent command) over its Unix socket.
+
+    request() returns None whenever the agent cannot be used, so the caller falls back to
+    its own session: no agent is running, the platform has no Unix sockets, the request
+    carries a file or stream body, or the client is disabled with --no-agent.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.enabled = True
+        self.requests = 0
+        # Set once connecting failed, so a process stops trying after a stale socket
+        self._unavailable = False
+
+    def available(self) -> bool:
+        return self.enabled and not self._unavailable and hasattr(socket, "AF_UNIX") and os.path.exists(self.path)
+
+    def connect(self):
+        """Connect to the agent, or return None if it is not running."""
+        if not self.available():
+            return None
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(self.path))
+        except OSError:
+            sock.close()
+            self._unavailable = True
+            return None
+        return sock
+
+    def call(self, message: dict):
+        """
+        Send a control message, e.g. {"ping": True}, and return the agent's answer.
+
+        Returns:
+            dict: The answer, or None if the agent is not running.
+        """
+        sock = self.connect()
+        if sock is None:
+            return None
+        with sock, sock.makefile("rwb") as file:
+            write_frame(file, json.dumps(message).encode())
+            file.flush()
+            return json.loads(read_frame(file))
+
+    def request(self, method: str, url: str, headers: dict = None, stream: bool = False, **kwargs):
+        """
+        Send a request through the agent.
+
+        Args:
+            method (str): HTTP method.
+            url (str): Full URL.
+            headers (dict): Request headers.
+            stream (bool): Do not read the body up front, as for requests.
+            **kwargs: json, params, data and timeout as for requests. Requests with any
+                other argument are not sent through the agent.
+
+        Returns:
+            Response: The response, or None if the request has to be sent directly.
+
+        Raises:
+            requests.exceptions.RequestException: If the agent could not reach the server.
+        """
+        import requests
+
+        if not self.available() or set(kwargs) - {"json", "params", "data", "timeout"}:
+            return None
+        timeout = kwargs.pop("timeout", None)
+        prepared = requests.Request(method.upper(), url, headers=headers, **kwargs).prepare()
+        body = prepared.body
+        if isinstance(body, str):
+            body = body.encode()
+        if body is not None and not isinstance(body, bytes):
+            return None
+
+        sock = self.connect()
+        if sock is None:
+            return None
+
+        file = sock.makefile("rwb")
+        try:
+            message = {
+                "method": prepared.method,
+                "url": prepared.url,
+                "headers": dict(prepared.headers),
+                "body": base64.b64encode(body).decode() if body is not None else None,
+                "timeout": timeout,
+            }
+            write_frame(file, json.dumps(message).encode())
+            file.flush()
+            answer = json.loads(read_frame(file))
+        except (OSError, EOFError, ValueError) as e:
+            file.close()
+            sock.close()
+            raise requests.exceptions.ConnectionError(f"Agent connection failed: {e}")
+
+        if "error" in answer:
+            file.close()
+            sock.close()
+            error_type = getattr(requests.exceptions, answer.get("error_type", ""), None)
+            if not (isinstance(error_type, type) and issubclass(error_type, requests.exceptions.RequestException)):
+                error_type = requests.exceptions.ConnectionError
+            raise error_type(answer["error"])
+
+        from requests.structures import CaseInsensitiveDict
+        from requests.utils import get_encoding_from_headers
+
+        response = requests.Response()
+        response.status_code = answer["status"]
+        response.reason = answer["reason"]
+        response.headers = CaseInsensitiveDict(answer["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = answer["url"]
+        response.request = prepared
+        response.raw = _FrameReader(sock, file)
+        response.via_agent = True
+        self.requests += 1
+        if not stream:
+            # Read the body now, like requests does without stream=True
+            response.content
+        return response
+
+
+agent_client = AgentClient(AGENT_SOCKET)
+
+
+class _AgentServer:
+    """Accepts connections on the agent socket and serves each in its own thread."""
+
+    def __init__(self, path):
+        self.path = path
+        self.started = time.time()
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._sock = None
+
+    def serve_forever(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.unlink(missing_ok=True)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Only the current user may talk to the agent, which sends requests with their token
+        umask = os.umask(0o177)
+        try:
+            self._sock.bind(str(self.path))
+        finally:
+            os.umask(umask)
+        self._sock.listen(64)
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                # The socket was closed by shutdown()
+                return
+            threading.Thread(target=self.handle, args=(conn,), daemon=True).start()
+
+    def shutdown(self) -> None:
+        if self._sock is not None:
+            self._sock.close()
+        self.path.unlink(missing_ok=True)
+
+    def handle(self, conn) -> None:
+        with conn, conn.makefile("rwb") as file:
+            try:
+                message = json.loads(read_frame(file))
+                if message.get("ping"):
+                    write_frame(file, json.dumps(self.status()).encode())
+                else:
+                    self.forward(message, file)
+                file.flush()
+            except (OSError, EOFError, ValueError):
+                # The client went away
+                pass
+
+    def status(self) -> dict:
+        from cli.session import session_stats
+
+        return {"pid": os.getpid(), "uptime": time.time() - self.started, "requests": self.requests, **session_stats()}
+
+    def forward(self, message: dict, file) -> None:
+        import requests
+
+        from cli.session import get_session
+
+        with self._lock:
+            self.requests += 1
+        body = base64.b64decode(message["body"]) if message.get("body") is not None else None
+        timeout = message.get("timeout")
+        if isinstance(timeout, list):
+            # A (connect, read) timeout arrives as a JSON list
+            timeout = tuple(timeout)
+        try:
+            response = get_session().request(
+                message["method"],
+                message["url"],
+                headers=message["headers"],
+                data=body,
+                timeout=timeout,
+                stream=True,
+            )
+        except requests.exceptions.RequestException as e:
+            answer = {"error": str(e), "error_type": type(e).__name__}
+            write_frame(file, json.dumps(answer).encode())
+            return
+
+        with response:
+            headers = {key: value for key, value in response.headers.items() if key.lower() not in HOP_HEADERS}
+            if "content-encoding" in response.headers:
+                # The body is forwarded decoded, so the upstream length does not apply
+                headers.pop("Content-Length", None)
+            answer = {"status": response.status_code, "reason": response.reason, "headers": headers, "url": response.url}
+            write_frame(file, json.dumps(answer).encode())
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                write_frame(file, chunk)
+            write_frame(file, b"")
+
+
+def _read_pid():
+    try:
+        return int(AGENT_PID_FILE.read_text().strip())
+    except (OSError, ValueError):
+        return None
+
+
+@click.group()
+def agent():
+    """Background agent that keeps connections to the server warm between commands."""
+    pass
+
+
+@agent.command()
+def run():
+    """Run the agent in the foreground until interrupted."""
+    import signal
+
+    if not hasattr(socket, "AF_UNIX"):
+        raise click.ClickException("The agent needs Unix domain sockets, which this platform does not support.")
+    if agent_client.call({"ping": True}) is not None:
+        raise click.ClickException(f"An agent is already running on {AGENT_SOCKET}.")
+
+    server = _AgentServer(AGENT_SOCKET)
+    signal.signal(signal.SIGTERM, lambda signum, frame: server.shutdown())
+    AGENT_PID_FILE.parent.mkdir(parents=True, exist_ok=True)
+    AGENT_PID_FILE.write_text(str(os.getpid()))
+    click.secho(f"Agent listening on {AGENT_SOCKET} (pid {os.getpid()}).", fg="green", err=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        if _read_pid() == os.getpid():
+            AGENT_PID_FILE.unlink(missing_ok=True)
+
+
+@agent.command()
+@click.pass_context
+def start(ctx):
+    """Start the agent in the background."""
+    import subprocess
+
+    if agent_client.call({"ping": True}) is not None:
+        click.secho(f"Agent already running (pid {_read_pid()}).", fg="yellow")
+        return
+
+    # Pass on the global session options, e.g. --pool-size, to the agent
+    root = ctx.find_root()
+    args = []
+    for name in ("timeout", "retries", "pool_size"):
+        value = root.params.get(name)
+        if value is not None:
+            args += [f"--{name.replace('_', '-')}", str(value)]
+
+    AGENT_LOG_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(AGENT_LOG_FILE, "ab") as log:
+        process = subprocess.Popen(
+            [sys.executable, "-m", "cli.commands", *args, "agent", "run"],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=log,
+            start_new_session=True,
+        )
+
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        agent_client._unavailable = False
+        if agent_client.call({"ping": True}) is not None:
+            click.secho(f"Agent started (pid {process.pid}), listening on {AGENT_SOCKET}.", fg="green")
+            return
+        if process.poll() is not None:
+            break
+        time.sleep(0.05)
+    raise click.ClickException(f"The agent did not start, see {AGENT_LOG_FILE}.")
+
+
+@agent.command()
+def stop():
+    """Stop the background agent."""
+    import signal
+
+    pid = _read_pid()
+    if pid is None or agent_client.call({"ping": True}) is None:
+        click.secho("Agent is not running.", fg="yellow")
+        return
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        pass
+
+    deadline = time.monotonic() + START_TIMEOUT
+    while AGENT_SOCKET.exists() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    click.secho("Agent stopped.", fg="green")
+
+
+@agent.command()
+def status():
+    """Show whether the agent is running and how it reuses connections."""
+    info = agent_client.call({"ping": True})
+    if info is None:
+        click.secho("Agent is not running.", fg="yellow")
+        return
+    click.echo(f"Agent running (pid {info['pid']}) for {info['uptime']:.0f}s on {AGENT_SOCKET}.")
+    click.echo(f"{info['requests']} requests forwarded, {info['connections']} connections opened, {info['reused']} reused.")
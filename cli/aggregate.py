@@ -0,0 +1,229 @@
+import json
+import re
+
+from cli.query import MISSING, comparison_keys, split_path
+from cli.table import ColumnTable
+
+# Functions of --agg; count takes an optional key, all others need one
+AGGREGATE_FUNCTIONS = ("count", "distinct", "sum", "avg", "min", "max")
+_AGGREGATE = re.compile(r"^(?P<function>\w+)\s*(?:\((?P<key>[^()]*)\))?(?:\s+as\s+(?P<name>.+))?$", re.IGNORECASE)
+
+
+class Aggregate:
+    """
+    One component of an --agg specification, e.g. "max(size)" or "count as nodes".
+
+    The result of the aggregate is stored under name, which defaults to its expression.
+    """
+
+    __slots__ = ("function", "key", "path", "name")
+
+    def __init__(self, function: str, key: str = None, name: str = None):
+        self.function = function
+        self.key = key
+        self.path = split_path(key) if key else None
+        self.name = name or (f"{function}({key})" if key else function)
+
+    def __repr__(self):
+        return f"Aggregate({self.name!r})"
+
+
+def _split_top_level(spec: str) -> list:
+    # Commas inside parentheses belong to a key, e.g. "max(Fru.0.Product.ProductName)"
+    parts, depth, start = [], 0, 0
+    for index, char in enumerate(spec):
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        elif char == "," and depth == 0:
+            parts.append(spec[start:index])
+            start = index + 1
+    parts.append(spec[start:])
+    return parts
+
+
+def parse_aggregates(spec: str) -> list:
+    """
+    Parse an aggregation specification such as "count,min(size),max(Firmware.BIOS1) as bios".
+
+    Every comma-separated aggregate is one of AGGREGATE_FUNCTIONS applied to a dotted key,
+    optionally followed by "as" and the column name of the result. count without a key
+    counts rows, with a key the rows where it has a value; distinct counts different values.
+
+    Args:
+        spec (str): The aggregation specification.
+
+    Returns:
+        list: The parsed Aggregate objects.
+
+    Raises:
+        ValueError: If an aggregate does not parse or names an unknown function.
+    """
+    aggregates = []
+    for part in _split_top_level(spec):
+        part = part.strip()
+        if not part:
+            continue
+        match = _AGGREGATE.match(part)
+        if not match:
+            raise ValueError(f"Invalid aggregate: '{part}'")
+        function = match["function"].lower()
+        key = match["key"].strip() if match["key"] else None
+        if function not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f"Unknown aggregate function '{function}', use one of {', '.join(AGGREGATE_FUNCTIONS)}")
+        if key is None and function != "count":
+            raise ValueError(f"Aggregate '{part}' needs a key, e.g. {function}(size)")
+        name = match["name"].strip() if match["name"] else None
+        aggregates.append(Aggregate(function, key, name))
+
+    if not aggregates:
+        raise ValueError(f"Invalid aggregation: '{spec}'")
+    return aggregates
+
+
+def output_columns(group_by: list, aggregates: list) -> list:
+    """Return the dotted columns of aggregated rows: the group keys, then the aggregate names."""
+    return [*group_by, *(aggregate.name for aggregate in aggregates)]
+
+
+def source_columns(group_by: list, aggregates: list) -> list:
+    """Return the dotted columns of the input rows that the aggregation reads."""
+    columns = [*group_by, *(aggregate.key for aggregate in aggregates if aggregate.key)]
+    return [*dict.fromkeys(columns)]
+
+
+def _set_path(row: dict, path: tuple, value) -> None:
+    *parents, last = path
+    for key in parents:
+        row = row.setdefault(key, {})
+    row[last] = value
+
+
+def _group_key(value):
+    if value is MISSING:
+        return None
+    try:
+        hash(value)
+    except TypeError:
+        # Lists and dicts group by their content
+        return json.dumps(value, sort_keys=True, default=str)
+    return value
+
+
+def _numbers(values: list) -> list:
+    numbers = []
+    for value in values:
+        try:
+            numbers.append(None if value is None or value is MISSING or isinstance(value, bool) else float(value))
+        except (ValueError, TypeError, OverflowError):
+            # Values that are not numbers are left out, like missing ones
+            numbers.append(None)
+    return numbers
+
+
+def _number(value: float):
+    return int(value) if value.is_integer() else value
+
+
+def aggregate(table, group_by: list, aggregates: list) -> list:
+    """
+    Group the rows of a table by the values of some keys and aggregate every group.
+
+    The rows are hashed into their group in one pass, which gives every row the index of
+    its group. Every aggregate then folds its column into per-group results in one tight
+    loop over the group indices. Inputs of sum and avg are read as numbers; min and max
+    order values like --sort-key does, so versions, IP addresses and timestamps compare
+    by their type. Missing values are left out of every aggregate but count.
+
+    Args:
+        table (ColumnTable): The rows, e.g. after the filter stage. A list is wrapped.
+        group_by (list): Dotted keys to group by. Without any, all rows form one group.
+        aggregates (list): Aggregate objects, see parse_aggregates.
+
+    Returns:
+        list: One row per group in the order the groups first appear, with every group
+            key and aggregate stored at its dotted path, so the sort and format stages
+            handle them like any other column.
+    """
+    if not isinstance(table, ColumnTable):
+        table = ColumnTable(table)
+    rows = table.rows
+
+    group_columns = [table.column(split_path(key)) for key in group_by]
+    if group_columns:
+        groups, group_values, group_ids = {}, [], []
+        for row in rows:
+            key = tuple(column[row] for column in group_columns)
+            try:
+                index = groups.get(key)
+            except TypeError:
+                key = tuple(_group_key(value) for value in key)
+                index = groups.get(key)
+            if index is None:
+                index = groups[key] = len(group_values)
+                group_values.append([column[row] for column in group_columns])
+            group_ids.append(index)
+    else:
+        # Like SQL, aggregating without groups gives one row, even for no rows
+        group_values, group_ids = [[]], [0] * len(rows)
+
+    results = [_fold(agg, table, rows, group_ids, len(group_values)) for agg in aggregates]
+
+    output = []
+    for index, values in enumerate(group_values):
+        out = {}
+        for key, value in zip(group_by, values):
+            _set_path(out, split_path(key), None if value is MISSING else value)
+        for agg, result in zip(aggregates, results):
+            _set_path(out, split_path(agg.name), result[index])
+        output.append(out)
+    return output
+
+
+def _fold(agg: Aggregate, table, rows, group_ids: list, count: int) -> list:
+    """Compute one aggregate for every group, given the group index of every row."""
+    function = agg.function
+    if agg.path is None:
+        counts = [0] * count
+        for index in group_ids:
+            counts[index] += 1
+        return counts
+
+    column = table.column(agg.path)
+    values = [column[row] for row in rows]
+
+    if function == "count":
+        counts = [0] * count
+        for index, value in zip(group_ids, values):
+            if value is not None and value is not MISSING:
+                counts[index] += 1
+        return counts
+
+    if function == "distinct":
+        seen = [set() for _ in range(count)]
+        for index, value in zip(group_ids, values):
+            if value is not None and value is not MISSING:
+                seen[index].add(_group_key(value))
+        return [len(values) for values in seen]
+
+    if function in ("sum", "avg"):
+        totals, counts = [0.0] * count, [0] * count
+        for index, value in zip(group_ids, _numbers(values)):
+            if value is not None:
+                totals[index] += value
+                counts[index] += 1
+        if function == "sum":
+            return [_number(total) if n else None for total, n in zip(totals, counts)]
+        return [total / n if n else None for total, n in zip(totals, counts)]
+
+    # min and max compare the typed keys, but report the original values
+    best = [None] * count
+    minimum = function == "min"
+    for index, key, value in zip(group_ids, comparison_keys(values), values):
+        if key is None:
+            continue
+        current = best[index]
+        if current is None or (key < current[0] if minimum else current[0] < key):
+            best[index] = (key, value)
+    return [None if current is None else current[1] for current in best]
@@ -0,0 +1,210 @@
+import contextvars
+import io
+import shlex
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+
+import click
+
+from cli.decorator import add_common_options, general_decorator
+from cli.utils import apply_filters, api_request, request_log
+
+OSIMG_ENDPOINT = "/api/v1/provision/osimg"
+NESTED_COMMANDS = ("agent", "batch", "shell")
+
+
+class ThreadLocalStream:
+    """
+    Text stream that writes to a per-thread buffer while one is set, and to the wrapped stream otherwise.
+
+    Installed as sys.stdout/sys.stderr while operations run concurrently, so the output of
+    each operation ends up in its own result instead of being interleaved on the terminal.
+    """
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(getattr(self._local, "buffer", None) or self._stream, name)
+
+    @contextmanager
+    def capture(self):
+        """Redirect writes from the current thread into a buffer, which is yielded."""
+        buffer = io.StringIO()
+        self._local.buffer = buffer
+        try:
+            yield buffer
+        finally:
+            self._local.buffer = None
+
+
+def read_operations(file) -> list:
+    """
+    Parse command lines from a file, skipping blank lines and # comments.
+
+    Returns:
+        list: (line, args) pairs. args is None for a line that cannot be parsed.
+    """
+    operations = []
+    for line in file:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            args = shlex.split(line)
+        except ValueError:
+            args = None
+        if args and args[0] == "podmanager-cli":
+            args = args[1:]
+        operations.append((line, args or None))
+    return operations
+
+
+def select_images(filter_conditions) -> list:
+    """Return the os images matching the filter expressions."""
+    import requests
+
+    # A cached list may still name images deleted since, whose ids can belong to another image by now
+    images_res = api_request(method="get", endpoint=OSIMG_ENDPOINT, use_cache=False)
+    try:
+        images_res.raise_for_status()
+    except requests.exceptions.HTTPError as http_err:
+        raise click.ClickException(f"Error fetching os image: {http_err}")
+    return apply_filters(images_res.json(), filter_conditions)
+
+
+def run_operation(args: list, stdout: ThreadLocalStream, stderr: ThreadLocalStream) -> dict:
+    """
+    Run one CLI command in this process and describe how it went.
+
+    The operation fails when the command raises, exits, or any of its API requests
+    ends with an HTTP error status.
+
+    Returns:
+        dict: The result with status, duration, number of requests, error and output.
+    """
+    from cli.commands import cli
+
+    if args[0].startswith("-"):
+        return {
+            "status": "failed",
+            "error": "Global options are not supported per operation, pass them before 'batch'.",
+        }
+    if args[0] in NESTED_COMMANDS:
+        return {"status": "failed", "error": f"'{args[0]}' cannot run inside a batch."}
+
+    log = []
+    request_log.set(log)
+    error = None
+    start = time.perf_counter()
+    with stdout.capture() as out, stderr.capture() as err:
+        try:
+            cli.main(args, prog_name="podmanager-cli", standalone_mode=False)
+        except click.ClickException as e:
+            error = e.format_message()
+        except click.exceptions.Abort:
+            error = "Aborted."
+        except SystemExit as e:
+            error = f"Exited with status {e.code or 0}."
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    duration = time.perf_counter() - start
+
+    http_errors = [f"{method} {path} -> {status}" for method, path, status in log if status >= 400]
+    if error is None and http_errors:
+        error = "; ".join(http_errors)
+    return {
+        "status": "failed" if error else "ok",
+        "duration_ms": round(duration * 1000, 1),
+        "requests": len(log),
+        "error": error or err.getvalue().strip() or None,
+        "output": out.getvalue().rstrip(),
+    }
+
+
+def print_summary(results: list, elapsed: float) -> None:
+    failed = sum(result["status"] == "failed" for result in results)
+    durations = sorted(result["duration_ms"] for result in results if result.get("duration_ms") is not None)
+    message = f"Batch: {len(results)} operation(s), {len(results) - failed} ok, {failed} failed in {elapsed:.2f}s"
+    if durations:
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        message += (
+            f"; latency median {statistics.median(durations):.1f} ms, p95 {p95:.1f} ms, max {durations[-1]:.1f} ms"
+        )
+    click.secho(message, fg="red" if failed else "green", err=True)
+
+
+@click.command(context_settings={"default_map": {"format": "ndjson"}})
+@add_common_options
+@click.argument("file", type=click.File("r"), required=False)
+@click.option(
+    "--columns",
+    default=None,
+    help="Specify columns to display in table/csv format, separated by commas.",
+)
+@click.option(
+    "--parallel",
+    default=4,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Maximum number of operations running at the same time.",
+)
+@click.option(
+    "--osimg-delete",
+    "delete_filter",
+    multiple=True,
+    help="Delete every os image matching this filter expression, e.g. 'name~^ubuntu/old'. Replaces FILE.",
+)
+@click.option("--dry-run", is_flag=True, help="Only list the operations that would run.")
+@click.option("--yes", "-y", is_flag=True, help="Do not ask for confirmation before deleting os images.")
+@general_decorator
+def batch(file, format, filter, columns, sort_key, sort_order, parallel, delete_filter, dry_run, yes) -> list:
+    """
+    Run many commands in one process with bounded concurrency.
+
+    Commands are read one per line from FILE (default stdin), written as on the command
+    line without the program name, e.g. "provision osimg-delete --id 12". All operations
+    share one session and login; each produces one result row with its status, latency
+    and output, and a summary is printed to stderr.
+    """
+    if delete_filter:
+        images = select_images(delete_filter)
+        operations = []
+        for image in images:
+            args = ["provision", "osimg-delete", "--id", str(image["id"])]
+            operations.append((shlex.join(args), args))
+        if operations and not dry_run and not yes:
+            names = ", ".join(f"{image.get('name')} ({image['id']})" for image in images)
+            click.confirm(f"Delete {len(operations)} os image(s): {names}?", abort=True, err=True)
+    else:
+        operations = read_operations(file or click.get_text_stream("stdin"))
+
+    rows = [{"#": index, "command": line} for index, (line, _) in enumerate(operations)]
+    if dry_run:
+        return rows
+
+    stdout, stderr = ThreadLocalStream(sys.stdout), ThreadLocalStream(sys.stderr)
+    sys.stdout, sys.stderr = stdout, stderr
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=parallel) as executor:
+            futures = {}
+            for row, (_, args) in zip(rows, operations):
+                if args is None:
+                    row.update(status="failed", error="Invalid command line.")
+                    continue
+                # Each operation gets its own context, so its request log and cache options are kept apart
+                future = executor.submit(contextvars.copy_context().run, run_operation, args, stdout, stderr)
+                futures[future] = row
+            for future in as_completed(futures):
+                futures[future].update(future.result())
+    finally:
+        sys.stdout, sys.stderr = stdout._stream, stderr._stream
+
+    print_summary(rows, time.perf_counter() - start)
+    return rows
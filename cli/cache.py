@@ -0,0 +1,307 @@
+import base64
+import contextvars
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlsplit
+
+# Time to live in seconds for cacheable (method, path) pairs. Inventory data that
+# rarely changes is kept longer than the node list, which carries power and status.
+CACHE_TTLS = {
+    ("GET", "/api/v1/infra/common/getNodeList"): 30,
+    ("POST", "/api/v1/infra/getFirmwareVersion"): 6 * 60 * 60,
+    ("POST", "/api/v1/infra/getFru"): 6 * 60 * 60,
+    ("GET", "/api/v1/provision/osimg"): 5 * 60,
+}
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class ResponseCache:
+    """
+    On-disk cache of API responses for the read-only inventory endpoints.
+
+    Entries are keyed by server, method, endpoint and payload, expire after the
+    TTL configured for their endpoint in CACHE_TTLS, and the oldest entries are
+    evicted once the cache grows past max_bytes. Any successful mutating request
+    invalidates the cached entries of the endpoint it touched.
+
+    enabled and refresh, set by --no-cache and --refresh, only apply to the current
+    context, so the operations of a batch, which each run in their own, do not change
+    them for each other.
+    """
+
+    def __init__(self, directory: Path, ttls: dict = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.ttls = CACHE_TTLS if ttls is None else ttls
+        self.max_bytes = max_bytes
+        self._enabled = contextvars.ContextVar("cache_enabled", default=True)
+        self._refresh = contextvars.ContextVar("cache_refresh", default=False)
+        self._lock = threading.Lock()
+        self._memory = {}
+        self._memory_bytes = 0
+
+    @property
+    def enabled(self) -> bool:
+        """Whether responses are read from and written to the cache."""
+        return self._enabled.get()
+
+    @enabled.setter
+    def enabled(self, value: bool) -> None:
+        self._enabled.set(value)
+
+    @property
+    def refresh(self) -> bool:
+        """Whether cached responses are ignored, while fresh ones are still written to the cache."""
+        return self._refresh.get()
+
+    @refresh.setter
+    def refresh(self, value: bool) -> None:
+        self._refresh.set(value)
+
+    def ttl_for(self, method: str, endpoint: str) -> int:
+        """Return the TTL for a request, or None if its responses are not cacheable."""
+        return self.ttls.get((method.upper(), urlsplit(endpoint).path))
+
+    def key_for(self, server: str, method: str, endpoint: str, payload) -> str:
+        """Build the cache key for a request."""
+        raw = json.dumps([server, method.upper(), endpoint, payload], sort_keys=True, default=str)
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    @staticmethod
+    def payload_of(kwargs: dict):
+        """
+        Return the part of the request arguments that identifies its payload.
+
+        Returns:
+            The JSON-serializable payload, or None when the request carries a file or
+            stream body and must not be cached.
+        """
+        if kwargs.get("files") is not None:
+            return None
+        data = kwargs.get("data")
+        if data is not None and not isinstance(data, (str, bytes, dict, list, tuple)):
+            return None
+        if isinstance(data, bytes):
+            data = data.decode(errors="replace")
+        return {"json": kwargs.get("json"), "params": kwargs.get("params"), "data": data}
+
+    def get(self, server: str, method: str, endpoint: str, kwargs: dict):
+        """
+        Look up a cached response for a request.
+
+        Entries read from disk are kept in memory as well, so a long-running process
+        (see the shell command) answers repeated requests without touching the disk.
+
+        Returns:
+            Response: The cached response, or None on a miss, an expired entry or when
+                reads are disabled by --refresh/--no-cache.
+        """
+        if not self.enabled or self.refresh:
+            return None
+        ttl = self.ttl_for(method, endpoint)
+        payload = self.payload_of(kwargs)
+        if ttl is None or payload is None:
+            return None
+
+        key = self.key_for(server, method, endpoint, payload)
+        path = self.directory / f"{key}.json"
+        entry = self._memory.get(key)
+        if entry is None:
+            try:
+                with open(path, "r") as file:
+                    entry = json.load(file)
+            except (OSError, ValueError):
+                return None
+            entry["content"] = base64.b64decode(entry.pop("body"))
+            self._remember(key, entry)
+
+        if entry["created"] + ttl < time.time():
+            with self._lock:
+                self._forget(key)
+            path.unlink(missing_ok=True)
+            return None
+
+        import requests
+        from requests.structures import CaseInsensitiveDict
+
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry.get("reason", "")
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.url = f"{server}{endpoint}"
+        response._content = entry["content"]
+        response._content_consumed = True
+        response.from_cache = True
+        return response
+
+    def set(self, server: str, method: str, endpoint: str, kwargs: dict, response, content: bytes = None) -> None:
+        """
+        Store a successful response to a cacheable request.
+
+        Args:
+            content (bytes): Body of the response when it was streamed and response.content
+                is no longer available. Defaults to response.content.
+        """
+        if not self.enabled or not response.ok:
+            return
+        if content is None:
+            content = response.content
+        payload = self.payload_of(kwargs)
+        if self.ttl_for(method, endpoint) is None or payload is None:
+            return
+
+        entry = {
+            "server": server,
+            "method": method.upper(),
+            "path": urlsplit(endpoint).path,
+            "created": time.time(),
+            "status": response.status_code,
+            "reason": response.reason,
+            "headers": dict(response.headers),
+            "body": base64.b64encode(content).decode(),
+        }
+        self.directory.mkdir(parents=True, exist_ok=True)
+        key = self.key_for(server, method, endpoint, payload)
+        path = self.directory / f"{key}.json"
+        with self._lock:
+            with open(path, "w") as file:
+                json.dump(entry, file)
+            self._evict()
+        entry["content"] = content
+        del entry["body"]
+        self._remember(key, entry)
+
+    def invalidate(self, server: str, endpoint: str) -> None:
+        """Drop cached entries for the endpoint touched by a mutating request and its parents/children."""
+        path = urlsplit(endpoint).path.rstrip("/")
+
+        def related(entry):
+            entry_path = entry.get("path", "").rstrip("/")
+            return entry.get("server") == server and (
+                entry_path == path or path.startswith(entry_path + "/") or entry_path.startswith(path + "/")
+            )
+
+        with self._lock:
+            for key, entry in list(self._memory.items()):
+                if related(entry):
+                    self._forget(key)
+            for entry_file, entry in self._entries():
+                if related(entry):
+                    entry_file.unlink(missing_ok=True)
+
+    def clear(self, server: str = None) -> None:
+        """
+        Remove cached entries.
+
+        Args:
+            server (str): Only remove the entries of this server. Defaults to all of them.
+        """
+        with self._lock:
+            if server is None:
+                self._memory.clear()
+                self._memory_bytes = 0
+                for entry_file in self.directory.glob("*.json"):
+                    entry_file.unlink(missing_ok=True)
+                return
+
+            for key, entry in list(self._memory.items()):
+                if entry.get("server") == server:
+                    self._forget(key)
+            for entry_file, entry in self._entries():
+                if entry.get("server") == server:
+                    entry_file.unlink(missing_ok=True)
+
+    def _remember(self, key: str, entry: dict) -> None:
+        with self._lock:
+            self._forget(key)
+            self._memory[key] = entry
+            self._memory_bytes += len(entry["content"])
+            # Drop the oldest entries once the in-memory copies outgrow the disk limit
+            while self._memory_bytes > self.max_bytes and len(self._memory) > 1:
+                self._forget(next(iter(self._memory)))
+
+    def _forget(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry["content"])
+
+    def _entries(self):
+        for entry_file in self.directory.glob("*.json"):
+            try:
+                with open(entry_file, "r") as file:
+                    yield entry_file, json.load(file)
+            except (OSError, ValueError):
+                continue
+
+    def _evict(self) -> None:
+        files = []
+        for entry_file in self.directory.glob("*.json"):
+            try:
+                stat = entry_file.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry_file))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, entry_file in sorted(files):
+            if total <= self.max_bytes:
+                break
+            entry_file.unlink(missing_ok=True)
+            total -= size
+
+
+class ConditionalCache:
+    """
+    In-memory store of the last response and its validators (ETag, Last-Modified) per URL.
+
+    Polling callers send If-None-Match/If-Modified-Since built from the stored
+    validators and get the stored response back when the server answers 304 Not
+    Modified, so an unchanged resource costs a round trip but no body transfer or
+    JSON decoding.
+    """
+
+    def __init__(self):
+        self._responses = {}
+        self._lock = threading.Lock()
+
+    def headers_for(self, url: str) -> dict:
+        """Return the conditional request headers for a URL, empty if nothing is stored."""
+        with self._lock:
+            response = self._responses.get(url)
+        if response is None:
+            return {}
+        headers = {}
+        if response.headers.get("ETag"):
+            headers["If-None-Match"] = response.headers["ETag"]
+        if response.headers.get("Last-Modified"):
+            headers["If-Modified-Since"] = response.headers["Last-Modified"]
+        return headers
+
+    def resolve(self, url: str, response):
+        """
+        Record a response to a conditional request.
+
+        Returns:
+            Response: The stored response marked with not_modified=True when the server
+                answered 304, otherwise the given response.
+        """
+        if response.status_code == 304:
+            with self._lock:
+                stored = self._responses.get(url)
+            if stored is not None:
+                stored.not_modified = True
+                return stored
+            return response
+
+        response.not_modified = False
+        if response.ok and (response.headers.get("ETag") or response.headers.get("Last-Modified")):
+            with self._lock:
+                self._responses[url] = response
+        return response
+
+    def clear(self) -> None:
+        """Forget every stored response."""
+        with self._lock:
+            self._responses.clear()
@@ -1,30 +1,122 @@
-from importlib.metadata import version
+import sys
 
 import click
-import requests
-from jose import jwt
 
-from .services import infrastructure as infra_commands
-from .services import provision as provision_commands
-from .utils import Config
+from .lazy import LazyGroup
 
+# Service modules and heavy dependencies (requests, rich, pydantic, jose) are imported
+# only when the command that needs them runs, so --help, logout and shell completion
+# start quickly.
 
-@click.group()
-@click.version_option(version=version("podmanager-cli"), message="Gigapod CLI Version %(version)s")
-def cli():
+
+@click.group(
+    cls=LazyGroup,
+    lazy_subcommands={
+        "agent": ("cli.agent:agent", "Background agent that keeps connections to the server warm between commands."),
+        "batch": ("cli.batch:batch", "Run many commands in one process with bounded concurrency."),
+        "infra": ("cli.services.infrastructure:infra", "Infrastructure management commands."),
+        "provision": ("cli.services.provision:provision", "Provision management commands."),
+        "shell": ("cli.shell:shell", "Start an interactive shell that runs commands in one process."),
+    },
+)
+@click.version_option(package_name="podmanager-cli", message="Gigapod CLI Version %(version)s")
+@click.option("--timeout", type=float, default=None, help="Default timeout in seconds for API requests.")
+@click.option("--retries", type=int, default=None, help="Number of retries with backoff for failed API requests.")
+@click.option("--pool-size", type=int, default=None, help="Maximum number of pooled connections per server.")
+@click.option("--no-agent", is_flag=True, help="Send requests directly even when the background agent is running.")
+@click.option(
+    "--no-adaptive",
+    is_flag=True,
+    help="Send every request once, to every endpoint and with the --timeout, without adaptive timeouts, hedged "
+    "requests or circuit breakers.",
+)
+@click.option("--connection-stats", is_flag=True, help="Print connection reuse statistics when the command finishes.")
+@click.option("--profile", is_flag=True, help="Print a per-phase timing and request summary when the command finishes.")
+@click.option(
+    "--trace-file",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Write per-phase timing and request spans as Chrome trace events (JSON) to this file.",
+)
+@click.pass_context
+def cli(ctx, timeout, retries, pool_size, no_agent, no_adaptive, connection_stats, profile, trace_file):
     """Main entry point for the CLI."""
-    pass
+    if no_agent:
+        from .agent import agent_client
+
+        agent_client.enabled = False
+
+    if no_adaptive:
+        from .latency import endpoint_monitor
+
+        endpoint_monitor.enabled = False
+
+    if timeout is not None or retries is not None or pool_size is not None:
+        from .session import configure_session
+
+        configure_session(timeout=timeout, retries=retries, pool_maxsize=pool_size)
+
+    if profile or trace_file:
+        from .profiling import profiler
+
+        profiler.enable()
+    if profile:
+        ctx.call_on_close(profiler.print_summary)
+    if trace_file:
+        ctx.call_on_close(lambda: profiler.write_trace(trace_file))
+
+    if connection_stats:
+        ctx.call_on_close(_print_connection_stats)
+
+
+def _print_connection_stats():
+    from .session import session_stats
+
+    stats = session_stats()
+    agent_client = sys.modules.get("cli.agent") and sys.modules["cli.agent"].agent_client
+    if agent_client and agent_client.requests:
+        click.secho(f"Agent: {agent_client.requests} requests sent through the background agent", fg="cyan", err=True)
+    monitor = sys.modules.get("cli.latency") and sys.modules["cli.latency"].endpoint_monitor
+    if monitor and (monitor.hedged or monitor.rejected):
+        click.secho(
+            f"Latency: {monitor.hedged} requests hedged ({monitor.hedge_wins} won by the hedge), "
+            f"{monitor.rejected} failed fast by open circuit breakers",
+            fg="cyan",
+            err=True,
+        )
+    click.secho(
+        f"Connections: {stats['connections']} opened, {stats['reused']} reused, {stats['requests']} requests",
+        fg="cyan",
+        err=True,
+    )
+    for host, host_stats in stats["hosts"].items():
+        click.secho(
+            f"  {host}: {host_stats['connections']} opened, {host_stats['reused']} reused, "
+            f"{host_stats['requests']} requests",
+            fg="cyan",
+            err=True,
+        )
 
 
 @cli.command()
 @click.option("--url", prompt=True, help="API URL", default="https://gigapod.myelintek.com")
 @click.option("--account", prompt=True, help="Your account", default="admin")
 @click.option("--password", prompt=True, hide_input=True, help="Your password")
-def login(url, account, password):
+@click.option(
+    "--cluster",
+    default=None,
+    help="Save the login under this cluster name, for list commands with --clusters. Defaults to the default login.",
+)
+def login(url, account, password, cluster):
     """Login to the application and save token."""
+    import requests
+    from jose import jwt
+
+    from .session import get_session
+    from .config import Config
 
     try:
-        response = requests.post(f"{url}/api/v1/auth/login", params={"account": account, "password": password})
+        response = get_session().post(f"{url}/api/v1/auth/login", params={"account": account, "password": password})
         try:
             response.raise_for_status()
         except requests.exceptions.HTTPError as http_err:
@@ -40,25 +132,55 @@ def login(url, account, password):
         # Decode the JWT to get the expiration time
         decoded_token = jwt.decode(token, key=None, options={"verify_signature": False})
         expire_at = str(decoded_token.get("exp"))
-        Config.save(target_server=url, access_token=token, expire_at=expire_at)
+        Config.save(target_server=url, access_token=token, expire_at=expire_at, cluster=cluster)
 
-        click.secho("Login successful.", fg="green")
+        click.secho(f"Login to cluster {cluster} successful." if cluster else "Login successful.", fg="green")
     except requests.exceptions.RequestException as e:
         click.secho(f"Login failed: {e}", fg="red")
+    except ValueError as e:
+        click.secho(f"Login failed: {e}", fg="red")
 
 
 @cli.command()
-def logout():
+@click.option("--cluster", default=None, help="Log out of this cluster instead of the default login.")
+def logout(cluster):
     """Logout from the application and clear token."""
+    from .config import Config
+    from .utils import response_cache
+
     try:
-        Config.clear()
-        click.secho("Logout successful.", fg="green")
+        try:
+            config = Config.load(cluster)
+        except ValueError:
+            config = None
+        Config.clear(cluster)
+        # Only the cached responses of the server logged out of, other clusters keep theirs
+        response_cache.clear(config.target_server if config else None)
+        click.secho(f"Logout from cluster {cluster} successful." if cluster else "Logout successful.", fg="green")
     except Exception as e:
         click.secho(f"Logout failed: {e}", fg="red")
 
 
-cli.add_command(infra_commands.infra)
-cli.add_command(provision_commands.provision)
+@cli.command()
+def clusters():
+    """List the clusters with a saved login, for list commands with --clusters."""
+    from datetime import datetime
+
+    from .config import Config
+
+    names = Config.clusters()
+    if not names:
+        click.secho("No cluster logins found. Please login first.", fg="yellow")
+        return
+    for name in names:
+        try:
+            config = Config.load(name)
+        except ValueError as e:
+            click.secho(f"{name}: invalid login: {e}", fg="red")
+            continue
+        expired = config.expire_at and int(config.expire_at) < datetime.now().timestamp()
+        click.echo(f"{name}\t{config.target_server}" + ("\t(token expired)" if expired else ""))
+
 
 if __name__ == "__main__":
     cli()
@@ -0,0 +1,127 @@
+import base64
+import json
+from pathlib import Path
+
+from pydantic import BaseModel, Field
+
+from cli.utils import CLUSTER_NAME_PATTERN, CLUSTERS_DIR, CONFIG_FILE, DEFAULT_CLUSTER, current_cluster
+
+# Config file path to the (mtime, size) of the file and the Config loaded from it, so
+# repeated loads in one process skip decoding and validation until the file changes
+_loaded_configs = {}
+
+
+class Config(BaseModel):
+    """
+    Configuration model for the CLI.
+    This model is used to store the token in a base64 encoded format.
+    """
+
+    target_server: str = Field(..., description="The target server URL")
+    access_token: str = Field(..., description="Base64 encoded token for authentication")
+    expire_at: str = Field(None, description="Token expiration time in ISO format")
+
+    @staticmethod
+    def path(cluster: str = None) -> Path:
+        """
+        Return the config file of a cluster.
+
+        Args:
+            cluster (str): Name of the cluster. None or DEFAULT_CLUSTER is the default login.
+
+        Raises:
+            ValueError: If the name is not a valid cluster name.
+        """
+        if cluster is None or cluster == DEFAULT_CLUSTER:
+            return CONFIG_FILE
+        if not CLUSTER_NAME_PATTERN.fullmatch(cluster):
+            raise ValueError(f"Invalid cluster name: {cluster}. Use letters, digits, '.', '_' and '-'.")
+        return CLUSTERS_DIR / cluster
+
+    @classmethod
+    def clusters(cls) -> list:
+        """
+        Return the names of the clusters with a saved login, the default one first.
+
+        Returns:
+            list: The cluster names.
+        """
+        names = [DEFAULT_CLUSTER] if CONFIG_FILE.exists() else []
+        if CLUSTERS_DIR.is_dir():
+            names += sorted(
+                path.name
+                for path in CLUSTERS_DIR.iterdir()
+                if path.is_file() and CLUSTER_NAME_PATTERN.fullmatch(path.name) and path.name != DEFAULT_CLUSTER
+            )
+        return names
+
+    @classmethod
+    def load(cls, cluster: str = None) -> "Config":
+        """
+        Load the configuration from the config file.
+
+        The decoded configuration is kept in memory and reused until the config file
+        changes, so commands that send many requests decode it only once.
+
+        Args:
+            cluster (str): Name of the cluster to load. Defaults to the cluster of the
+                current context (see run_on_clusters), or the default login.
+
+        Returns:
+            Config: An instance of Config with the loaded token.
+        """
+        path = cls.path(cluster if cluster is not None else current_cluster.get())
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+        loaded = _loaded_configs.get(path)
+        if loaded is not None and loaded[0] == signature:
+            return loaded[1]
+
+        # if not CONFIG_FILE.exists():
+        #     raise FileNotFoundError(f"Configuration file {CONFIG_FILE} does not exist.")
+
+        with open(path, "r") as file:
+            data = file.read()
+
+        decoded_data = json.loads(base64.b64decode(data).decode())
+        if not isinstance(decoded_data, dict):
+            raise ValueError("Invalid configuration format.")
+
+        config = cls(**decoded_data)
+        _loaded_configs[path] = (signature, config)
+        return config
+
+    @classmethod
+    def save(cls, target_server: str, access_token: str, expire_at: str, cluster: str = None) -> None:
+        """
+        Save the configuration to the config file.
+
+        Args:
+            target_server (str): The target server URL.
+            access_token (str): The access token to save.
+            cluster (str): Name of the cluster to save the login for. Defaults to the default login.
+        """
+        path = cls.path(cluster)
+        config = cls(target_server=target_server, access_token=access_token, expire_at=expire_at)
+        _loaded_configs.pop(path, None)
+        encoded_data = base64.b64encode(config.model_dump_json().encode()).decode()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as file:
+            file.write(encoded_data)
+
+    @classmethod
+    def clear(cls, cluster: str = None) -> None:
+        """
+        Clear the configuration by deleting the config file.
+
+        Args:
+            cluster (str): Name of the cluster to clear. Defaults to the default login.
+        """
+        path = cls.path(cluster)
+        _loaded_configs.pop(path, None)
+        if path.exists():
+            path.unlink()
@@ -1,134 +1,494 @@
+import contextlib
 import csv
 import functools
-import io
+import json
+import sys
 
 import click
-from rich.console import Console
-from rich.table import Table
 
-from cli.utils import AuthError, apply_filters, apply_sorting
+from cli.profiling import profiler
+from cli.query import MISSING, path_getter, split_path
+from cli.table import ColumnTable
+from cli.utils import (
+    CLUSTER_FIELD,
+    AuthError,
+    apply_filters,
+    apply_sorting,
+    parse_size,
+    resolve_clusters,
+    response_cache,
+    run_on_clusters,
+)
 
-console = Console()
+# Rows that size the columns of --max-width output, and rows resolved per batch
+FIXED_WIDTH_SAMPLE_ROWS = 100
+FIXED_WIDTH_BATCH_ROWS = 1000
+
+
+class ByteSize(click.ParamType):
+    """Click parameter type for byte sizes such as '512K', '64M' or '1G'."""
+
+    name = "size"
+
+    def convert(self, value, param, ctx):
+        if isinstance(value, int):
+            return value
+        try:
+            return parse_size(value)
+        except ValueError as e:
+            self.fail(str(e), param, ctx)
+
+
+def _parse_group_by(ctx, param, value):
+    if not value:
+        return None
+    keys = [key.strip() for key in value.split(",") if key.strip()]
+    if not keys:
+        raise click.BadParameter("Expected one or more keys, e.g. 'Firmware.BIOS1'.")
+    return keys
+
+
+def _parse_aggregates(ctx, param, value):
+    from cli.aggregate import parse_aggregates
+
+    if not value:
+        return None
+    try:
+        return parse_aggregates(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
+def _set_refresh(ctx, param, value):
+    if value:
+        response_cache.refresh = True
+
+
+def _set_no_cache(ctx, param, value):
+    if value:
+        response_cache.enabled = False
+
+
+def add_cache_options(command):
+    """Add options controlling the local response cache to a Click command."""
+
+    command = click.option(
+        "--no-cache",
+        is_flag=True,
+        expose_value=False,
+        callback=_set_no_cache,
+        help="Neither read nor write the local response cache.",
+    )(command)
+    command = click.option(
+        "--refresh",
+        is_flag=True,
+        expose_value=False,
+        callback=_set_refresh,
+        help="Ignore cached responses and fetch fresh data, updating the cache.",
+    )(command)
+
+    return command
+
+
+def add_format_options(command):
+    """Add output format options to a Click command."""
+
+    command = click.option(
+        "--output",
+        "-o",
+        default=None,
+        type=click.Path(dir_okay=False, writable=True, allow_dash=True),
+        help="Write the output to this file instead of stdout.",
+    )(command)
+    command = click.option(
+        "--max-width",
+        default=None,
+        type=click.IntRange(min=1),
+        help="In table format, print plain fixed-width columns of at most this many characters, "
+        "sized from the first rows, instead of measuring every cell. Output starts right away.",
+    )(command)
+    command = click.option(
+        "--pager",
+        is_flag=True,
+        help="In table format on a terminal, show one screenful of rows at a time and page through them interactively.",
+    )(command)
+    command = click.option(
+        "--format",
+        default="raw",
+        show_default=True,
+        type=click.Choice(["csv", "column", "json", "ndjson", "raw", "table"], case_sensitive=False),
+        help="Specify the output format for the command. Options include 'csv', 'column', 'json', 'ndjson', 'raw', and 'table'.",
+    )(command)
+
+    return command
 
 
 def add_common_options(command):
     """Add common options to a Click command."""
 
+    command = add_cache_options(command)
+
     command = click.option(
         "--sort-order",
         default="asc",
         type=click.Choice(["asc", "desc"], case_sensitive=False),
-        help="Set the sort order for the output. Options are 'asc' for ascending and 'desc' for descending. Default is 'asc'.",
+        help="Set the sort order for sort keys without an explicit ':asc'/':desc'. Options are 'asc' for ascending and 'desc' for descending. Default is 'asc'.",
+    )(command)
+    command = click.option(
+        "--offset",
+        default=0,
+        type=click.IntRange(min=0),
+        help="Skip the first N items after filtering and sorting. Combine with --limit to page through results.",
+    )(command)
+    command = click.option(
+        "--limit",
+        default=None,
+        type=click.IntRange(min=0),
+        help="Only output the first N items after filtering and sorting.",
     )(command)
     command = click.option(
         "--sort-key",
         default=None,
-        help="Sort the output by a specific column. Specify the column name to sort by.",
+        help="Sort the output by one or more columns, e.g. 'Status,BMC IPv4:desc'. Nested columns use dots "
+        "('Firmware.BIOS1'). Append a type (num, ip, time, version, str) to override type detection.",
+    )(command)
+    command = click.option(
+        "--agg",
+        default=None,
+        callback=_parse_aggregates,
+        help="Aggregate the filtered data, e.g. 'count,min(size),max(size)', per --group-by group or over all "
+        "items. Functions: count, count(key), distinct(key), sum(key), avg(key), min(key), max(key); "
+        "'expr as name' names the result column.",
+    )(command)
+    command = click.option(
+        "--group-by",
+        default=None,
+        callback=_parse_group_by,
+        help="Group the filtered data by these keys, separated by commas, and output one row per group with "
+        "the --agg aggregates (default count). Sorting, --limit and --columns apply to the groups.",
     )(command)
     command = click.option(
         "--filter",
         multiple=True,
         help="Apply filters to the data using conditions like 'key>=value', 'key!=value', etc. Multiple filters can be specified.",
     )(command)
+    command = add_format_options(command)
+
+    return command
+
+
+def add_cluster_options(command):
+    """Add the options running a list command against several clusters (see clusters_decorator)."""
+
     command = click.option(
-        "--format",
-        default="raw",
-        type=click.Choice(["csv", "column", "json", "raw", "table"], case_sensitive=False),
-        help="Specify the output format for the command. Options include 'csv', 'column', 'json', 'raw', and 'table'. Default is 'raw'.",
+        "--cluster-timeout",
+        default=None,
+        type=click.FloatRange(min=0, min_open=True),
+        help="With --clusters or --all-clusters, seconds to wait for the clusters. Clusters that have not "
+        "answered by then are left out with a warning. Defaults to waiting for all of them.",
+    )(command)
+    command = click.option(
+        "--all-clusters",
+        is_flag=True,
+        help="Query every cluster with a saved login, see --clusters.",
+    )(command)
+    command = click.option(
+        "--clusters",
+        default=None,
+        help="Query these clusters, separated by commas, concurrently and merge the results with a "
+        "'cluster' column. Log in to a cluster with `login --cluster NAME`; the plain login is 'default'.",
     )(command)
 
     return command
 
 
+def clusters_decorator(func):
+    """
+    Decorator running a list command once per cluster selected with --clusters or --all-clusters.
+
+    The clusters are queried concurrently and their items merged into one list, each with
+    the name of its cluster under CLUSTER_FIELD, before the filter, sort and format stages
+    of general_decorator run. A cluster that fails or does not answer within
+    --cluster-timeout is reported as a warning and left out of the results. Without
+    either option the command runs against the default login as before.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, clusters=None, all_clusters=False, cluster_timeout=None, **kwargs):
+        import requests
+
+        names = resolve_clusters(clusters, all_clusters)
+        if not names:
+            return func(*args, **kwargs)
+
+        items = []
+        with profiler.span("clusters", clusters=len(names)):
+            results = run_on_clusters(names, lambda: func(*args, **kwargs), timeout=cluster_timeout)
+        for name, result in results:
+            # Commands report request errors as ClickException, which fails only their cluster here
+            if isinstance(
+                result, (AuthError, requests.exceptions.RequestException, ValueError, TimeoutError, click.ClickException)
+            ):
+                message = result.format_message() if isinstance(result, click.ClickException) else result
+                click.secho(
+                    f"Warning: cluster {name} failed, leaving it out of the results: {message}", fg="yellow", err=True
+                )
+                continue
+            if isinstance(result, Exception):
+                raise result
+            for item in result or ():
+                items.append({CLUSTER_FIELD: name, **item})
+        return items
+
+    return wrapper
+
+
 def filters_decorator(func):
-    """Decorator to apply filters to the data returned by a function."""
+    """
+    Decorator to apply filters to the data returned by a function.
+
+    A returned list of items is wrapped in a ColumnTable, so the filter, sort and render
+    stages after it resolve every column once and pass row indices around.
+    """
 
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
         filter_conditions = kwargs.get("filter", None)
-        data = func(*args, **kwargs)
+        with profiler.span("fetch") as span:
+            data = func(*args, **kwargs)
+            span.update(rows=len(data) if data else 0)
+
+        if isinstance(data, list):
+            data = ColumnTable(data)
 
         if filter_conditions:
-            data = apply_filters(data, filter_conditions)
+            with profiler.span("filter") as span:
+                data = apply_filters(data, filter_conditions)
+                span.update(rows=len(data))
+
+        return data
+
+    return wrapper
+
+
+def aggregate_decorator(func):
+    """
+    Decorator to group and aggregate the filtered data by --group-by and --agg.
+
+    Runs between the filter and the sort stage, so the aggregated rows are sorted, paged
+    and formatted like the rows of any other command. The wrapped function is asked for
+    the columns the aggregation reads as ndjson output, so commands that only fetch what
+    their output reads, like infra list, fetch no more than that.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, group_by=None, agg=None, **kwargs):
+        from cli.aggregate import Aggregate, aggregate, source_columns
+
+        if not group_by and not agg:
+            return func(*args, **kwargs)
+        aggregates = agg or [Aggregate("count")]
+
+        columns = source_columns(group_by or [], aggregates)
+        kwargs = {**kwargs, "format": "ndjson", "columns": ",".join(columns), "sort_key": None}
+        data = func(*args, **kwargs)
+        if data is None:
+            return None
 
+        with profiler.span("aggregate", rows=len(data)) as span:
+            data = aggregate(data, group_by or [], aggregates)
+            span.update(groups=len(data))
         return data
 
     return wrapper
 
 
+def _columns_given() -> bool:
+    ctx = click.get_current_context(silent=True)
+    if ctx is None or "columns" not in ctx.params:
+        return True
+    return ctx.get_parameter_source("columns") not in (
+        click.core.ParameterSource.DEFAULT,
+        click.core.ParameterSource.DEFAULT_MAP,
+    )
+
+
+def resolve_columns(data, display_column):
+    """Return the columns to output: the user-specified ones, or all keys of the first item."""
+    if display_column:
+        return display_column
+    return list(data[0].keys()) if data else []
+
+
+def row_formatter(columns):
+    """
+    Build a function turning an item into the list of its display values for the given columns.
+
+    Nested columns like "Power.Status" are resolved with getters compiled once per column;
+    missing values are shown as empty strings.
+    """
+    getters = [path_getter(split_path(column), default=MISSING) for column in columns]
+
+    def format_row(item):
+        row = []
+        for get in getters:
+            value = get(item)
+            row.append("" if value is MISSING else str(value))
+        return row
+
+    return format_row
+
+
+def write_csv(table, columns, file):
+    """Write the rows of a ColumnTable as CSV straight to a file."""
+    writer = csv.writer(file)
+    writer.writerow(columns)
+    writer.writerows(table.cells(columns))
+
+
+def _fit(text: str, width: int) -> str:
+    text = text.replace("\n", " ")
+    if len(text) > width:
+        return text[: width - 1] + "…"
+    return text.ljust(width)
+
+
+def write_fixed_width(table, columns, max_width, file):
+    """
+    Write the rows of a ColumnTable as plain text columns, one line per row.
+
+    Column widths come from the header and the first FIXED_WIDTH_SAMPLE_ROWS rows, capped
+    at max_width, and longer values are cut with an ellipsis. Rows are resolved and written
+    in batches, so the first lines appear without measuring the whole table.
+    """
+    sample = [*table[:FIXED_WIDTH_SAMPLE_ROWS].cells(columns)]
+    widths = [
+        min(max_width, max([len(column)] + [len(cells[index]) for cells in sample]))
+        for index, column in enumerate(columns)
+    ]
+
+    def write_line(cells):
+        file.write("  ".join(_fit(cell, width) for cell, width in zip(cells, widths)).rstrip())
+        file.write("\n")
+
+    write_line(columns)
+    write_line(["-" * width for width in widths])
+    for start in range(0, len(table), FIXED_WIDTH_BATCH_ROWS):
+        for cells in table[start : start + FIXED_WIDTH_BATCH_ROWS].cells(columns):
+            write_line(cells)
+
+
+def flat_rows(table, columns):
+    """Yield the rows of a ColumnTable as flat dicts of the given dotted columns, with None for missing values."""
+    for values in zip(*(table.values(column) for column in columns)):
+        yield {column: None if value is MISSING else value for column, value in zip(columns, values)}
+
+
+def write_ndjson(table, columns, file):
+    """Write the rows of a ColumnTable as newline-delimited JSON, restricted to columns if given."""
+    for row in flat_rows(table, columns) if columns else table:
+        file.write(json.dumps(row, default=str))
+        file.write("\n")
+
+
+@contextlib.contextmanager
+def open_output(path):
+    """Yield the file to write output to: the --output file if given, otherwise stdout."""
+    if not path or path == "-":
+        yield sys.stdout
+        sys.stdout.flush()
+        return
+    with open(path, "w", newline="") as file:
+        yield file
+
+
 def format_decorator(format_type: str = None, columns: str = None):
     """Decorator to format and display data for click commands."""
 
     def decorator(func):
         @functools.wraps(func)
-        def wrapper(*args, **kwargs):
+        def wrapper(*args, output=None, pager=False, max_width=None, **kwargs):
             format_type = kwargs.get("format", "raw")
             display_column = kwargs.get("columns", None)
 
             # Convert display_column from comma-separated string to list
             display_column = display_column.split(",") if display_column else None
+            aggregated = kwargs.get("group_by") or kwargs.get("agg")
+            if aggregated and not (display_column and _columns_given()):
+                from cli.aggregate import Aggregate, output_columns
+
+                # The default columns are those of the items before aggregation
+                display_column = output_columns(kwargs.get("group_by") or [], kwargs.get("agg") or [Aggregate("count")])
+            elif display_column and (kwargs.get("clusters") or kwargs.get("all_clusters")):
+                # Results merged from several clusters always show where each row came from
+                if CLUSTER_FIELD not in display_column:
+                    display_column = [CLUSTER_FIELD, *display_column]
+
+            # rich is only needed once there is something to render
+            import requests
+            from rich.console import Console
+            from rich.table import Table
+
+            console = Console()
 
             try:
                 data = func(*args, **kwargs)
             except AuthError as e:
                 console.print(f"[red]Authentication error: {e}[/red]")
                 return
+            except requests.exceptions.RequestException as e:
+                # E.g. the server is unreachable, or a circuit breaker is open
+                raise click.ClickException(f"Request failed: {e}")
 
             if not data:
                 console.print("[yellow]No data found.[/yellow]")
                 return
 
-            if format_type == "raw":
-                click.echo(data)
-            elif format_type == "json":
-                console.print(data)
-            elif format_type == "csv":
-                output = io.StringIO()
-                if display_column:
-                    columns = display_column
-                else:
-                    columns = list(data[0].keys()) if data else []
-
-                writer = csv.DictWriter(output, fieldnames=columns)
-                writer.writeheader()
-                for item in data:
-                    row = {}
-                    for column in columns:
-                        keys = column.split(".")
-                        value = item
-                        for key in keys:
-                            value = value.get(key, "") if isinstance(value, dict) else ""
-                        row[column] = str(value)
-                    writer.writerow(row)
-                console.print(output.getvalue())
-            elif format_type == "column":
-                for item in data:
-                    console.print("-------------")
-                    console.print("\n".join(f"{key}: {value}" for key, value in item.items()))
-                console.print("-------------")
-                console.print("Total items:", len(data))
-            elif format_type == "table":
-                if display_column:
-                    # Use user-specified columns
-                    columns = display_column
-                else:
-                    # Default to all keys in the first item
-                    columns = list(data[0].keys()) if data else []
-
-                table = Table(title=f"{func.__module__}.{func.__name__} Output")
-                for column in columns:
-                    table.add_column(column)
-                for item in data:
-                    row = []
+            table = data if isinstance(data, ColumnTable) else ColumnTable(data)
+            if aggregated and format_type in ("raw", "json", "column"):
+                # Aggregates are named after their dotted keys, e.g. "max(Firmware.BIOS1)",
+                # so whole rows are printed flat
+                table = ColumnTable([*flat_rows(table, display_column)])
+
+            with profiler.span("render", format=format_type, rows=len(data)), open_output(output) as file:
+                # csv and ndjson are written row by row without going through rich
+                if format_type == "csv":
+                    write_csv(table, resolve_columns(table, display_column), file)
+                    return
+                if format_type == "ndjson":
+                    write_ndjson(table, display_column, file)
+                    return
+
+                out = console if file is sys.stdout else Console(file=file)
+                if format_type == "raw":
+                    click.echo(table.to_list(), file=file)
+                elif format_type == "json":
+                    out.print(table.to_list())
+                elif format_type == "column":
+                    for item in table:
+                        out.print("-------------")
+                        out.print("\n".join(f"{key}: {value}" for key, value in item.items()))
+                    out.print("-------------")
+                    out.print("Total items:", len(table))
+                elif format_type == "table":
+                    columns = resolve_columns(table, display_column)
+                    title = f"{func.__module__}.{func.__name__} Output"
+
+                    if pager and file is sys.stdout and sys.stdin.isatty() and sys.stdout.isatty():
+                        from cli.pager import page_table
+
+                        page_table(table, columns, title, console, max_width=max_width)
+                        return
+                    if max_width:
+                        write_fixed_width(table, columns, max_width, file)
+                        return
+
+                    output_table = Table(title=title)
                     for column in columns:
-                        # Support nested keys like "Power.Status"
-                        keys = column.split(".")
-                        value = item
-                        for key in keys:
-                            value = value.get(key, "") if isinstance(value, dict) else ""
-                        row.append(str(value))
-                    table.add_row(*row)
-                console.print(table)
+                        output_table.add_column(column)
+                    for cells in table.cells(columns):
+                        output_table.add_row(*cells)
+                    out.print(output_table)
 
         return wrapper
 
@@ -136,17 +496,21 @@ def format_decorator(format_type: str = None, columns: str = None):
 
 
 def sort_decorator():
-    """Decorator to sort data based on a specified key."""
+    """Decorator to sort data based on the specified keys and keep the --limit items after --offset."""
 
     def decorator(func):
         @functools.wraps(func)
-        def wrapper(*args, **kwargs):
+        def wrapper(*args, limit=None, offset=0, **kwargs):
             sort_key = kwargs.get("sort_key", None)
             reverse = kwargs.get("sort_order", "asc") == "desc"
 
             data = func(*args, **kwargs)
-            if sort_key:
-                return apply_sorting(data, sort_key, reverse)
+            if data and (sort_key or limit is not None or offset):
+                # Only the rows up to the end of the requested page need to be in order
+                stop = offset + limit if limit is not None else None
+                with profiler.span("sort", rows=len(data), limit=limit, offset=offset):
+                    data = apply_sorting(data, sort_key, reverse, limit=stop)
+                return data[offset:] if offset else data
             return data
 
         return wrapper
@@ -165,4 +529,4 @@ def chain_decorator(*decorators):
     return combined_decorator
 
 
-general_decorator = chain_decorator(format_decorator(), sort_decorator(), filters_decorator)
+general_decorator = chain_decorator(format_decorator(), sort_decorator(), aggregate_decorator, filters_decorator)
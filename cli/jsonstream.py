@@ -0,0 +1,172 @@
+import codecs
+import json
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = " \t\n\r"
+NUMBER_CHARS = "0123456789.eE+-"
+
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """
+    Text buffer over an iterable of byte chunks that decodes one JSON value at a time.
+
+    Only the unconsumed tail of the input is kept, so memory is bounded by the largest
+    single value plus one chunk rather than by the size of the whole document.
+    """
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Append the next chunk to the buffer. Returns False once the input is exhausted."""
+        if self.eof:
+            return False
+        for chunk in self.chunks:
+            text = self.text_decoder.decode(chunk)
+            if text:
+                self.buffer = self.buffer[self.pos :] + text
+                self.pos = 0
+                return True
+        self.eof = True
+        tail = self.text_decoder.decode(b"", final=True)
+        if tail:
+            self.buffer = self.buffer[self.pos :] + tail
+            self.pos = 0
+            return True
+        return False
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character, or "" at the end of the input."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos : self.pos + 1]
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} in JSON stream, found {char or 'end of input'!r}")
+        self.pos += 1
+        return char
+
+    def end(self) -> None:
+        """Read the rest of the input, which may only contain whitespace."""
+        char = self.peek()
+        if char:
+            raise ValueError(f"Unexpected data after JSON value in stream: {char!r}")
+
+    def value(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number cut off by the end of the buffer, e.g. "2" of "2.5", continues in the
+            # next chunk. Strings, literals and containers fail to decode until complete.
+            number = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if number and (end == len(self.buffer) or self.buffer[end] in NUMBER_CHARS) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_array(chunks):
+    """
+    Parse a top-level JSON array incrementally.
+
+    Args:
+        chunks: Iterable of bytes, e.g. response.iter_content(CHUNK_SIZE).
+
+    Yields:
+        The elements of the array, one at a time.
+
+    Raises:
+        ValueError: If the input is not a well-formed JSON array.
+    """
+    reader = _Reader(chunks)
+    reader.expect("[")
+    if reader.peek() == "]":
+        reader.pos += 1
+        return reader.end()
+    while True:
+        yield reader.value()
+        if reader.expect(",]") == "]":
+            return reader.end()
+
+
+def iter_object(chunks):
+    """
+    Parse a top-level JSON object incrementally.
+
+    Args:
+        chunks: Iterable of bytes, e.g. response.iter_content(CHUNK_SIZE).
+
+    Yields:
+        tuple: (key, value) pairs of the object, one at a time.
+
+    Raises:
+        ValueError: If the input is not a well-formed JSON object.
+    """
+    reader = _Reader(chunks)
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.pos += 1
+        return reader.end()
+    while True:
+        key = reader.value()
+        if not isinstance(key, str):
+            raise ValueError(f"Expected a string key in JSON stream, found {key!r}")
+        reader.expect(":")
+        yield key, reader.value()
+        if reader.expect(",}") == "}":
+            return reader.end()
+
+
+def build_projection(paths):
+    """
+    Build the projection tree for a set of key paths.
+
+    Args:
+        paths: Iterable of path tuples such as ("Power", "Status"), or None to keep everything.
+
+    Returns:
+        dict: Nested dict of the keys to keep, where None keeps the whole value, or None
+            when paths is None.
+    """
+    if paths is None:
+        return None
+    tree = {}
+    for path in paths:
+        if not path:
+            return None
+        node = tree
+        for key in path[:-1]:
+            if key in node and node[key] is None:
+                break
+            node = node.setdefault(key, {})
+        else:
+            node[path[-1]] = None
+    return tree
+
+
+def project(value, tree):
+    """
+    Keep only the parts of a decoded JSON value selected by a projection tree.
+
+    Missing keys stay missing and values that are not objects are kept as they are, so
+    the result resolves the projected paths exactly like the original value.
+    """
+    if tree is None or not isinstance(value, dict):
+        return value
+    return {key: project(value[key], subtree) for key, subtree in tree.items() if key in value}
@@ -0,0 +1,282 @@
+import atexit
+import json
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+import requests
+
+from cli.utils import CONFIG_FILE
+
+LATENCY_FILE = CONFIG_FILE.parent / "latency.json"
+# Recent latencies kept per endpoint, and how many are needed before they are trusted
+LATENCY_WINDOW = 100
+MIN_SAMPLES = 5
+# The latency file keeps the MAX_ENDPOINTS most recently used endpoints, and forgets
+# endpoints not used for ENDPOINT_MAX_AGE seconds
+MAX_ENDPOINTS = 200
+ENDPOINT_MAX_AGE = 30 * 24 * 60 * 60
+# Idempotent requests still waiting after the p95 latency get a second, hedged request
+HEDGE_PERCENTILE = 0.95
+MIN_HEDGE_DELAY = 0.05
+# Requests wait TIMEOUT_FACTOR times the p99 latency of their endpoint for an answer, but at
+# least MIN_TIMEOUT seconds and long enough for all read retries together to take the session
+# timeout. A request keeps the session timeout when that is shorter.
+TIMEOUT_PERCENTILE = 0.99
+TIMEOUT_FACTOR = 10
+MIN_TIMEOUT = 10.0
+# Consecutive failures after which requests to an endpoint fail fast for BREAKER_COOLDOWN seconds
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 30.0
+SAVE_INTERVAL = 30.0
+
+# Path segments naming one resource, e.g. /osimg/12 or /uploads/<uuid>, which are
+# tracked as one endpoint
+_ID_SEGMENT = re.compile(r"/(?:\d+|[0-9a-fA-F-]{16,})(?=/|$)")
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of sending a request to an endpoint whose circuit breaker is open."""
+
+    pass
+
+
+def _percentile(samples: list, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class EndpointMonitor:
+    """
+    Tracks the latency of every endpoint to hedge slow requests, and stops sending
+    requests to endpoints that keep failing.
+
+    Latencies are kept per method, server and path, for the last LATENCY_WINDOW requests,
+    in ~/.podmanagercli/latency.json, so every command starts from what earlier ones
+    measured. The file is merged with the samples of other processes when it is written,
+    at most every SAVE_INTERVAL seconds and when the process exits.
+
+    - hedge_delay() gives the p95 latency, after which send() sends an idempotent request
+      a second time and uses whichever answer arrives first.
+    - timeout_for() gives the read timeout of a request, a generous multiple of the p99
+      latency. It never makes a request give up sooner than one attempt with the session
+      timeout would, and falls back to the session timeout once the endpoint fails.
+    - After BREAKER_THRESHOLD timeouts or connection errors in a row, the breaker of the
+      endpoint opens and requests fail with CircuitOpenError for BREAKER_COOLDOWN seconds.
+      The first request after that is sent without a hedge, and closes the breaker if it
+      succeeds. Breakers only live as long as the process, so a command never fails
+      because of the errors another one saw.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.enabled = True
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._endpoints = None
+        self._breakers = {}
+        self._new_samples = {}
+        self._saved = time.monotonic()
+        self._registered = False
+
+    def _samples(self, key: str) -> list:
+        if self._endpoints is None:
+            self._endpoints = self._read()
+        return self._endpoints.setdefault(key, {"samples": []})["samples"]
+
+    def _breaker(self, key: str) -> dict:
+        return self._breakers.setdefault(key, {"failures": 0, "open_until": 0})
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, "r") as file:
+                endpoints = json.load(file).get("endpoints", {})
+        except (OSError, ValueError, AttributeError):
+            return {}
+        return endpoints if isinstance(endpoints, dict) else {}
+
+    def hedge_delay(self, key: str) -> float:
+        """Return the seconds to wait before hedging a request, or None when it should not be hedged."""
+        with self._lock:
+            samples = self._samples(key)
+            if len(samples) < MIN_SAMPLES or self._breaker(key)["failures"] >= BREAKER_THRESHOLD:
+                return None
+            return max(MIN_HEDGE_DELAY, _percentile(samples, HEDGE_PERCENTILE))
+
+    def timeout_for(self, key: str, timeout: float, retries: int) -> float:
+        """
+        Return the read timeout of a request, or None to use the session timeout.
+
+        Args:
+            key (str): The endpoint, see endpoint_key().
+            timeout (float): The session timeout, which is never exceeded.
+            retries (int): The read retries of the session. A request that keeps timing out
+                is sent retries + 1 times, which together still take at least the session timeout.
+        """
+        with self._lock:
+            samples = self._samples(key)
+            # An endpoint that failed since may have become slower than what was learned
+            if len(samples) < MIN_SAMPLES or self._breaker(key)["failures"]:
+                return None
+            learned = TIMEOUT_FACTOR * _percentile(samples, TIMEOUT_PERCENTILE)
+        adapted = max(MIN_TIMEOUT, learned, timeout / (retries + 1))
+        return adapted if adapted < timeout else None
+
+    def check(self, key: str) -> None:
+        """
+        Raises:
+            CircuitOpenError: If the breaker of the endpoint is open.
+        """
+        with self._lock:
+            breaker = self._breaker(key)
+            remaining = breaker["open_until"] - time.monotonic()
+            if remaining <= 0:
+                return
+            self.rejected += 1
+        raise CircuitOpenError(
+            f"{key} failed {breaker['failures']} times in a row, not sending requests to it for "
+            f"another {remaining:.0f}s (circuit breaker open)"
+        )
+
+    def record(self, key: str, seconds: float, failed: bool = False) -> None:
+        """
+        Record the latency of a request, or that it failed.
+
+        Failures count towards the breaker, but are not latency samples: the time until a
+        timeout says nothing about how long the endpoint would have taken.
+        """
+        with self._lock:
+            breaker = self._breaker(key)
+            if failed:
+                breaker["failures"] += 1
+                if breaker["failures"] >= BREAKER_THRESHOLD:
+                    breaker["open_until"] = time.monotonic() + BREAKER_COOLDOWN
+            else:
+                breaker["failures"] = 0
+                breaker["open_until"] = 0
+                samples = self._samples(key)
+                samples[:] = [*samples[-(LATENCY_WINDOW - 1) :], round(seconds, 4)]
+                self._new_samples.setdefault(key, []).append(round(seconds, 4))
+
+            if not self._registered:
+                atexit.register(self.save)
+                self._registered = True
+            due = time.monotonic() - self._saved > SAVE_INTERVAL
+        if due:
+            self.save()
+
+    def save(self) -> None:
+        """Merge the samples recorded by this process into the latency file, and prune unused endpoints."""
+        with self._lock:
+            if not self._new_samples:
+                return
+            endpoints = self._read()
+            now = time.time()
+            for key, samples in self._new_samples.items():
+                saved = endpoints.get(key, {}).get("samples", [])
+                endpoints[key] = {"samples": [*saved, *samples][-LATENCY_WINDOW:], "used": now}
+            self._new_samples = {}
+            self._saved = time.monotonic()
+
+            recent = sorted(
+                (
+                    (entry.get("used", 0), key)
+                    for key, entry in endpoints.items()
+                    if isinstance(entry, dict) and now - entry.get("used", 0) < ENDPOINT_MAX_AGE
+                ),
+                reverse=True,
+            )[:MAX_ENDPOINTS]
+            endpoints = {key: endpoints[key] for _, key in recent}
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, "w") as file:
+                    json.dump({"endpoints": endpoints}, file)
+            except OSError:
+                pass
+
+    def send(self, key: str, send, idempotent: bool = False):
+        """
+        Send a request with the breaker, hedging and latency tracking of its endpoint.
+
+        Args:
+            key (str): The endpoint, see endpoint_key().
+            send (callable): Sends the request once and returns the response. It may be
+                called from other threads, and twice for a hedged request.
+            idempotent (bool): Whether sending the request twice is safe, which allows hedging.
+
+        Returns:
+            Response: The first response to arrive.
+
+        Raises:
+            CircuitOpenError: If the breaker of the endpoint is open.
+            requests.exceptions.RequestException: If the request failed.
+        """
+        self.check(key)
+        delay = self.hedge_delay(key) if idempotent else None
+        started = time.monotonic()
+        try:
+            response = send() if delay is None else self._send_hedged(send, delay)
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            self.record(key, time.monotonic() - started, failed=True)
+            raise
+        self.record(key, time.monotonic() - started)
+        return response
+
+    def _send_hedged(self, send, delay: float):
+        primary = _start(send)
+        if wait([primary], timeout=delay).done:
+            return primary.result()
+
+        with self._lock:
+            self.hedged += 1
+        backup = _start(send)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                # The slower request is left to finish on its own, and its response closed
+                for other in pending:
+                    other.add_done_callback(_discard)
+                if future is backup:
+                    with self._lock:
+                        self.hedge_wins += 1
+                return future.result()
+        raise error
+
+
+def _start(func) -> Future:
+    # Daemon threads, so a request that is still hanging does not hold up the exit
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(func())
+        except Exception as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, daemon=True).start()
+    return future
+
+
+def _discard(future: Future) -> None:
+    if future.exception() is None:
+        future.result().close()
+
+
+def endpoint_key(method: str, server: str, endpoint: str) -> str:
+    """
+    Return the key latencies are tracked by: the method, server and path without the
+    query, with resource ids replaced by {id}, e.g. "DELETE https://host/api/v1/provision/osimg/{id}".
+    """
+    path = _ID_SEGMENT.sub("/{id}", endpoint.split("?", 1)[0])
+    return f"{method.upper()} {server}{path}"
+
+
+endpoint_monitor = EndpointMonitor(LATENCY_FILE)
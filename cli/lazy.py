@@ -0,0 +1,50 @@
+import importlib
+
+import click
+
+
+class LazyGroup(click.Group):
+    """
+    Click group that imports the modules of its subcommands only when they are used.
+
+    Subcommands are registered as a mapping of name to ("module:attribute", short help).
+    Listing them (for --help or shell completion) uses the stored short help, so
+    the module is imported only when the subcommand itself is invoked or inspected.
+    """
+
+    def __init__(self, *args, lazy_subcommands: dict = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_subcommands = lazy_subcommands or {}
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_subcommands))
+
+    def get_command(self, ctx, cmd_name):
+        if cmd_name in self.lazy_subcommands and cmd_name not in self.commands:
+            self.add_command(self._load(cmd_name), cmd_name)
+        return super().get_command(ctx, cmd_name)
+
+    def _load(self, cmd_name):
+        import_path, _ = self.lazy_subcommands[cmd_name]
+        module_name, attribute = import_path.split(":", 1)
+        command = getattr(importlib.import_module(module_name), attribute)
+        if not isinstance(command, click.Command):
+            raise ValueError(f"Lazy loading of {import_path} failed: not a click command")
+        return command
+
+    def format_commands(self, ctx, formatter):
+        rows = []
+        limit = formatter.width - 6 - max((len(name) for name in self.list_commands(ctx)), default=0)
+        for name in self.list_commands(ctx):
+            if name in self.lazy_subcommands and name not in self.commands:
+                help_text = self.lazy_subcommands[name][1]
+            else:
+                command = self.get_command(ctx, name)
+                if command is None or command.hidden:
+                    continue
+                help_text = command.get_short_help_str(limit)
+            rows.append((name, help_text))
+
+        if rows:
+            with formatter.section("Commands"):
+                formatter.write_dl(rows)
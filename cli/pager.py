@@ -0,0 +1,76 @@
+import click
+
+# Lines of a page that are not rows: title, header, borders and the status line
+PAGE_CHROME_LINES = 7
+
+NEXT_KEYS = (" ", "n", "f", "j", "\r", "\n", "\x1b[B", "\x1b[6~")
+PREVIOUS_KEYS = ("b", "p", "k", "\x1b[A", "\x1b[5~")
+FIRST_KEYS = ("g", "\x1b[H")
+LAST_KEYS = ("G", "\x1b[F")
+QUIT_KEYS = ("q", "Q", "\x1b", "\x03")
+
+
+def render_page(table, columns, title: str, start: int, size: int, max_width: int = None):
+    """
+    Build the rich table for the rows start to start + size of a ColumnTable.
+
+    Only these rows are resolved and measured. Cells are kept on one line, cut with an
+    ellipsis where they do not fit, so every row takes exactly one line of the page.
+    """
+    from rich.table import Table
+
+    page = table[start : start + size]
+    end = start + len(page)
+    output_table = Table(title=f"{title} (rows {start + 1}-{end} of {len(table)})")
+    for column in columns:
+        output_table.add_column(column, no_wrap=True, overflow="ellipsis", max_width=max_width)
+    for cells in page.cells(columns):
+        output_table.add_row(*cells)
+    return output_table
+
+
+def page_table(table, columns, title: str, console, max_width: int = None) -> None:
+    """
+    Show a ColumnTable one screenful at a time until the user quits.
+
+    The time to show a page depends on the terminal height, not on the number of rows.
+    Space, Enter, n or Page Down show the next page, b, p or Page Up the previous one,
+    g and G the first and last one, and q or Escape quit.
+
+    Args:
+        table (ColumnTable): The rows to show.
+        columns (list): The dotted columns to show.
+        title (str): Title shown above every page.
+        console (Console): The rich console to draw on.
+        max_width (int): Maximum width of every column.
+    """
+    start = 0
+    while True:
+        # Re-read the height on every page, so resizing the terminal takes effect
+        size = max(1, console.size.height - PAGE_CHROME_LINES)
+        last_start = max(0, (len(table) - 1) // size * size)
+        start = min(start, last_start)
+
+        console.clear()
+        console.print(render_page(table, columns, title, start, size, max_width=max_width))
+        console.print("[dim]space/n next, b previous, g/G first/last, q quit[/dim]", end="")
+
+        try:
+            key = click.getchar()
+        except (KeyboardInterrupt, EOFError):
+            key = "q"
+
+        if key in QUIT_KEYS:
+            console.print()
+            return
+        if key in NEXT_KEYS:
+            if start >= last_start:
+                console.print()
+                return
+            start += size
+        elif key in PREVIOUS_KEYS:
+            start = max(0, start - size)
+        elif key in FIRST_KEYS:
+            start = 0
+        elif key in LAST_KEYS:
+            start = last_start
@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Profiler:
+    """
+    Lightweight recorder of timed spans for the phases of a CLI run.
+
+    Recording is off by default and span() then costs a single flag check, so the
+    instrumentation can stay in place on every request and decorator.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def enable(self) -> None:
+        """Start recording spans."""
+        self.enabled = True
+        self.spans = []
+        self.origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name: str, category: str = "phase", **attrs):
+        """
+        Record the duration of the enclosed block.
+
+        Args:
+            name (str): Name of the span, e.g. "filter" or "GET /api/v1/provision/osimg".
+            category (str): Span category, e.g. "phase" or "http".
+            **attrs: Attributes stored with the span.
+
+        Yields:
+            dict: The span attributes, which the block can update with results such as
+                the status code or the number of bytes received.
+        """
+        if not self.enabled:
+            yield attrs
+            return
+
+        start = time.perf_counter()
+        try:
+            yield attrs
+        finally:
+            end = time.perf_counter()
+            with self._lock:
+                self.spans.append(
+                    {
+                        "name": name,
+                        "category": category,
+                        "start": start - self.origin,
+                        "duration": end - start,
+                        "thread": threading.get_ident(),
+                        "attrs": attrs,
+                    }
+                )
+
+    def summary(self) -> list:
+        """
+        Aggregate the recorded spans by name, in order of first occurrence.
+
+        Returns:
+            list: One dict per span name with count, total/max duration, bytes and statuses.
+        """
+        rows = {}
+        for span in sorted(self.spans, key=lambda span: span["start"]):
+            row = rows.setdefault(
+                span["name"],
+                {
+                    "name": span["name"],
+                    "category": span["category"],
+                    "count": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                    "bytes_sent": 0,
+                    "bytes_received": 0,
+                    "statuses": set(),
+                },
+            )
+            row["count"] += 1
+            row["total"] += span["duration"]
+            row["max"] = max(row["max"], span["duration"])
+            row["bytes_sent"] += span["attrs"].get("bytes_sent") or 0
+            row["bytes_received"] += span["attrs"].get("bytes_received") or 0
+            if span["attrs"].get("status") is not None:
+                row["statuses"].add(str(span["attrs"]["status"]))
+        return list(rows.values())
+
+    def print_summary(self, console=None) -> None:
+        """Print the aggregated spans as a table."""
+        from rich.console import Console
+        from rich.table import Table
+
+        console = console or Console(stderr=True)
+        table = Table(title=f"Profile ({(time.perf_counter() - self.origin) * 1000:.1f} ms total)")
+        for column in ("Span", "Count", "Total ms", "Max ms", "Sent", "Received", "Status"):
+            table.add_column(column, justify="left" if column in ("Span", "Status") else "right")
+
+        for row in self.summary():
+            table.add_row(
+                row["name"],
+                str(row["count"]),
+                f"{row['total'] * 1000:.1f}",
+                f"{row['max'] * 1000:.1f}",
+                str(row["bytes_sent"]) if row["category"] == "http" else "",
+                str(row["bytes_received"]) if row["category"] == "http" else "",
+                ",".join(sorted(row["statuses"])),
+            )
+        console.print(table)
+
+    def write_trace(self, path: str) -> None:
+        """
+        Write the recorded spans as Chrome trace events (chrome://tracing, Perfetto).
+
+        Args:
+            path (str): Path of the JSON file to write.
+        """
+        events = [
+            {
+                "name": span["name"],
+                "cat": span["category"],
+                "ph": "X",
+                "ts": round(span["start"] * 1e6, 3),
+                "dur": round(span["duration"] * 1e6, 3),
+                "pid": os.getpid(),
+                "tid": span["thread"],
+                "args": {key: value for key, value in span["attrs"].items() if value is not None},
+            }
+            for span in self.spans
+        ]
+        with open(path, "w") as file:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, file, default=str)
+
+
+profiler = Profiler()
@@ -0,0 +1,667 @@
+import functools
+import heapq
+import ipaddress
+import operator
+import re
+from datetime import datetime
+
+from packaging.version import InvalidVersion, Version
+
+# Returned by a path getter when the path runs through a value that is not a dict
+MISSING = object()
+
+ORDERED_OPERATORS = {">=": operator.ge, "<=": operator.le, ">": operator.gt, "<": operator.lt}
+# Checked in this order at every position, so longer operators win over their prefixes
+SYMBOL_OPERATORS = ["!~", "!=", ">=", "<=", "==", "=", ">", "<", "~"]
+WORD_OPERATOR = re.compile(r"\s+(not\s+in|in)\s+", re.IGNORECASE)
+KEYWORD = re.compile(r"\s*\b(and|or)\b\s*", re.IGNORECASE)
+NOT_KEYWORD = re.compile(r"not\b\s*", re.IGNORECASE)
+# Where the condition after an AND/OR ends: the next whitespace separated AND/OR
+NEXT_KEYWORD = re.compile(r"\s(?:and|or)\b", re.IGNORECASE)
+
+
+class FilterSyntaxError(ValueError):
+    """Raised when a filter expression cannot be parsed."""
+
+    pass
+
+
+def split_path(key: str) -> tuple:
+    """Split a dotted key such as "Power.Status" into its path components."""
+    return tuple(key.split("."))
+
+
+def path_getter(path: tuple, default=None):
+    """
+    Build a function that resolves a nested key path on an item.
+
+    Args:
+        path (tuple): Path components, e.g. ("Power", "Status").
+        default: Value returned when the last key is missing.
+
+    Returns:
+        callable: Function returning the value at the path, default if the last key is
+            missing, or MISSING if the path runs through a value that is not a dict.
+    """
+    if len(path) == 1:
+        (key,) = path
+
+        def get(item):
+            return item.get(key, default) if isinstance(item, dict) else MISSING
+
+        return get
+
+    *parents, last = path
+
+    def get(item):
+        for key in parents:
+            if not isinstance(item, dict):
+                return MISSING
+            item = item.get(key)
+        return item.get(last, default) if isinstance(item, dict) else MISSING
+
+    return get
+
+
+class Filter:
+    """
+    A filter expression compiled into a predicate.
+
+    Calling the filter with an item returns whether the item matches. The key
+    paths the expression reads are available in paths.
+    """
+
+    __slots__ = ("source", "predicate", "paths")
+
+    def __init__(self, source: str, predicate, paths: set):
+        self.source = source
+        self.predicate = predicate
+        self.paths = paths
+
+    def __call__(self, item) -> bool:
+        return self.predicate(item)
+
+    def __repr__(self):
+        return f"Filter({self.source!r})"
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_version(text: str):
+    # Inventories repeat the same few firmware versions on every node, so parsing is memoized
+    try:
+        return Version(text)
+    except InvalidVersion:
+        return None
+
+
+def _equality(value: str, negate: bool):
+    def predicate(item):
+        return (str(item) == value) != negate
+
+    return predicate
+
+
+def _ordered(value: str, compare):
+    # The constant side is parsed once: as a float, then as a version, falling back to
+    # string comparison, the same order the item side is tried in
+    try:
+        value_float = float(value)
+    except ValueError:
+        value_float = None
+    value_version = _parse_version(value)
+
+    def predicate(item):
+        try:
+            item_float = float(item)
+        except TypeError:
+            return False
+        except ValueError:
+            item_float = None
+
+        if item_float is not None and value_float is not None:
+            return compare(item_float, value_float)
+        if value_version is not None:
+            item_version = _parse_version(str(item))
+            if item_version is not None:
+                return compare(item_version, value_version)
+        return compare(str(item), value)
+
+    return predicate
+
+
+def _regex(value: str, negate: bool):
+    try:
+        pattern = re.compile(value)
+    except re.error as e:
+        raise FilterSyntaxError(f"Invalid regular expression '{value}': {e}")
+
+    def predicate(item):
+        return (item is not None and pattern.search(str(item)) is not None) != negate
+
+    return predicate
+
+
+def _membership(values: list, negate: bool):
+    strings = set()
+    networks = []
+    for value in values:
+        if "/" in value:
+            try:
+                networks.append(ipaddress.ip_network(value, strict=False))
+                continue
+            except ValueError:
+                pass
+        strings.add(value)
+
+    def predicate(item):
+        text = str(item)
+        if text in strings:
+            return not negate
+        if networks and item is not None:
+            try:
+                address = ipaddress.ip_address(text)
+            except ValueError:
+                return negate
+            for network in networks:
+                if address.version == network.version and address in network:
+                    return not negate
+        return negate
+
+    return predicate
+
+
+def compile_condition(key: str, op: str, value, getter=path_getter):
+    """
+    Compile a single "key op value" condition into a predicate.
+
+    Args:
+        key (str): Dotted key path, e.g. "Power.Status".
+        op (str): One of =, ==, !=, >, >=, <, <=, ~ (regex search), !~, in, not in.
+        value: The constant side; a list of strings for in / not in.
+        getter (callable): Builds the function resolving a key path on what the predicate
+            is called with. Defaults to path_getter, for predicates taking an item.
+
+    Returns:
+        callable: Predicate taking an item, or whatever getter's functions take.
+    """
+    get = getter(split_path(key))
+
+    if op in ("=", "=="):
+        compare = _equality(value, negate=False)
+    elif op == "!=":
+        compare = _equality(value, negate=True)
+    elif op in ORDERED_OPERATORS:
+        compare = _ordered(value, ORDERED_OPERATORS[op])
+    elif op in ("~", "!~"):
+        compare = _regex(value, negate=op == "!~")
+    elif op in ("in", "not in"):
+        compare = _membership(value, negate=op == "not in")
+    else:
+        raise FilterSyntaxError(f"Unknown operator '{op}'")
+
+    def predicate(item):
+        value = get(item)
+        if value is MISSING:
+            return False
+        return compare(value)
+
+    return predicate
+
+
+def _all(predicates):
+    if len(predicates) == 1:
+        return predicates[0]
+
+    def predicate(item):
+        for check in predicates:
+            if not check(item):
+                return False
+        return True
+
+    return predicate
+
+
+def _any(predicates):
+    if len(predicates) == 1:
+        return predicates[0]
+
+    def predicate(item):
+        for check in predicates:
+            if check(item):
+                return True
+        return False
+
+    return predicate
+
+
+def _not(check):
+    def predicate(item):
+        return not check(item)
+
+    return predicate
+
+
+class _Parser:
+    """
+    Recursive descent parser for filter expressions.
+
+        expression := term (OR term)*
+        term       := factor (AND factor)*
+        factor     := NOT factor | "(" expression ")" | condition
+        condition  := key operator value
+
+    Keys may contain spaces ("BMC IPv4"). Values run to the next AND/OR keyword, or
+    to a closing parenthesis inside a group; quote them to include those. AND/OR only
+    end a value as whole words followed by another condition, NOT or "(", so
+    "Name=Rock and Roll" and "Vendor=Oracle" are single conditions.
+    """
+
+    def __init__(self, source: str, getter=path_getter):
+        self.source = source
+        self.getter = getter
+        self.pos = 0
+        self.depth = 0
+        self.paths = set()
+
+    def error(self, message: str):
+        raise FilterSyntaxError(f"{message} at position {self.pos} in filter '{self.source}'")
+
+    def skip_spaces(self):
+        while self.pos < len(self.source) and self.source[self.pos].isspace():
+            self.pos += 1
+
+    def keyword(self, word: str) -> bool:
+        match = KEYWORD.match(self.source, self.pos)
+        if match and match.group(1).lower() == word:
+            self.pos = match.end()
+            return True
+        return False
+
+    def parse(self):
+        predicate = self.expression()
+        self.skip_spaces()
+        if self.pos < len(self.source):
+            self.error("Unexpected input")
+        return predicate
+
+    def expression(self):
+        terms = [self.term()]
+        while self.keyword("or"):
+            terms.append(self.term())
+        return _any(terms)
+
+    def term(self):
+        factors = [self.factor()]
+        while self.keyword("and"):
+            factors.append(self.factor())
+        return _all(factors)
+
+    def factor(self):
+        self.skip_spaces()
+        match = NOT_KEYWORD.match(self.source, self.pos)
+        if match and not self._starts_condition_key(match.end()):
+            self.pos = match.end()
+            return _not(self.factor())
+
+        if self.source.startswith("(", self.pos):
+            self.pos += 1
+            self.depth += 1
+            predicate = self.expression()
+            self.skip_spaces()
+            if not self.source.startswith(")", self.pos):
+                self.error("Missing closing parenthesis")
+            self.pos += 1
+            self.depth -= 1
+            return predicate
+
+        return self.condition()
+
+    def _starts_condition_key(self, end: int) -> bool:
+        # "NOT" followed directly by an operator is a key named "NOT", not negation
+        rest = self.source[end:]
+        return any(rest.startswith(op) for op in SYMBOL_OPERATORS)
+
+    def _ends_value(self, index: int) -> bool:
+        # Whether the AND/OR keyword at index starts another factor, or is part of the value
+        match = KEYWORD.match(self.source, index)
+        if not match:
+            return False
+        return self._starts_factor(match.end())
+
+    def _starts_factor(self, index: int) -> bool:
+        rest = self.source[index:]
+        if rest.startswith("("):
+            return True
+        match = NOT_KEYWORD.match(rest)
+        if match and not self._starts_condition_key(index + match.end()):
+            return self._starts_factor(index + match.end())
+        following = NEXT_KEYWORD.search(rest)
+        condition = rest[: following.start()] if following else rest
+        return any(op in condition for op in SYMBOL_OPERATORS) or bool(WORD_OPERATOR.search(condition))
+
+    def condition(self):
+        start = self.pos
+        while self.pos < len(self.source):
+            match = WORD_OPERATOR.match(self.source, self.pos)
+            if match and self.pos > start:
+                key = self.source[start : self.pos].strip()
+                self.pos = match.end()
+                op = " ".join(match.group(1).lower().split())
+                break
+
+            op = next((op for op in SYMBOL_OPERATORS if self.source.startswith(op, self.pos)), None)
+            if op:
+                key = self.source[start : self.pos].strip()
+                self.pos += len(op)
+                break
+
+            if self.source[self.pos] in "()":
+                self.error("Expected an operator")
+            self.pos += 1
+        else:
+            self.error("Expected an operator")
+
+        if not key:
+            self.error("Missing key")
+
+        value = self.list_value() if op in ("in", "not in") else self.value()
+        self.paths.add(split_path(key))
+        return compile_condition(key, op, value, self.getter)
+
+    def value(self) -> str:
+        self.skip_spaces()
+        if self.pos < len(self.source) and self.source[self.pos] in "'\"":
+            quote = self.source[self.pos]
+            end = self.source.find(quote, self.pos + 1)
+            if end < 0:
+                self.error("Unterminated quoted value")
+            value = self.source[self.pos + 1 : end]
+            self.pos = end + 1
+            return value
+
+        start = self.pos
+        while self.pos < len(self.source):
+            if self.depth and self.source[self.pos] == ")":
+                break
+            if self.source[self.pos].isspace() and self._ends_value(self.pos):
+                break
+            self.pos += 1
+        return self.source[start : self.pos].strip()
+
+    def list_value(self) -> list:
+        self.skip_spaces()
+        if self.source.startswith("[", self.pos):
+            end = self.source.find("]", self.pos)
+            if end < 0:
+                self.error("Missing closing bracket")
+            text = self.source[self.pos + 1 : end]
+            self.pos = end + 1
+        else:
+            text = self.value()
+        values = [value.strip().strip("'\"") for value in text.split(",")]
+        return [value for value in values if value]
+
+
+def compile_filter(expression: str, getter=path_getter) -> Filter:
+    """
+    Compile a filter expression into a Filter.
+
+    Conditions have the form "key op value" where key is a dotted path and op is one
+    of =, !=, >, >=, <, <= (numbers, then versions, then strings), ~ / !~ (regex
+    search), in / not in (a list such as "[a, b]", which may contain CIDR networks
+    such as 10.0.0.0/8). Conditions combine with AND, OR, NOT and parentheses.
+
+    Args:
+        expression (str): The filter expression, e.g. "Status=Warning AND BMC IPv4 in 10.0.0.0/8".
+        getter (callable): See compile_condition. ColumnTable.getter compiles a filter
+            that is called with row indices instead of items.
+
+    Returns:
+        Filter: The compiled filter.
+
+    Raises:
+        FilterSyntaxError: If the expression cannot be parsed.
+    """
+    parser = _Parser(expression, getter)
+    predicate = parser.parse()
+    return Filter(expression, predicate, parser.paths)
+
+
+def compile_filters(expressions, getter=path_getter) -> Filter:
+    """
+    Compile several filter expressions into a single Filter matching all of them.
+
+    Args:
+        expressions (list): Filter expressions, e.g. the values of repeated --filter options.
+        getter (callable): See compile_condition.
+
+    Returns:
+        Filter: The compiled filter.
+
+    Raises:
+        FilterSyntaxError: If any expression cannot be parsed.
+    """
+    filters = [compile_filter(expression, getter) for expression in expressions]
+    paths = set()
+    for compiled in filters:
+        paths |= compiled.paths
+    return Filter(" AND ".join(f"({f.source})" for f in filters), _all([f.predicate for f in filters]), paths)
+
+
+def _to_number(value):
+    if isinstance(value, bool):
+        raise ValueError("not a number")
+    return float(value)
+
+
+def _to_ip(value):
+    address = ipaddress.ip_address(str(value))
+    # IPv4 and IPv6 addresses cannot be compared with each other, their integers can
+    return (address.version, int(address))
+
+
+def _to_timestamp(value):
+    return datetime.fromisoformat(str(value)).timestamp()
+
+
+def _to_version(value):
+    version = _parse_version(str(value))
+    if version is None:
+        raise ValueError(f"Invalid version: {value}")
+    return version
+
+
+# Tried in this order when a sort key has no explicit type
+SORT_TYPES = {
+    "num": _to_number,
+    "ip": _to_ip,
+    "time": _to_timestamp,
+    "version": _to_version,
+    "str": str,
+}
+SORT_ORDERS = ("asc", "desc")
+
+
+class SortKey:
+    """One component of a --sort-key specification."""
+
+    __slots__ = ("path", "descending", "type")
+
+    def __init__(self, path: tuple, descending: bool = False, type: str = None):
+        self.path = path
+        self.descending = descending
+        self.type = type
+
+    def __repr__(self):
+        order = "desc" if self.descending else "asc"
+        return f"SortKey({'.'.join(self.path)!r}, {order}, {self.type or 'auto'})"
+
+
+class _Descending:
+    """Wraps a sort value to invert its ordering."""
+
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+
+def parse_sort_keys(spec: str, default_order: str = "asc") -> list:
+    """
+    Parse a sort specification such as "Status,BMC IPv4:desc,Firmware.BIOS1:version".
+
+    Every comma-separated key is a dotted path optionally followed by ":asc" or
+    ":desc" and by a type (num, ip, time, version or str). Keys without a type are
+    typed by inspecting their values.
+
+    Args:
+        spec (str): The sort specification.
+        default_order (str): Order for keys without an explicit order.
+
+    Returns:
+        list: The parsed SortKey objects.
+
+    Raises:
+        ValueError: If the specification is empty.
+    """
+    keys = []
+    for part in spec.split(","):
+        tokens = part.strip().split(":")
+        order, sort_type = default_order, None
+        while len(tokens) > 1 and tokens[-1].strip().lower() in SORT_ORDERS + tuple(SORT_TYPES):
+            token = tokens.pop().strip().lower()
+            if token in SORT_ORDERS:
+                order = token
+            else:
+                sort_type = token
+
+        key = ":".join(tokens).strip()
+        if key:
+            keys.append(SortKey(split_path(key), descending=order == "desc", type=sort_type))
+
+    if not keys:
+        raise ValueError(f"Invalid sort key: '{spec}'")
+    return keys
+
+
+_FAILED = object()
+
+
+def _convert_column(values: list, sort_type: str = None) -> tuple:
+    # Without an explicit type, use the first type every value converts to. Failing that,
+    # use the type most values convert to as long as it covers at least half of them.
+    present = sum(1 for value in values if value is not None and value is not MISSING)
+    best = ("str", None, 0)
+    for name, convert in SORT_TYPES.items():
+        if sort_type is not None and name != sort_type:
+            continue
+        if sort_type is None and name == "str":
+            break
+
+        converted, count, failures = [], 0, 0
+        for value in values:
+            if value is None or value is MISSING:
+                converted.append(MISSING)
+                continue
+            try:
+                converted.append(convert(value))
+                count += 1
+            except (ValueError, TypeError, OverflowError):
+                converted.append(_FAILED)
+                failures += 1
+                if sort_type is None and failures * 2 > present:
+                    break
+
+        if count == present or sort_type is not None:
+            return name, converted
+        if failures * 2 <= present and count > best[2]:
+            best = (name, converted, count)
+
+    if best[1] is None:
+        return "str", [MISSING if value is None or value is MISSING else str(value) for value in values]
+    return best[0], best[1]
+
+
+def _column_keys(key: SortKey, values: list) -> list:
+    sort_type, converted = _convert_column(values, key.type)
+
+    keys = []
+    for value, typed in zip(values, converted):
+        if typed is MISSING:
+            # Missing values sort last in either order
+            keys.append((2, None))
+            continue
+        if typed is _FAILED:
+            # Values that do not match the column type sort after those that do, as strings
+            rank, typed = 1, str(value)
+        else:
+            rank = 0
+        if key.descending:
+            typed = -typed if rank == 0 and sort_type == "num" else _Descending(typed)
+        keys.append((rank, typed))
+    return keys
+
+
+def comparison_keys(values: list, sort_type: str = None) -> list:
+    """
+    Return a key for every value that orders the values like --sort-key does.
+
+    Args:
+        values (list): The values of one column.
+        sort_type (str): One of SORT_TYPES, or None to detect it from the values.
+
+    Returns:
+        list: Comparable keys, None for missing values.
+    """
+    return [None if rank == 2 else (rank, typed) for rank, typed in _column_keys(SortKey((), type=sort_type), values)]
+
+
+def sort_rows(rows: list, keys: list, limit: int = None) -> list:
+    """
+    Sort rows by several typed keys, computing each row's key once.
+
+    Args:
+        rows (list): The items to sort.
+        keys (list): SortKey objects, most significant first.
+        limit (int): Only return the first limit rows. Uses partial selection instead
+            of a full sort when it is smaller than the number of rows.
+
+    Returns:
+        list: The sorted rows.
+    """
+    if not keys:
+        return rows[:limit] if limit is not None else rows
+
+    values = []
+    for key in keys:
+        get = path_getter(key.path)
+        values.append([get(row) for row in rows])
+    return [rows[position] for position in sort_positions(keys, values, limit=limit)]
+
+
+def sort_positions(keys: list, values: list, limit: int = None) -> list:
+    """
+    Order positions by several typed keys, given the values of every key.
+
+    Args:
+        keys (list): SortKey objects, most significant first.
+        values (list): One list of values per key, all of the same length.
+        limit (int): Only return the first limit positions.
+
+    Returns:
+        list: Positions into the value lists, in sorted order.
+    """
+    count = len(values[0])
+    columns = [_column_keys(key, column) for key, column in zip(keys, values)]
+    decorated = list(zip(*columns, range(count)))
+    if limit is not None and limit < count:
+        decorated = heapq.nsmallest(limit, decorated)
+    else:
+        decorated.sort()
+    return [entry[-1] for entry in decorated]
@@ -1,11 +1,15 @@
+import sys
+
 import click
-import requests
-from rich.console import Console
 
-from cli.decorator import general_decorator, add_common_options
-from cli.utils import api_request
+from cli.decorator import general_decorator, add_cluster_options, add_common_options, clusters_decorator
+from cli.utils import CLUSTER_FIELD, api_request, fetch_sharded
 
-console = Console()
+# Per-node data merged into the node list, keyed by the field it is stored under
+ENRICHMENT_ENDPOINTS = {
+    "Firmware": "/api/v1/infra/getFirmwareVersion",
+    "Fru": "/api/v1/infra/getFru",
+}
 
 
 @click.group()
@@ -14,79 +18,537 @@ def infra():
     pass
 
 
+DEFAULT_COLUMNS = (
+    "Host Name,BMC MAC,Fru.0.Product.ProductName,Power.Status,Status,BMC IPv4,Firmware.BMCImage1,Firmware.BIOS1"
+)
+NODE_LIST_ENDPOINT = "/api/v1/infra/common/getNodeList?type=BMC"
+# Output formats that print whole items instead of the selected --columns
+FULL_ITEM_FORMATS = ("raw", "json", "column")
+# Node list fields kept by projections, to join enrichment data and identify nodes
+NODE_KEY_FIELDS = ("BMC IPv4", "BMC MAC", "Host Name")
+# Field listing the enrichment fields that could not be fetched for a node, e.g. "Fru"
+PARTIAL_FIELD = "Partial"
+
+
+def add_enrichment_options(command):
+    """Add the options controlling how firmware/FRU data is fetched."""
+    command = click.option(
+        "--parallel",
+        default=4,
+        show_default=True,
+        type=click.IntRange(min=1),
+        help="Maximum number of firmware/FRU requests in flight.",
+    )(command)
+    command = click.option(
+        "--batch-size",
+        default=200,
+        show_default=True,
+        type=click.IntRange(min=0),
+        help="Maximum number of BMC IPs per firmware/FRU request. Use 0 to send all IPs in one request.",
+    )(command)
+    return command
+
+
+def plan_enrichment(format: str, columns: str, filters, sort_key: str) -> tuple:
+    """
+    Work out which data a listing needs and which filters can run before fetching enrichment.
+
+    A field of ENRICHMENT_ENDPOINTS is needed when a column, filter or sort key reads it,
+    or when the output format prints whole items. Filter expressions that only read node
+    list fields are combined into a predicate that can drop nodes before their firmware/FRU
+    data is requested. Expressions or sort keys that do not parse are left to the regular
+    pipeline to report, and then everything is fetched.
+
+    Args:
+        format (str): The output format.
+        columns (str): The columns the output reads, separated by commas. None reads all
+            of them, while an empty string reads none, e.g. for --agg count, which only
+            needs the node list.
+        filters (list): The filter expressions.
+        sort_key (str): The sort keys.
+
+    Returns:
+        tuple: (fields, early_filter, paths) with the list of needed enrichment fields, the
+            predicate or None when no filter can be applied early, and the set of key paths
+            the output reads, or None when whole items are needed.
+    """
+    from cli.query import FilterSyntaxError, compile_filter, compile_filters, parse_sort_keys, split_path
+
+    all_fields = [*ENRICHMENT_ENDPOINTS]
+    try:
+        compiled = [compile_filter(expression) for expression in filters or ()]
+        sort_paths = [key.path for key in parse_sort_keys(sort_key)] if sort_key else []
+    except (FilterSyntaxError, ValueError):
+        return all_fields, None, None
+
+    # The cluster and partial columns are only added once the results are merged
+    early = [
+        f.source
+        for f in compiled
+        if not any(path[0] in ENRICHMENT_ENDPOINTS or path[0] in (CLUSTER_FIELD, PARTIAL_FIELD) for path in f.paths)
+    ]
+    early_filter = compile_filters(early) if early else None
+
+    if format in FULL_ITEM_FORMATS or columns is None:
+        return all_fields, early_filter, None
+
+    paths = {split_path(column.strip()) for column in columns.split(",") if column.strip()} | set(sort_paths)
+    for compiled_filter in compiled:
+        paths |= compiled_filter.paths
+    referenced = {path[0] for path in paths}
+    return [field for field in all_fields if field in referenced], early_filter, paths
+
+
+def field_projection(paths, field: str = None):
+    """
+    Build the projection tree for the node list (field None) or for one enrichment field.
+
+    The node list always keeps the keys used to join enrichment data and to identify nodes.
+    """
+    from cli.jsonstream import build_projection
+
+    if paths is None:
+        return None
+    if field is None:
+        node_paths = {path for path in paths if path[0] not in ENRICHMENT_ENDPOINTS}
+        return build_projection(node_paths | {(key,) for key in NODE_KEY_FIELDS})
+    return build_projection({path[1:] for path in paths if path[0] == field})
+
+
+def fetch_nodes(paths=None) -> list:
+    """
+    Fetch the node list, parsing the response incrementally and keeping only the given key paths.
+
+    Args:
+        paths (set): Key paths to keep on every node, None keeps whole nodes.
+
+    Returns:
+        list: The nodes.
+
+    Raises:
+        requests.exceptions.HTTPError: If the server answers with an error status.
+        requests.exceptions.RequestException: If the server cannot be reached.
+    """
+    from cli.jsonstream import CHUNK_SIZE, iter_array, project
+
+    node_res = api_request(method="get", endpoint=NODE_LIST_ENDPOINT, stream=True)
+    node_res.raise_for_status()
+    tree = field_projection(paths)
+    return [project(node, tree) for node in iter_array(node_res.iter_content(CHUNK_SIZE))]
+
+
+def fetch_enrichment(node_ips, batch_size: int, parallel: int, fields=None, paths=None) -> dict:
+    """
+    Fetch firmware and FRU data for the given BMC IPs.
+
+    Both endpoints only depend on the node list, so they are fetched concurrently, split
+    into shards of at most batch_size IPs. Shards that still fail after retries are
+    reported as warnings and left out of the result.
+
+    Args:
+        node_ips (list): BMC IPs to fetch data for.
+        batch_size (int): Maximum number of IPs per request, 0 for one request per field.
+        parallel (int): Maximum number of requests in flight.
+        fields (list): Fields of ENRICHMENT_ENDPOINTS to fetch. Defaults to all of them.
+        paths (set): Key paths the output reads, as returned by plan_enrichment. Responses
+            are parsed incrementally and only the data under these paths is kept. None
+            keeps everything.
+
+    Returns:
+        dict: Field name to a dict of BMC IP to its data, for the requested fields. The
+            data of IPs whose shard could not be fetched is None.
+    """
+    if fields is None:
+        fields = [*ENRICHMENT_ENDPOINTS]
+    if not fields or not node_ips:
+        return {field: {} for field in fields}
+
+    from cli.jsonstream import CHUNK_SIZE, iter_object, project
+
+    enrichment_calls = {
+        field: {
+            "method": "post",
+            "endpoint": endpoint,
+            "json": node_ips,
+            "stream": True,
+            "headers": {
+                "Content-Type": "application/json",
+                "Accept": "application/json",
+            },
+        }
+        for field, endpoint in ENRICHMENT_ENDPOINTS.items()
+        if field in fields
+    }
+    trees = {field: field_projection(paths, field) for field in fields}
+
+    def parse(field, response):
+        return {ip: project(data, trees[field]) for ip, data in iter_object(response.iter_content(CHUNK_SIZE))}
+
+    enrichment, failures = fetch_sharded(enrichment_calls, batch_size=batch_size, parallel=parallel, parse=parse)
+
+    for field, shard, error in failures:
+        for ip in shard:
+            enrichment[field].setdefault(ip, None)
+        click.secho(
+            f"Warning: failed to fetch {field.lower()} data for {len(shard)} node(s), showing partial results "
+            f"marked in the '{PARTIAL_FIELD}' field: {error}",
+            fg="yellow",
+            err=True,
+        )
+    return enrichment
+
+
+def merge_enrichment(nodes, enrichment: dict) -> None:
+    """
+    Store the fetched firmware/FRU data of every node under its field, with an empty placeholder if there is none.
+
+    Nodes whose data could not be fetched get the placeholder as well, and the names of
+    the missing fields in PARTIAL_FIELD.
+    """
+    for node in nodes:
+        node_ipv4 = node.get("BMC IPv4")
+        for field, data in enrichment.items():
+            value = data.get(node_ipv4, {})
+            if value is None:
+                value = {}
+                node[PARTIAL_FIELD] = f"{node[PARTIAL_FIELD]},{field}" if PARTIAL_FIELD in node else field
+            node[field] = value
+
+
+def _all_columns_if_empty(ctx, param, value):
+    # An empty --columns prints every column, while plan_enrichment takes "" as reading none
+    return value or None
+
+
 @infra.command()
 @add_common_options
 @click.option(
     "--columns",
-    default="Host Name,BMC MAC,Fru.0.Product.ProductName,Power.Status,Status,BMC IPv4,Firmware.BMCImage1,Firmware.BIOS1",
+    default=DEFAULT_COLUMNS,
+    callback=_all_columns_if_empty,
     help="Specify columns to display in table/csv format, separated by commas. Defaults to all columns if not provided.",
 )
+@add_enrichment_options
+@add_cluster_options
 @general_decorator
-def list(format, filter, columns, sort_key, sort_order) -> None:
+@clusters_decorator
+def list(format, filter, columns, sort_key, sort_order, batch_size, parallel) -> None:
     """List all infrastructure resources with optional filtering."""
-    # Fetch node list
+    import requests
 
-    node_res = api_request(
-        method="get",
-        endpoint="/api/v1/infra/common/getNodeList?type=BMC",
-    )
+    # Only fetch the firmware/FRU data the output needs, and only for nodes that pass
+    # the filters on node list fields. Responses are parsed incrementally and only the
+    # fields the output reads are kept.
+    fields, early_filter, paths = plan_enrichment(format, columns, filter, sort_key)
+
+    # Fetch node list
 
     try:
-        node_res.raise_for_status()
+        nodes = fetch_nodes(paths)
     except requests.exceptions.HTTPError as http_err:
         click.secho(f"Error fetching data: {http_err}", fg="red")
-        click.secho(f"Response: {node_res.text}", fg="yellow")
+        click.secho(f"Response: {http_err.response.text}", fg="yellow")
         return
+    except requests.exceptions.RequestException as e:
+        raise click.ClickException(f"Error fetching data: {e}")
 
-    nodes = node_res.json()
+    if early_filter is not None:
+        nodes = [node for node in nodes if early_filter(node)]
 
-    firmware_res = api_request(
-        method="post",
-        endpoint="/api/v1/infra/getFirmwareVersion",
-        json=[node["BMC IPv4"] for node in nodes if "BMC IPv4" in node],
-        headers={
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-        },
-    )
+    if fields:
+        node_ips = [node["BMC IPv4"] for node in nodes if "BMC IPv4" in node]
+        enrichment = fetch_enrichment(node_ips, batch_size, parallel, fields, paths)
+        merge_enrichment(nodes, enrichment)
+
+    return nodes
+
+
+def _node_key(node) -> str:
+    return node.get("BMC MAC") or node.get("BMC IPv4") or node.get("Host Name")
 
-    fru_res = api_request(
-        method="post",
-        endpoint="/api/v1/infra/getFru",
-        json=[node["BMC IPv4"] for node in nodes if "BMC IPv4" in node],
-        headers={
-            "Content-Type": "application/json",
-            "Accept": "application/json",
-        },
+
+def _diff_rows(previous: dict, current: dict, columns) -> list:
+    """
+    Compare two polls of formatted rows keyed by node.
+
+    Returns:
+        list: Events in the order of the current poll followed by removed nodes. Each
+            event is a dict with "event" (added, changed or removed), "key" and "row",
+            and for changed rows "changes" mapping each changed column to its old and
+            new value.
+    """
+    events = []
+    for key, row in current.items():
+        old = previous.get(key)
+        if old is None:
+            events.append({"event": "added", "key": key, "row": row})
+        elif old != row:
+            changes = {
+                column: {"old": old_value, "new": new_value}
+                for column, old_value, new_value in zip(columns, old, row)
+                if old_value != new_value
+            }
+            events.append({"event": "changed", "key": key, "row": row, "changes": changes})
+    for key, row in previous.items():
+        if key not in current:
+            events.append({"event": "removed", "key": key, "row": row})
+    return events
+
+
+def _watch_table(columns, rows: dict, events: list, updated_at: str):
+    from rich.table import Table
+
+    styles = {event["key"]: "green" if event["event"] == "added" else "bold yellow" for event in events}
+    removed = sum(event["event"] == "removed" for event in events)
+    table = Table(
+        title=f"{len(rows)} node(s), updated {updated_at}",
+        caption=f"{len(events) - removed} changed, {removed} removed" if events else None,
     )
+    for column in columns:
+        table.add_column(column)
+    for key, row in rows.items():
+        table.add_row(*row, style=styles.get(key))
+    return table
+
+
+@infra.command()
+@click.option(
+    "--interval",
+    default=5.0,
+    show_default=True,
+    type=click.FloatRange(min=0.5),
+    help="Seconds between polls of the node list.",
+)
+@click.option(
+    "--full-interval",
+    default=300.0,
+    show_default=True,
+    type=click.FloatRange(min=0),
+    help="Seconds between full refreshes of firmware/FRU data. New nodes are always fetched right away.",
+)
+@click.option(
+    "--format",
+    default="table",
+    show_default=True,
+    type=click.Choice(["table", "ndjson"], case_sensitive=False),
+    help="Redraw changed rows in a live table, or print one JSON event per added, changed or removed node.",
+)
+@click.option("--columns", default=DEFAULT_COLUMNS, help="Columns to display and compare, separated by commas.")
+@click.option(
+    "--filter",
+    multiple=True,
+    help="Only watch nodes matching the filter expression (same syntax as infra list).",
+)
+@click.option(
+    "--count",
+    default=0,
+    type=click.IntRange(min=0),
+    help="Stop after this many polls. Defaults to polling until interrupted.",
+)
+@add_enrichment_options
+def watch(interval, full_interval, format, columns, filter, count, batch_size, parallel) -> None:
+    """Watch infrastructure resources and show changes as they happen."""
+    import json
+    import time
+    from datetime import datetime
+
+    import requests
+
+    from cli.decorator import row_formatter
+    from cli.query import FilterSyntaxError, compile_filters
 
     try:
-        firmware_res.raise_for_status()
-        fru_res.raise_for_status()
-    except requests.exceptions.HTTPError as http_err:
-        click.secho(f"Error fetching firmware data: {http_err}", fg="red")
-        click.secho(f"Response: {firmware_res.text}", fg="yellow")
+        predicate = compile_filters(filter) if filter else None
+    except FilterSyntaxError as e:
+        click.secho(f"Invalid filter condition: {e}", fg="red")
         return
 
-    firmware = firmware_res.json()
-    fru = fru_res.json()
+    fields, early_filter, paths = plan_enrichment(format, columns, filter, None)
+    columns = [column.strip() for column in columns.split(",")]
+    format_row = row_formatter(columns)
 
-    # Combine nodes and firmware data
-    combined_data = nodes.copy()
-    for node in combined_data:
-        node_ipv4 = node.get("BMC IPv4")
-        if node_ipv4 and node_ipv4 in firmware:
-            # Merge firmware data into the node dictionary
-            node.update({"Firmware": firmware[node_ipv4]})
-            node.update({"Fru": fru[node_ipv4]})
-        else:
-            # If no firmware data is available, add a placeholder
-            node.update({"Firmware": {}})
-            node.update({"Fru": {}})
-
-    data = combined_data
-
-    return data
+    enrichment = {field: {} for field in fields}
+    enriched_ips = set()
+    last_full_refresh = None
+    rows = {}
+    live = None
+
+    if format == "table":
+        from rich.console import Console
+        from rich.live import Live
+
+        live = Live(console=Console(), auto_refresh=False)
+        live.start()
+
+    polls = 0
+    try:
+        while True:
+            started = time.monotonic()
+            polls += 1
+            full_refresh = last_full_refresh is None or started - last_full_refresh >= full_interval
+
+            try:
+                node_res = api_request(method="get", endpoint=NODE_LIST_ENDPOINT, show_status=False, conditional=True)
+                node_res.raise_for_status()
+            except requests.exceptions.RequestException as e:
+                click.secho(f"Warning: failed to fetch the node list, retrying: {e}", fg="yellow", err=True)
+                node_res = None
+
+            # An unchanged node list only needs work when firmware/FRU data is due
+            if node_res is not None and (full_refresh or not node_res.not_modified):
+                nodes = node_res.json()
+                if early_filter is not None:
+                    nodes = [node for node in nodes if early_filter(node)]
+                node_ips = [node["BMC IPv4"] for node in nodes if "BMC IPv4" in node]
+
+                if full_refresh:
+                    enrichment = fetch_enrichment(node_ips, batch_size, parallel, fields, paths)
+                    enriched_ips = set(node_ips)
+                    last_full_refresh = started
+                else:
+                    new_ips = [ip for ip in node_ips if ip not in enriched_ips]
+                    if new_ips:
+                        for field, data in fetch_enrichment(new_ips, batch_size, parallel, fields, paths).items():
+                            enrichment[field].update(data)
+                        enriched_ips.update(new_ips)
+
+                merge_enrichment(nodes, enrichment)
+                if predicate is not None:
+                    nodes = [node for node in nodes if predicate(node)]
+
+                current = {_node_key(node): format_row(node) for node in nodes}
+                events = _diff_rows(rows, current, columns)
+                rows = current
+                updated_at = datetime.now().isoformat(timespec="seconds")
+
+                if live is not None:
+                    # Rows are formatted once per poll and the screen is only redrawn when one changed
+                    if events or polls == 1:
+                        live.update(_watch_table(columns, rows, events, updated_at), refresh=True)
+                else:
+                    for event in events:
+                        event["time"] = updated_at
+                        event["row"] = dict(zip(columns, event["row"]))
+                        click.echo(json.dumps(event, ensure_ascii=False))
+                    sys.stdout.flush()
+
+            if count and polls >= count:
+                break
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if live is not None:
+            live.stop()
+
+
+def fetch_inventory(batch_size: int, parallel: int, filters=None) -> list:
+    """
+    Fetch all nodes with their complete firmware and FRU data.
+
+    Args:
+        batch_size (int): Maximum number of IPs per firmware/FRU request.
+        parallel (int): Maximum number of firmware/FRU requests in flight.
+        filters (list): Only return nodes matching these filter expressions.
+
+    Returns:
+        list: The merged nodes.
+
+    Raises:
+        click.ClickException: If the node list cannot be fetched or a filter is invalid.
+    """
+    import requests
+
+    from cli.query import FilterSyntaxError, compile_filters
+
+    try:
+        predicate = compile_filters(filters) if filters else None
+    except FilterSyntaxError as e:
+        raise click.ClickException(f"Invalid filter condition: {e}")
+
+    try:
+        nodes = fetch_nodes()
+    except requests.exceptions.RequestException as e:
+        raise click.ClickException(f"Error fetching data: {e}")
+
+    node_ips = [node["BMC IPv4"] for node in nodes if "BMC IPv4" in node]
+    merge_enrichment(nodes, fetch_enrichment(node_ips, batch_size, parallel))
+    if predicate is not None:
+        nodes = [node for node in nodes if predicate(node)]
+    return nodes
+
+
+@infra.group()
+def snapshot():
+    """Save inventory snapshots and compare them."""
+    pass
+
+
+@snapshot.command()
+@click.argument("file", type=click.Path(dir_okay=False, writable=True), required=False)
+@click.option("--filter", multiple=True, help="Only save nodes matching the filter expression (same syntax as infra list).")
+@add_enrichment_options
+def save(file, filter, batch_size, parallel) -> None:
+    """
+    Save the merged node, firmware and FRU data to a compressed snapshot FILE.
+
+    FILE defaults to snapshot-<date>-<time>.ndjson.gz in the current directory.
+    """
+    from datetime import datetime
+
+    from cli.snapshot import write_snapshot
+    from cli.config import Config
+
+    nodes = fetch_inventory(batch_size, parallel, filter)
+    file = file or f"snapshot-{datetime.now():%Y%m%d-%H%M%S}.ndjson.gz"
+    config = Config.load()
+    write_snapshot(file, nodes, server=config.target_server if config else None)
+    click.secho(f"Saved {len(nodes)} node(s) to {file}.", fg="green", err=True)
+
+
+@snapshot.command(context_settings={"default_map": {"format": "ndjson"}})
+@add_common_options
+@click.argument("old", type=click.Path(exists=True, dir_okay=False))
+@click.argument("new", type=click.Path(exists=True, dir_okay=False), required=False)
+@click.option(
+    "--columns",
+    default=None,
+    help="Specify columns to display in table/csv format, separated by commas. "
+    "Change rows have key, Host Name, change, field, old and new.",
+)
+@add_enrichment_options
+@general_decorator
+def diff(format, filter, columns, sort_key, sort_order, old, new, batch_size, parallel) -> list:
+    """
+    Compare snapshot OLD with snapshot NEW, or with the live inventory if NEW is omitted.
+
+    Nodes are matched by BMC MAC. Every added or removed node gives one row, and every
+    changed field of a node one row with its dotted path and old and new value, e.g. to
+    track a firmware rollout with --filter "field~^Firmware". A summary is printed to stderr.
+    OLD and NEW may also be `infra list --format ndjson` output, of which only the listed
+    fields are compared.
+    """
+    from cli.snapshot import diff_nodes, read_snapshot
+
+    try:
+        old_header, old_nodes = read_snapshot(old)
+        new_header, new_nodes = read_snapshot(new) if new else ({}, fetch_inventory(batch_size, parallel))
+        # Plain NDJSON listings hold only their --columns, so the fields they leave out are not compared
+        common_fields = old_header is None or new_header is None
+        rows = [*diff_nodes(old_nodes, new_nodes, _node_key, common_fields=common_fields)]
+    except (OSError, ValueError) as e:
+        raise click.ClickException(str(e))
+
+    counts = {"added": set(), "removed": set(), "changed": set()}
+    for row in rows:
+        counts[row["change"]].add(row["key"])
+    click.secho(
+        f"{len(counts['added'])} added, {len(counts['removed'])} removed, {len(counts['changed'])} changed node(s), "
+        f"{sum(row['change'] == 'changed' for row in rows)} changed field(s).",
+        fg="cyan",
+        err=True,
+    )
+    return rows
 
 
 # @infra.command()
@@ -1,12 +1,16 @@
 import click
-import requests
-from rich.console import Console
 
-from cli.decorator import general_decorator, add_common_options, format_decorator
+from cli.decorator import (
+    ByteSize,
+    general_decorator,
+    add_cluster_options,
+    add_common_options,
+    add_format_options,
+    clusters_decorator,
+    format_decorator,
+)
 from cli.utils import api_request
 
-console = Console()
-
 
 @click.group()
 def provision():
@@ -19,9 +23,13 @@ def provision():
 @click.option(
     "--columns",
 )
+@add_cluster_options
 @general_decorator
+@clusters_decorator
 def osimg_list(format, filter, columns, sort_key, sort_order) -> None:
     """List all image resources with optional filtering."""
+    import requests
+
     # Fetch image list
 
     images_res = api_request(
@@ -47,6 +55,8 @@ def osimg_list(format, filter, columns, sort_key, sort_order) -> None:
     help="OS image ID",
 )
 def osimg_delete(id: str) -> None:
+    import requests
+
     # Delete image
 
     image_res = api_request(
@@ -66,45 +76,138 @@ def osimg_delete(id: str) -> None:
 
 
 @provision.command()
-@click.option(
-    "--format",
-    default="raw",
-    type=click.Choice(["csv", "column", "json", "raw", "table"], case_sensitive=False),
-    help="Specify the output format for the command. Options include 'csv', 'column', 'json', 'raw', and 'table'. Default is 'raw'.",
-)
+@add_format_options
 @click.option(
     "--osimage",
-    required=True,
     help="OS image file",
 )
 @click.option(
     "--title",
-    required=True,
     help="Title for the os image.",
 )
 @click.option(
     "--name",
-    required=True,
     help="Name of the os image.",
 )
 @click.option(
     "--architecture",
-    required=True,
     help="Architecture the os image supports.",
 )
+@click.option(
+    "--manifest",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="Upload every image listed in this JSON or CSV file (fields: path, name, title, architecture) "
+    "instead of a single --osimage.",
+)
+@click.option(
+    "--parallel",
+    default=2,
+    show_default=True,
+    type=click.IntRange(min=1),
+    help="Maximum number of images uploaded at the same time with --manifest.",
+)
+@click.option(
+    "--bandwidth",
+    type=ByteSize(),
+    default=None,
+    help="Cap the combined upload bandwidth in bytes per second (e.g. '50M').",
+)
+@click.option(
+    "--chunk-size",
+    type=ByteSize(),
+    default=None,
+    help="Upload in resumable chunks of this size (e.g. '64M'). Without it the image is streamed in one request.",
+)
+@click.option(
+    "--resume/--no-resume",
+    default=True,
+    help="Continue an interrupted chunked upload of the same file from the last confirmed offset. Default is to resume.",
+)
+@click.option(
+    "--on-duplicate",
+    default="skip",
+    show_default=True,
+    type=click.Choice(["skip", "fail", "upload"], case_sensitive=False),
+    help="What to do with images whose content is already on the server, checked by SHA-256 before "
+    "any bytes are sent: skip them, fail without uploading anything, or upload them anyway without checking.",
+)
 @general_decorator
-def osimg_upload(format, architecture: str, name: str, title: str, osimage: str) -> None:
-    """Upload os image."""
-    queries = f"architecture={architecture}&name={name}&title={title}"
+def osimg_upload(
+    format,
+    architecture: str,
+    name: str,
+    title: str,
+    osimage: str,
+    manifest: str,
+    parallel: int,
+    bandwidth: int,
+    chunk_size: int,
+    resume: bool,
+    on_duplicate: str,
+) -> None:
+    """Upload os image, or several images listed in a manifest."""
+    import requests
+
+    from cli.upload import BandwidthLimiter, load_manifest, upload_image, upload_images
+
+    limiter = BandwidthLimiter(bandwidth) if bandwidth else None
+
+    if manifest:
+        if osimage:
+            raise click.UsageError("--osimage cannot be combined with --manifest.")
+        try:
+            images = load_manifest(manifest)
+        except (OSError, ValueError) as e:
+            raise click.UsageError(f"Invalid manifest: {e}")
+
+        pending, existing = _skip_duplicates(images, on_duplicate, parallel)
+        uploaded = []
+        for image, result in upload_images(
+            pending, chunk_size=chunk_size, resume=resume, parallel=parallel, limiter=limiter
+        ):
+            if isinstance(result, Exception):
+                click.secho(f"Error upload os image {image['name']}: {result}", fg="red", err=True)
+                continue
+            upload_res, sha256 = result
+            if not upload_res.ok:
+                click.secho(
+                    f"Error upload os image {image['name']}: {upload_res.status_code} {upload_res.text}",
+                    fg="red",
+                    err=True,
+                )
+                continue
+            click.secho(f"{image['name']}: SHA-256: {sha256}", err=True)
+            uploaded.append(upload_res.json())
+
+        skipped = f", {len(existing)} already on the server" if existing else ""
+        click.secho(
+            f"Uploaded {len(uploaded)} of {len(images)} image(s){skipped}.",
+            fg="green" if len(uploaded) == len(pending) else "yellow",
+            err=True,
+        )
+        return existing + uploaded
+
+    missing = [
+        f"--{option}"
+        for option, value in (("osimage", osimage), ("title", title), ("name", name), ("architecture", architecture))
+        if not value
+    ]
+    if missing:
+        raise click.UsageError(f"Missing option(s) {', '.join(missing)} (or use --manifest).")
+
+    pending, existing = _skip_duplicates([{"path": osimage, "name": name}], on_duplicate, parallel)
+    if existing:
+        return existing
 
     try:
-        with open(osimage, 'rb') as f:
-            myfiles = {'content': f}
-            upload_res = api_request(
-                method="post",
-                endpoint=f"/api/v1/provision/osimg?{queries}",
-                files=myfiles,
-            )
+        upload_res, sha256 = upload_image(
+            osimage,
+            {"architecture": architecture, "name": name, "title": title},
+            chunk_size=chunk_size,
+            resume=resume,
+            limiter=limiter,
+        )
     except Exception as e:
         click.secho(f"Error upload os image: {str(e)}", fg="red")
         exit()
@@ -116,6 +219,62 @@ def osimg_upload(format, architecture: str, name: str, title: str, osimage: str)
         click.secho(f"Response: {upload_res.text}", fg="yellow")
         return
 
+    click.secho(f"SHA-256: {sha256}", err=True)
     upload_json = upload_res.json()
 
     return [upload_json]
+
+
+def _skip_duplicates(images: list, on_duplicate: str, parallel: int) -> tuple:
+    """
+    Check which images are already on the server before uploading any of them.
+
+    Args:
+        images (list): Dicts with the path and name of every image.
+        on_duplicate (str): "skip" leaves duplicates out, "fail" aborts the command when
+            there is one, and "upload" skips the check.
+        parallel (int): Maximum number of files hashed at the same time.
+
+    Returns:
+        tuple: (pending, existing) with the images to upload and the os images already
+            on the server for the others.
+
+    Raises:
+        click.ClickException: With on_duplicate "fail", if an image is already on the server.
+    """
+    import requests
+
+    from cli.upload import fetch_catalogue, find_duplicates
+
+    if on_duplicate == "upload":
+        return images, []
+
+    try:
+        catalogue = fetch_catalogue()
+    except requests.exceptions.RequestException as e:
+        click.secho(f"Warning: could not fetch the os images, not checking for duplicates: {e}", fg="yellow", err=True)
+        return images, []
+
+    duplicates = find_duplicates(images, catalogue, parallel=parallel)
+    if not duplicates:
+        return images, []
+
+    pending, existing, found = [], [], []
+    for image in images:
+        if image["path"] not in duplicates:
+            pending.append(image)
+            continue
+        sha256, existing_image = duplicates[image["path"]]
+        existing.append(existing_image)
+        found.append(
+            f"{image['name']} is already on the server as os image {existing_image.get('id')} "
+            f"({existing_image.get('name')}), SHA-256: {sha256}"
+        )
+
+    if on_duplicate == "fail":
+        raise click.ClickException(
+            "Nothing was uploaded. " + "; ".join(found) + ". Use --on-duplicate upload to upload anyway."
+        )
+    for message in found:
+        click.secho(f"{message}, skipping upload.", fg="yellow", err=True)
+    return pending, existing
@@ -0,0 +1,171 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_TIMEOUT = 30.0
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 16
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+# Seconds to wait for the response to an upload, which the server answers once it stored the image
+UPLOAD_READ_TIMEOUT = 30 * 60.0
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTP adapter that applies a default timeout to every request sent through it."""
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT, *args, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+_lock = threading.Lock()
+_session = None
+DEFAULT_SETTINGS = {
+    "timeout": DEFAULT_TIMEOUT,
+    "pool_connections": DEFAULT_POOL_CONNECTIONS,
+    "pool_maxsize": DEFAULT_POOL_MAXSIZE,
+    "retries": DEFAULT_RETRIES,
+    "backoff_factor": DEFAULT_BACKOFF_FACTOR,
+}
+_settings = dict(DEFAULT_SETTINGS)
+
+
+def configure_session(**settings) -> None:
+    """
+    Update the settings used for the process-wide HTTP session.
+
+    If the settings change, the existing session is closed so the next call to
+    get_session() builds a new one with the updated connection pool, timeout and
+    retry policy. Otherwise the warm session is kept.
+
+    Args:
+        **settings: Any of timeout, pool_connections, pool_maxsize, retries and backoff_factor.
+            Settings passed as None keep their current value.
+    """
+    unknown = set(settings) - set(_settings)
+    if unknown:
+        raise ValueError(f"Unknown session settings: {', '.join(sorted(unknown))}")
+
+    changes = {key: value for key, value in settings.items() if value is not None and _settings[key] != value}
+    if not changes:
+        return
+
+    with _lock:
+        _settings.update(changes)
+    close_session()
+
+
+def session_settings() -> dict:
+    """Return a copy of the current session settings, which configure_session() accepts to restore them."""
+    return dict(_settings)
+
+
+def upload_timeout() -> tuple:
+    """
+    Return the (connect, read) timeout for requests that upload a file.
+
+    Connecting is bounded by the session timeout. Waiting for the response is bounded by
+    UPLOAD_READ_TIMEOUT, as the server may take much longer than that to store and verify
+    a large image.
+    """
+    return (_settings["timeout"], max(UPLOAD_READ_TIMEOUT, _settings["timeout"]))
+
+
+def _build_session() -> requests.Session:
+    retry = Retry(
+        total=_settings["retries"],
+        connect=_settings["retries"],
+        read=_settings["retries"],
+        status=_settings["retries"],
+        backoff_factor=_settings["backoff_factor"],
+        status_forcelist=RETRY_STATUS_CODES,
+        raise_on_status=False,
+    )
+    adapter = TimeoutHTTPAdapter(
+        timeout=_settings["timeout"],
+        pool_connections=_settings["pool_connections"],
+        pool_maxsize=_settings["pool_maxsize"],
+        max_retries=retry,
+    )
+
+    session = requests.Session()
+    session.headers.update({"Connection": "keep-alive"})
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide HTTP session, creating it on first use.
+
+    The session keeps connections alive between calls, so consecutive requests
+    (and consecutive commands run in the same process) reuse the same TCP/TLS
+    connection to the server.
+
+    Returns:
+        Session: The shared requests session.
+    """
+    global _session
+
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def close_session() -> None:
+    """
+    Close the process-wide HTTP session and release its pooled connections.
+    """
+    global _session
+
+    with _lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def session_stats() -> dict:
+    """
+    Collect connection reuse counters from the pools of the current session.
+
+    Returns:
+        dict: Totals for requests sent, connections opened and connections reused,
+            plus a per-host breakdown.
+    """
+    stats = {"requests": 0, "connections": 0, "reused": 0, "hosts": {}}
+    if _session is None:
+        return stats
+
+    seen = set()
+    for adapter in _session.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            host = f"{pool.scheme}://{pool.host}:{pool.port}"
+            host_stats = stats["hosts"].setdefault(host, {"requests": 0, "connections": 0, "reused": 0})
+            host_stats["requests"] += pool.num_requests
+            host_stats["connections"] += pool.num_connections
+            host_stats["reused"] += max(pool.num_requests - pool.num_connections, 0)
+
+    for host_stats in stats["hosts"].values():
+        for key in ("requests", "connections", "reused"):
+            stats[key] += host_stats[key]
+    return stats
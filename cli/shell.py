@@ -0,0 +1,154 @@
+import shlex
+
+import click
+
+from cli.utils import CONFIG_FILE
+
+HISTORY_FILE = CONFIG_FILE.parent / "shell_history"
+EXIT_COMMANDS = ("exit", "quit")
+
+
+def command_defaults() -> dict:
+    """
+    Return the settings that global options store in module state, to restore them later.
+
+    Returns:
+        dict: The session settings, and whether the agent and adaptive timeouts are enabled.
+    """
+    from cli.agent import agent_client
+    from cli.latency import endpoint_monitor
+    from cli.session import session_settings
+
+    return {"session": session_settings(), "agent": agent_client.enabled, "adaptive": endpoint_monitor.enabled}
+
+
+def _reset_command_state(defaults: dict = None) -> None:
+    """
+    Undo per-command options that are stored in module state, such as --refresh, --profile and --timeout.
+
+    Args:
+        defaults (dict): Settings from command_defaults() to restore. Defaults to the built-in ones.
+    """
+    from cli.agent import agent_client
+    from cli.latency import endpoint_monitor
+    from cli.profiling import profiler
+    from cli.session import DEFAULT_SETTINGS, configure_session
+    from cli.utils import response_cache
+
+    response_cache.enabled = True
+    response_cache.refresh = False
+    profiler.enabled = False
+    profiler.spans = []
+    if defaults is None:
+        defaults = {"session": DEFAULT_SETTINGS, "agent": True, "adaptive": True}
+    # Keeps the warm session unless an earlier command changed its settings
+    configure_session(**defaults["session"])
+    agent_client.enabled = defaults["agent"]
+    endpoint_monitor.enabled = defaults["adaptive"]
+
+
+def run_command(args: list, defaults: dict = None) -> None:
+    """
+    Run one CLI command in this process.
+
+    Errors are reported the way the standalone CLI reports them, but never end the shell:
+    failed requests and unexpected errors are printed as well.
+
+    Args:
+        args (list): Command line arguments without the program name, e.g. ["infra", "list"].
+        defaults (dict): Settings from command_defaults() that the global options of the
+            previous command may have changed. Defaults to the built-in ones.
+    """
+    import requests
+
+    from cli.commands import cli
+
+    _reset_command_state(defaults)
+    try:
+        cli.main(args, prog_name="podmanager-cli", standalone_mode=False)
+    except click.exceptions.Abort:
+        click.secho("Aborted!", fg="red", err=True)
+    except click.ClickException as e:
+        e.show()
+    except SystemExit:
+        # Some commands call exit() on errors
+        pass
+    except KeyboardInterrupt:
+        click.secho("Interrupted.", fg="yellow", err=True)
+    except requests.exceptions.RequestException as e:
+        click.secho(f"Request failed: {e}", fg="red", err=True)
+    except Exception as e:
+        click.secho(f"Error: {type(e).__name__}: {e}", fg="red", err=True)
+
+
+@click.command()
+def shell():
+    """Start an interactive shell that runs commands in one process."""
+    try:
+        import readline
+    except ImportError:
+        readline = None
+
+    from cli.session import get_session
+    from cli.config import Config
+
+    if readline is not None:
+        try:
+            readline.read_history_file(HISTORY_FILE)
+        except OSError:
+            pass
+
+    # Global options given before `shell` apply to every command, those given to a
+    # command in the shell only to that command
+    defaults = command_defaults()
+
+    # Warm up what every command needs: the session, the decoded token and the imports
+    # of the service modules
+    get_session()
+    config = Config.load()
+    import cli.services.infrastructure  # noqa: F401
+    import cli.services.provision  # noqa: F401
+
+    if config:
+        click.secho(f"Connected to {config.target_server}.", fg="green")
+    else:
+        click.secho("Not logged in. Run 'login' first.", fg="yellow")
+    click.echo("Type 'help' for the list of commands and 'exit' to quit.")
+
+    try:
+        while True:
+            try:
+                line = input("podmanager> ")
+            except KeyboardInterrupt:
+                click.echo()
+                continue
+            except EOFError:
+                click.echo()
+                break
+
+            try:
+                args = shlex.split(line)
+            except ValueError as e:
+                click.secho(f"Invalid command line: {e}", fg="red")
+                continue
+
+            if not args:
+                continue
+            if args[0] == "podmanager-cli":
+                args = args[1:]
+            if args and args[0] in EXIT_COMMANDS:
+                break
+            if args and args[0] == "help":
+                args = args[1:] + ["--help"]
+            if args and args[0] == "shell":
+                click.secho("Already in the shell.", fg="yellow")
+                continue
+
+            run_command(args, defaults)
+    finally:
+        if readline is not None:
+            try:
+                HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
+                readline.write_history_file(HISTORY_FILE)
+            except OSError:
+                pass
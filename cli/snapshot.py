@@ -0,0 +1,155 @@
+import gzip
+import json
+from datetime import datetime
+
+SNAPSHOT_VERSION = 1
+GZIP_MAGIC = b"\x1f\x8b"
+# Faster than the default of 9 and barely larger for JSON inventories
+COMPRESS_LEVEL = 6
+
+
+def write_snapshot(path, nodes, server: str = None) -> None:
+    """
+    Write nodes to a gzip-compressed snapshot file.
+
+    The file holds one header line, then one compact JSON object per node, so it can be
+    written and read one node at a time.
+
+    Args:
+        path: File to write.
+        nodes (list): The merged node, firmware and FRU data.
+        server (str): URL of the server the data came from.
+    """
+    header = {
+        "snapshot": SNAPSHOT_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "server": server,
+        "nodes": len(nodes),
+    }
+    with gzip.open(path, "wt", compresslevel=COMPRESS_LEVEL, encoding="utf-8") as file:
+        file.write(json.dumps(header))
+        file.write("\n")
+        for node in nodes:
+            file.write(json.dumps(node, separators=(",", ":"), default=str))
+            file.write("\n")
+
+
+def read_snapshot(path) -> tuple:
+    """
+    Open a snapshot file for reading.
+
+    Besides files written by write_snapshot, plain or gzip-compressed newline-delimited
+    JSON such as the output of `infra list --format ndjson` is accepted.
+
+    Returns:
+        tuple: (header, nodes) where header is the snapshot header, or None for plain
+            NDJSON, and nodes an iterator over the nodes that closes the file when done.
+
+    Raises:
+        ValueError: If the file is not a snapshot or NDJSON.
+    """
+    with open(path, "rb") as file:
+        compressed = file.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+    file = gzip.open(path, "rt", encoding="utf-8") if compressed else open(path, "r", encoding="utf-8")
+
+    try:
+        first = file.readline()
+        header = json.loads(first) if first.strip() else None
+    except (OSError, ValueError) as e:
+        file.close()
+        raise ValueError(f"{path} is not a snapshot or NDJSON file: {e}")
+    if header is not None and not isinstance(header, dict):
+        file.close()
+        raise ValueError(f"{path} is not a snapshot or NDJSON file")
+
+    def nodes(pending):
+        with file:
+            if pending is not None:
+                yield pending
+            for number, line in enumerate(file, start=2):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"Invalid JSON on line {number} of {path}: {e}")
+
+    if header is not None and "snapshot" in header:
+        return header, nodes(None)
+    return None, nodes(header)
+
+
+def flatten(value, prefix: str = "", out: dict = None) -> dict:
+    """
+    Flatten nested dicts into dotted paths, e.g. {"Power": {"Status": "On"}} to {"Power.Status": "On"}.
+
+    Lists and other values are kept as they are.
+    """
+    if out is None:
+        out = {}
+    for key, item in value.items():
+        path = f"{prefix}{key}"
+        if isinstance(item, dict) and item:
+            flatten(item, f"{path}.", out)
+        else:
+            out[path] = item
+    return out
+
+
+def diff_nodes(old_nodes, new_nodes, key, common_fields: bool = False):
+    """
+    Compare two sets of nodes by key in one pass over each.
+
+    The old nodes are indexed by key, then every new node is looked up and removed from
+    the index, so what is left at the end was removed. Nodes are compared by their
+    flattened dotted fields, so nested snapshot nodes and the flat rows of
+    `infra list --format ndjson` match field by field.
+
+    Args:
+        old_nodes: Iterable of the old nodes.
+        new_nodes: Iterable of the new nodes.
+        key (callable): Returns the identity of a node, e.g. its BMC MAC.
+        common_fields (bool): Only compare the fields both nodes have, for listings that
+            hold the selected columns only.
+
+    Yields:
+        dict: One row per change with "key", "Host Name", "change" (added, removed or
+            changed), and for changed nodes the dotted "field" with its "old" and "new" value.
+    """
+    index = {key(node): node for node in old_nodes}
+
+    for node in new_nodes:
+        node_key = key(node)
+        old = index.pop(node_key, None)
+        if old is None:
+            yield _change_row(node_key, node, "added")
+            continue
+        if old == node:
+            # Most nodes are unchanged, which a plain comparison settles without flattening
+            continue
+
+        old_fields, new_fields = flatten(old), flatten(node)
+        for field, new_value in new_fields.items():
+            if common_fields and field not in old_fields:
+                continue
+            old_value = old_fields.pop(field, None)
+            if old_value != new_value:
+                yield _change_row(node_key, node, "changed", field, old_value, new_value)
+        if common_fields:
+            continue
+        for field, old_value in old_fields.items():
+            yield _change_row(node_key, node, "changed", field, old_value, None)
+
+    for node_key, node in index.items():
+        yield _change_row(node_key, node, "removed")
+
+
+def _change_row(node_key, node, change: str, field: str = None, old=None, new=None) -> dict:
+    return {
+        "key": node_key,
+        "Host Name": node.get("Host Name"),
+        "change": change,
+        "field": field,
+        "old": old,
+        "new": new,
+    }
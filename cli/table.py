@@ -0,0 +1,130 @@
+from cli.query import MISSING, path_getter, sort_positions, split_path
+
+
+class ColumnTable:
+    """
+    Columnar view of a list of items for the filter, sort and render stages.
+
+    Every key path is resolved once into a list of values indexed by item position (see
+    column()). Tables derived by filtering, sorting or slicing share the items, only hold
+    their own list of row indices and inherit the columns resolved so far, so items are
+    never copied and nested paths are never walked twice. Columns first needed by a
+    derived table are only resolved for its rows.
+
+    Iterating a table or indexing it with an int yields items in row order, and slicing
+    returns a table, so it can stand in for the list of items it was built from.
+
+    Args:
+        items (list): The items.
+        rows: Indices of the items in this table, in order. Defaults to all items.
+    """
+
+    __slots__ = ("items", "rows", "_columns")
+
+    def __init__(self, items, rows=None, _columns=None):
+        self.items = items if isinstance(items, list) else list(items)
+        self.rows = range(len(self.items)) if rows is None else rows
+        self._columns = {} if _columns is None else _columns
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        items = self.items
+        return (items[row] for row in self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._derive(self.rows[index])
+        return self.items[self.rows[index]]
+
+    def __repr__(self):
+        return f"ColumnTable({len(self.rows)} of {len(self.items)} rows)"
+
+    def _derive(self, rows) -> "ColumnTable":
+        # The rows of a derived table are a subset of these, so every column resolved
+        # so far is valid for it
+        return ColumnTable(self.items, rows, dict(self._columns))
+
+    def column(self, path: tuple) -> list:
+        """
+        Return the values at a key path by item position, resolved for the rows of this table.
+
+        Values follow path_getter: None where the last key is missing, MISSING where the
+        path runs through a value that is not a dict.
+        """
+        values = self._columns.get(path)
+        if values is None:
+            get = path_getter(path)
+            items = self.items
+            if isinstance(self.rows, range) and len(self.rows) == len(items):
+                values = [get(item) for item in items]
+            else:
+                values = [MISSING] * len(items)
+                for row in self.rows:
+                    values[row] = get(items[row])
+            self._columns[path] = values
+        return values
+
+    def getter(self, path: tuple):
+        """
+        Build a function returning the value at a key path for a row index.
+
+        Used as the getter of cli.query.compile_filters, to compile filters over row indices.
+        """
+        return self.column(path).__getitem__
+
+    def to_list(self) -> list:
+        """Return the items in row order."""
+        items = self.items
+        return [items[row] for row in self.rows]
+
+    def where(self, predicate) -> "ColumnTable":
+        """Return the rows for whose index predicate is true."""
+        return self._derive([row for row in self.rows if predicate(row)])
+
+    def sorted(self, keys: list, limit: int = None) -> "ColumnTable":
+        """
+        Return the rows sorted by SortKey objects, see cli.query.sort_rows.
+
+        Args:
+            keys (list): SortKey objects, most significant first.
+            limit (int): Only keep the first limit rows.
+        """
+        if not keys:
+            return self[:limit] if limit is not None else self
+
+        rows = self.rows
+        all_rows = isinstance(rows, range) and len(rows) == len(self.items)
+        values = []
+        for key in keys:
+            column = self.column(key.path)
+            values.append(column if all_rows else [column[row] for row in rows])
+        return self._derive([rows[position] for position in sort_positions(keys, values, limit=limit)])
+
+    def values(self, column: str) -> list:
+        """Return the values of a dotted column for the rows, MISSING where it cannot be resolved."""
+        path = split_path(column)
+        values = self.column(path)
+        result = [values[row] for row in self.rows]
+        if None in result:
+            # Columns hold None for a missing last key as well as for an explicit null,
+            # only the latter is a value
+            get = path_getter(path, default=MISSING)
+            items = self.items
+            for index, row in enumerate(self.rows):
+                if result[index] is None:
+                    result[index] = get(items[row])
+        return result
+
+    def cells(self, columns: list):
+        """
+        Return the display values of the rows for the given dotted columns.
+
+        Returns:
+            iterator: One tuple of strings per row, with empty strings for missing values.
+        """
+        strings = []
+        for column in columns:
+            strings.append(["" if value is MISSING else str(value) for value in self.values(column)])
+        return zip(*strings)
@@ -0,0 +1,669 @@
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
+import requests
+from rich.console import Console
+from rich.progress import (
+    BarColumn,
+    DownloadColumn,
+    Progress,
+    TextColumn,
+    TimeRemainingColumn,
+    TransferSpeedColumn,
+)
+
+from cli.session import upload_timeout
+from cli.config import Config
+from cli.utils import CONFIG_FILE, api_request
+
+READ_BLOCK_SIZE = 1024 * 1024
+UPLOADS_ENDPOINT = "/api/v1/provision/osimg/uploads"
+UPLOAD_STATE_FILE = CONFIG_FILE.parent / "uploads.json"
+# SHA-256 of local image files by absolute path, valid while their size and mtime are unchanged
+HASH_CACHE_FILE = CONFIG_FILE.parent / "hashes.json"
+# SHA-256 of the images uploaded from here, by server, mapped to the os image they became
+IMAGE_INDEX_FILE = CONFIG_FILE.parent / "images.json"
+OSIMG_ENDPOINT = "/api/v1/provision/osimg"
+# Catalogue fields that hold the SHA-256 of an image, when the server reports one
+CATALOGUE_HASH_FIELDS = ("sha256", "checksum")
+
+MANIFEST_FIELDS = ("path", "name", "title", "architecture")
+
+console = Console()
+_state_lock = threading.Lock()
+_index_lock = threading.Lock()
+
+
+def create_progress() -> Progress:
+    """Create a progress display with throughput and ETA columns for uploads."""
+    return Progress(
+        TextColumn("[bold blue]{task.description}"),
+        BarColumn(),
+        DownloadColumn(),
+        TransferSpeedColumn(),
+        TimeRemainingColumn(),
+        console=console,
+    )
+
+
+class BandwidthLimiter:
+    """
+    Token bucket shared by concurrent uploads to cap their combined throughput.
+
+    Readers take tokens for the bytes they read and sleep when the bucket runs dry, so
+    the cap holds across all streams using the same limiter. The bucket starts empty and
+    holds at most one read block, so even short transfers stay under the cap.
+    """
+
+    def __init__(self, rate: int):
+        self.rate = rate
+        self.capacity = READ_BLOCK_SIZE
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, size: int) -> None:
+        """Take size bytes worth of tokens, waiting until they are available."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate) - size
+            self.updated = now
+            # A negative balance is a debt that this reader pays off by sleeping, while
+            # later readers see the debt and wait behind it
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class FileStream:
+    """
+    File-like reader that streams part of a file in fixed-size blocks.
+
+    Every block read is fed into the checksum and reported to the progress
+    callback, so the upload, the checksum and the progress display all happen
+    in the same pass with constant memory. With a limiter, reads are paced to
+    its bandwidth cap.
+
+    The stream can be rewound with seek(), which urllib3 does to send the body again
+    when it retries a request. Bytes read a second time are not hashed or reported again.
+    """
+
+    def __init__(self, file, start: int, end: int, checksum=None, on_read=None, limiter=None):
+        self.file = file
+        self.start = start
+        self.length = end - start
+        self.position = 0
+        # Bytes of the range that were hashed and reported already
+        self.seen = 0
+        self.checksum = checksum
+        self.on_read = on_read
+        self.limiter = limiter
+        self.file.seek(start)
+
+    def __len__(self):
+        return self.length
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.length
+        self.position = min(max(offset, 0), self.length)
+        self.file.seek(self.start + self.position)
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        remaining = self.length - self.position
+        if remaining <= 0:
+            return b""
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+
+        block = self.file.read(min(size, READ_BLOCK_SIZE))
+        if self.limiter is not None:
+            self.limiter.consume(len(block))
+        self.position += len(block)
+        fresh = self.position - self.seen
+        if fresh > 0:
+            self.seen = self.position
+            if self.checksum is not None:
+                self.checksum.update(block[-fresh:])
+            if self.on_read is not None:
+                self.on_read(fresh)
+        return block
+
+
+class MultipartFileStream:
+    """
+    Streaming multipart/form-data body holding a single file field.
+
+    requests builds multipart bodies passed with files= fully in memory, so this
+    class writes the multipart framing around a FileStream instead. Like the
+    FileStream, it can be rewound for a retry.
+    """
+
+    def __init__(self, field: str, path: str, checksum=None, on_read=None, limiter=None):
+        self.boundary = uuid.uuid4().hex
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+
+        self.parts = [
+            (
+                f"--{self.boundary}\r\n"
+                f'Content-Disposition: form-data; name="{field}"; filename="{Path(path).name}"\r\n'
+                "Content-Type: application/octet-stream\r\n\r\n"
+            ).encode(),
+            FileStream(self.file, 0, size, checksum=checksum, on_read=on_read, limiter=limiter),
+            f"\r\n--{self.boundary}--\r\n".encode(),
+        ]
+        self.length = sum(len(part) for part in self.parts)
+        self.position = 0
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self.length
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.length
+        self.position = min(max(offset, 0), self.length)
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        offset = self.position
+        for part in self.parts:
+            if offset >= len(part):
+                offset -= len(part)
+                continue
+            if isinstance(part, bytes):
+                block = part[offset:] if size is None or size < 0 else part[offset : offset + size]
+            else:
+                part.seek(offset)
+                block = part.read(size)
+            self.position += len(block)
+            return block
+        return b""
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def upload_stream(endpoint: str, path: str, field: str = "content", progress=None, limiter=None):
+    """
+    Upload a file as a streamed multipart POST with a progress bar.
+
+    Args:
+        endpoint (str): API endpoint receiving the multipart form.
+        path (str): Path to the file to upload.
+        field (str): Name of the form field holding the file.
+        progress (Progress): Shared progress display to add the upload to. Defaults to a
+            new one for this upload.
+        limiter (BandwidthLimiter): Bandwidth cap shared with other uploads.
+
+    Returns:
+        tuple: (response, sha256) with the response object and the hex digest of the file.
+    """
+    checksum = hashlib.sha256()
+    with nullcontext(progress) if progress else create_progress() as progress:
+        task = progress.add_task(Path(path).name, total=os.path.getsize(path))
+        with MultipartFileStream(
+            field, path, checksum=checksum, on_read=lambda size: progress.advance(task, size), limiter=limiter
+        ) as body:
+            res = api_request(
+                method="post",
+                endpoint=endpoint,
+                data=body,
+                headers={"Content-Type": body.content_type},
+                timeout=upload_timeout(),
+                show_status=False,
+            )
+    return res, checksum.hexdigest()
+
+
+def _load_upload_state() -> dict:
+    if not UPLOAD_STATE_FILE.exists():
+        return {}
+    with open(UPLOAD_STATE_FILE, "r") as file:
+        return json.load(file)
+
+
+def _save_upload_state(state: dict) -> None:
+    UPLOAD_STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with open(UPLOAD_STATE_FILE, "w") as file:
+        json.dump(state, file)
+
+
+def _update_upload_state(key: str, upload_id: str = None) -> None:
+    """Record the upload id of a state key, or drop the key when upload_id is None."""
+    with _state_lock:
+        state = _load_upload_state()
+        if upload_id is None:
+            state.pop(key, None)
+        else:
+            state[key] = upload_id
+        _save_upload_state(state)
+
+
+def _hash_range(file, checksum, start: int, end: int) -> None:
+    file.seek(start)
+    while start < end:
+        block = file.read(min(READ_BLOCK_SIZE, end - start))
+        if not block:
+            break
+        checksum.update(block)
+        start += len(block)
+
+
+def _confirmed_offset(upload_id: str) -> int:
+    res = api_request(method="get", endpoint=f"{UPLOADS_ENDPOINT}/{upload_id}", show_status=False)
+    res.raise_for_status()
+    return int(res.json().get("offset", 0))
+
+
+def upload_chunked(
+    path: str,
+    metadata: dict,
+    chunk_size: int,
+    resume: bool = True,
+    chunk_retries: int = 3,
+    progress=None,
+    limiter=None,
+):
+    """
+    Upload a file in chunks that can be resumed from the last confirmed offset.
+
+    The upload session protocol is:
+
+    - POST /api/v1/provision/osimg/uploads with the file size and metadata returns
+      {"upload_id", "offset"}.
+    - GET /api/v1/provision/osimg/uploads/<upload_id> returns the confirmed {"offset"}.
+    - PUT /api/v1/provision/osimg/uploads/<upload_id> with a Content-Range header stores
+      one chunk and returns the new confirmed {"offset"}.
+    - POST /api/v1/provision/osimg/uploads/<upload_id>/complete with the checksum returns
+      the os image.
+
+    The upload id is kept in ~/.podmanagercli/uploads.json until the upload completes,
+    so running the same upload again continues where the previous run stopped.
+
+    Args:
+        path (str): Path to the file to upload.
+        metadata (dict): Image metadata (architecture, name, title) sent when the upload starts.
+        chunk_size (int): Number of bytes sent per request.
+        resume (bool): Continue a previous upload of the same file if one is recorded.
+        chunk_retries (int): Number of times a failed chunk is retried before giving up.
+        progress (Progress): Shared progress display to add the upload to. Defaults to a
+            new one for this upload.
+        limiter (BandwidthLimiter): Bandwidth cap shared with other uploads.
+
+    Returns:
+        tuple: (response, sha256) with the response of the complete request and the hex
+            digest of the file.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    config = Config.load()
+    state_key = ":".join(
+        [
+            config.target_server if config else "",
+            os.path.abspath(path),
+            str(size),
+            str(stat.st_mtime_ns),
+            json.dumps(metadata, sort_keys=True),
+        ]
+    )
+    with _state_lock:
+        state = _load_upload_state()
+
+    upload_id = state.get(state_key) if resume else None
+    offset = 0
+    if upload_id:
+        try:
+            offset = _confirmed_offset(upload_id)
+        except requests.exceptions.RequestException:
+            upload_id = None
+
+    if not upload_id:
+        res = api_request(
+            method="post",
+            endpoint=UPLOADS_ENDPOINT,
+            json={"filename": Path(path).name, "size": size, **metadata},
+            show_status=False,
+        )
+        res.raise_for_status()
+        upload_id = res.json()["upload_id"]
+        offset = int(res.json().get("offset", 0))
+        _update_upload_state(state_key, upload_id)
+
+    checksum = hashlib.sha256()
+    with open(path, "rb") as file, nullcontext(progress) if progress else create_progress() as progress:
+        task = progress.add_task(Path(path).name, total=size, completed=offset)
+
+        # Bytes confirmed by an earlier run are only read locally to seed the checksum
+        _hash_range(file, checksum, 0, offset)
+
+        failures = 0
+        while offset < size:
+            end = min(offset + chunk_size, size)
+            chunk_checksum = checksum.copy()
+            body = FileStream(
+                file,
+                offset,
+                end,
+                checksum=chunk_checksum,
+                on_read=lambda n: progress.advance(task, n),
+                limiter=limiter,
+            )
+            try:
+                res = api_request(
+                    method="put",
+                    endpoint=f"{UPLOADS_ENDPOINT}/{upload_id}",
+                    data=body,
+                    headers={
+                        "Content-Type": "application/octet-stream",
+                        "Content-Range": f"bytes {offset}-{end - 1}/{size}",
+                    },
+                    timeout=upload_timeout(),
+                    show_status=False,
+                )
+                res.raise_for_status()
+                confirmed = int(res.json().get("offset", end))
+            except requests.exceptions.RequestException:
+                failures += 1
+                if failures > chunk_retries:
+                    raise
+                confirmed = _confirmed_offset(upload_id)
+
+            # Keep the checksum in step with the bytes the server confirmed
+            if confirmed == end:
+                checksum = chunk_checksum
+            elif confirmed >= offset:
+                _hash_range(file, checksum, offset, confirmed)
+            else:
+                checksum = hashlib.sha256()
+                _hash_range(file, checksum, 0, confirmed)
+            if confirmed > offset:
+                failures = 0
+            offset = confirmed
+            progress.update(task, completed=offset)
+
+    res = api_request(
+        method="post",
+        endpoint=f"{UPLOADS_ENDPOINT}/{upload_id}/complete",
+        json={"sha256": checksum.hexdigest()},
+        timeout=upload_timeout(),
+        show_status=False,
+    )
+    if res.ok:
+        _update_upload_state(state_key)
+    return res, checksum.hexdigest()
+
+
+def _load_json(path) -> dict:
+    try:
+        with open(path, "r") as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _save_json(path, data: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(data, file)
+
+
+def _cache_file_hash(path: str, stat, sha256: str) -> None:
+    with _index_lock:
+        hashes = _load_json(HASH_CACHE_FILE)
+        hashes[os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns, sha256]
+        _save_json(HASH_CACHE_FILE, hashes)
+
+
+def file_sha256(path: str, on_read=None) -> str:
+    """
+    Return the SHA-256 of a file, hashing it in one streaming pass unless it is cached.
+
+    Hashes are cached in ~/.podmanagercli/hashes.json by absolute path, and reused as long
+    as the size and modification time of the file are unchanged.
+
+    Args:
+        path (str): Path to the file.
+        on_read (callable): Called with the size of every block read, e.g. to advance a progress bar.
+
+    Returns:
+        str: The hex digest.
+    """
+    stat = os.stat(path)
+    with _index_lock:
+        cached = _load_json(HASH_CACHE_FILE).get(os.path.abspath(path))
+    if cached and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+        if on_read is not None:
+            on_read(stat.st_size)
+        return cached[2]
+
+    checksum = hashlib.sha256()
+    with open(path, "rb") as file:
+        while block := file.read(READ_BLOCK_SIZE):
+            checksum.update(block)
+            if on_read is not None:
+                on_read(len(block))
+    sha256 = checksum.hexdigest()
+    _cache_file_hash(path, stat, sha256)
+    return sha256
+
+
+def fetch_catalogue() -> list:
+    """
+    Fetch the os images on the server, bypassing the response cache so images deleted
+    since the list was cached are not taken for duplicates.
+
+    Raises:
+        requests.exceptions.HTTPError: If the server answers with an error status.
+    """
+    res = api_request(method="get", endpoint=OSIMG_ENDPOINT, show_status=False, use_cache=False)
+    res.raise_for_status()
+    return res.json()
+
+
+def _server() -> str:
+    config = Config.load()
+    return config.target_server if config else ""
+
+
+def find_image(sha256: str, catalogue: list):
+    """
+    Find the os image in the catalogue with the given content.
+
+    Images are matched by a hash field of the catalogue (see CATALOGUE_HASH_FIELDS) when
+    the server reports one, and otherwise through the local index of images uploaded to
+    this server (see index_image), as long as the indexed image is still in the catalogue
+    unchanged. Index entries of images that are gone are dropped.
+
+    Args:
+        sha256 (str): Hex digest of the image file.
+        catalogue (list): The os images, as returned by fetch_catalogue.
+
+    Returns:
+        dict: The os image, or None if the content is not on the server.
+    """
+    for image in catalogue:
+        for field in CATALOGUE_HASH_FIELDS:
+            value = image.get(field)
+            if isinstance(value, str) and value.lower().removeprefix("sha256:") == sha256:
+                return image
+
+    server = _server()
+    with _index_lock:
+        index = _load_json(IMAGE_INDEX_FILE)
+        entry = index.get(server, {}).get(sha256)
+        if entry is None:
+            return None
+        for image in catalogue:
+            # Image ids may be reused after a delete, so the name and size must still match too
+            if all(image.get(key) == entry.get(key) for key in ("id", "name", "size")):
+                return image
+        del index[server][sha256]
+        _save_json(IMAGE_INDEX_FILE, index)
+    return None
+
+
+def index_image(sha256: str, image: dict) -> None:
+    """Record in the local index that the image with this content was uploaded to the current server as image."""
+    with _index_lock:
+        index = _load_json(IMAGE_INDEX_FILE)
+        index.setdefault(_server(), {})[sha256] = {key: image.get(key) for key in ("id", "name", "size")}
+        _save_json(IMAGE_INDEX_FILE, index)
+
+
+def find_duplicates(images: list, catalogue: list, parallel: int = 2) -> dict:
+    """
+    Hash image files and look them up on the server, before any of them is uploaded.
+
+    Files are hashed concurrently with one progress bar each; unchanged files are not
+    read again (see file_sha256).
+
+    Args:
+        images (list): Manifest entries as returned by load_manifest.
+        catalogue (list): The os images, as returned by fetch_catalogue.
+        parallel (int): Maximum number of files hashed at the same time.
+
+    Returns:
+        dict: Path of every image already on the server to a tuple (sha256, os image).
+    """
+
+    def lookup(image):
+        path = image["path"]
+        size = os.path.getsize(path)
+        task = progress.add_task(f"hash {Path(path).name}", total=size)
+        sha256 = file_sha256(path, on_read=lambda n: progress.advance(task, n))
+        return path, sha256, find_image(sha256, catalogue)
+
+    with create_progress() as progress, ThreadPoolExecutor(max_workers=parallel) as executor:
+        results = list(executor.map(lookup, images))
+    return {path: (sha256, image) for path, sha256, image in results if image is not None}
+
+
+def upload_image(path: str, metadata: dict, chunk_size: int = None, resume: bool = True, progress=None, limiter=None):
+    """
+    Upload an os image, in resumable chunks when chunk_size is set and as one streamed request otherwise.
+
+    Args:
+        path (str): Path to the image file.
+        metadata (dict): Image metadata with architecture, name and title.
+        chunk_size (int): Bytes per chunk, or None to stream the image in one request.
+        resume (bool): Continue a previous chunked upload of the same file.
+        progress (Progress): Shared progress display to add the upload to.
+        limiter (BandwidthLimiter): Bandwidth cap shared with other uploads.
+
+    Uploaded images are recorded with their SHA-256 for find_image, and the digest
+    computed while sending is cached for file_sha256.
+
+    Returns:
+        tuple: (response, sha256) as returned by upload_chunked or upload_stream.
+    """
+    stat = os.stat(path)
+    if chunk_size:
+        res, sha256 = upload_chunked(
+            path, metadata, chunk_size=chunk_size, resume=resume, progress=progress, limiter=limiter
+        )
+    else:
+        queries = "&".join(f"{key}={metadata[key]}" for key in ("architecture", "name", "title"))
+        res, sha256 = upload_stream(f"{OSIMG_ENDPOINT}?{queries}", path, progress=progress, limiter=limiter)
+
+    if res.ok:
+        _cache_file_hash(path, stat, sha256)
+        try:
+            image = res.json()
+        except ValueError:
+            image = None
+        if isinstance(image, dict):
+            index_image(sha256, image)
+    return res, sha256
+
+
+def load_manifest(path: str) -> list:
+    """
+    Read a bulk upload manifest.
+
+    The manifest is a JSON list of objects, or a CSV file with a header row, with the
+    fields path, name, title and architecture. Relative image paths are resolved against
+    the directory of the manifest.
+
+    Returns:
+        list: One dict per image with the manifest fields.
+
+    Raises:
+        ValueError: If an entry misses a field or its image file does not exist.
+    """
+    with open(path, "r", newline="") as file:
+        if path.endswith(".json"):
+            entries = json.load(file)
+        else:
+            entries = list(csv.DictReader(file))
+
+    base = Path(path).parent
+    images = []
+    for number, entry in enumerate(entries, start=1):
+        missing = [field for field in MANIFEST_FIELDS if not entry.get(field)]
+        if missing:
+            raise ValueError(f"Manifest entry {number} is missing {', '.join(missing)}")
+        image = {field: str(entry[field]).strip() for field in MANIFEST_FIELDS}
+        image["path"] = str(base / Path(image["path"]).expanduser())
+        if not os.path.isfile(image["path"]):
+            raise ValueError(f"Manifest entry {number}: {image['path']} does not exist")
+        images.append(image)
+    return images
+
+
+def upload_images(images: list, chunk_size: int = None, resume: bool = True, parallel: int = 2, limiter=None):
+    """
+    Upload several os images concurrently with one progress bar per image.
+
+    Args:
+        images (list): Manifest entries as returned by load_manifest.
+        chunk_size (int): Bytes per chunk, or None to stream every image in one request.
+        resume (bool): Continue previous chunked uploads of the same files.
+        parallel (int): Maximum number of uploads in flight.
+        limiter (BandwidthLimiter): Cap on the combined bandwidth of all uploads.
+
+    Returns:
+        list: (image, result) pairs in manifest order, where result is (response, sha256)
+            or the exception raised by the upload.
+    """
+
+    def upload(image):
+        metadata = {key: image[key] for key in ("architecture", "name", "title")}
+        try:
+            return upload_image(image["path"], metadata, chunk_size, resume, progress=progress, limiter=limiter)
+        except Exception as e:
+            return e
+
+    with create_progress() as progress, ThreadPoolExecutor(max_workers=parallel) as executor:
+        results = list(executor.map(upload, images))
+    return list(zip(images, results))
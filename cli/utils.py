@@ -1,19 +1,43 @@
-import base64
-import inspect
-import json
+import contextvars
+import re
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
 from pathlib import Path
 
 import click
-import requests
-from packaging.version import Version
-from pydantic import BaseModel, Field
-from rich.console import Console
 from datetime import datetime
 
-CONFIG_FILE = Path("~/.podmanagercli/.config")
+from cli.cache import ConditionalCache, ResponseCache
+from cli.profiling import profiler
+from cli.query import FilterSyntaxError, compile_filters, parse_sort_keys, sort_rows
+from cli.table import ColumnTable
 
+CONFIG_FILE = Path("~/.podmanagercli/.config").expanduser()
+# Logins to named clusters, one file per cluster in the format of CONFIG_FILE. The login
+# in CONFIG_FILE itself is the default cluster.
+CLUSTERS_DIR = CONFIG_FILE.parent / "clusters"
+DEFAULT_CLUSTER = "default"
+CLUSTER_NAME_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_.-]*")
+# Column holding the cluster name of every item in results merged from several clusters
+CLUSTER_FIELD = "cluster"
 
-console = Console()
+response_cache = ResponseCache(CONFIG_FILE.parent / "cache")
+conditional_cache = ConditionalCache()
+
+# When set to a list, api_request appends (method, path, status) for every response it
+# returns in the current context. Used by the batch command to judge each operation.
+request_log = contextvars.ContextVar("request_log", default=None)
+
+# Name of the cluster whose login api_request uses in the current context, None for the
+# default one. Set per thread by run_on_clusters.
+current_cluster = contextvars.ContextVar("current_cluster", default=None)
+
+_status_lock = threading.Lock()
+_status_labels = []
+_status = None
 
 
 class AuthError(Exception):
@@ -22,83 +46,151 @@ class AuthError(Exception):
     pass
 
 
-class Config(BaseModel):
-    """
-    Configuration model for the CLI.
-    This model is used to store the token in a base64 encoded format.
+def resolve_clusters(clusters: str = None, all_clusters: bool = False) -> list:
     """
+    Return the clusters selected by the --clusters and --all-clusters options.
 
-    target_server: str = Field(..., description="The target server URL")
-    access_token: str = Field(..., description="Base64 encoded token for authentication")
-    expire_at: str = Field(None, description="Token expiration time in ISO format")
+    Args:
+        clusters (str): Comma-separated cluster names.
+        all_clusters (bool): Select every cluster with a saved login.
 
-    @classmethod
-    def load(cls) -> "Config":
-        """
-        Load the configuration from the config file.
+    Returns:
+        list: The cluster names in the given order, empty when no cluster was selected.
 
-        Returns:
-            Config: An instance of Config with the loaded token.
-        """
-        if not CONFIG_FILE.exists():
-            return None
+    Raises:
+        click.UsageError: If a cluster has no saved login, or there is none at all.
+    """
+    from cli.config import Config
+
+    known = Config.clusters()
+    if all_clusters:
+        if not known:
+            raise click.UsageError("No cluster logins found. Please login first.")
+        return known
+    if not clusters:
+        return []
+
+    names = [*dict.fromkeys(name.strip() for name in clusters.split(",") if name.strip())]
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise click.UsageError(
+            f"No login for cluster(s): {', '.join(unknown)}. Login with `login --cluster NAME` first."
+        )
+    return names
+
+
+def caller_label(depth: int = 1) -> str:
+    """
+    Describe a calling function as "module.function" for spinner labels.
 
-        # if not CONFIG_FILE.exists():
-        #     raise FileNotFoundError(f"Configuration file {CONFIG_FILE} does not exist.")
+    Uses sys._getframe instead of inspect.stack(), which reads source context for
+    every frame on the stack.
 
-        with open(CONFIG_FILE, "r") as file:
-            data = file.read()
+    Args:
+        depth (int): How many frames above the caller of caller_label to describe.
 
-        decoded_data = json.loads(base64.b64decode(data).decode())
-        if not isinstance(decoded_data, dict):
-            raise ValueError("Invalid configuration format.")
+    Returns:
+        str: The module and function name of the frame.
+    """
+    frame = sys._getframe(depth + 1)
+    return f"{Path(frame.f_code.co_filename).stem}.{frame.f_code.co_name}"
 
-        return cls(**decoded_data)
 
-    @classmethod
-    def save(cls, target_server: str, access_token: str, expire_at: str) -> None:
-        """
-        Save the configuration to the config file.
+@contextmanager
+def request_status(label: str):
+    """
+    Show a spinner while a request is in flight.
 
-        Args:
-            target_server (str): The target server URL.
-            access_token (str): The access token to save.
-        """
-        config = cls(target_server=target_server, access_token=access_token, expire_at=expire_at)
-        encoded_data = base64.b64encode(config.model_dump_json().encode()).decode()
+    Rich only allows one live display at a time, so concurrent requests share a
+    single spinner that lists every label currently in progress.
 
-        CONFIG_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with open(CONFIG_FILE, "w") as file:
-            file.write(encoded_data)
+    Args:
+        label (str): Description of the request shown next to the spinner.
+    """
+    global _status
 
-    @classmethod
-    def clear(cls) -> None:
-        """
-        Clear the configuration by deleting the config file.
-        """
-        if CONFIG_FILE.exists():
-            CONFIG_FILE.unlink()
+    with _status_lock:
+        _status_labels.append(label)
+        if _status is None:
+            from rich.console import Console
+
+            _status = Console().status(f"Processing {label}...")
+            _status.start()
+        else:
+            _status.update(f"Processing {', '.join(_status_labels)}...")
+    try:
+        yield
+    finally:
+        with _status_lock:
+            _status_labels.remove(label)
+            if _status_labels:
+                _status.update(f"Processing {', '.join(_status_labels)}...")
+            else:
+                _status.stop()
+                _status = None
 
 
-def api_request(method: str, endpoint: str, **kwargs):
+def _request_size(body) -> int:
+    if body is None:
+        return 0
+    try:
+        return len(body)
+    except TypeError:
+        return 0
+
+
+def _response_size(response) -> int:
+    if response._content_consumed:
+        return len(response.content or b"")
+    return int(response.headers.get("Content-Length", 0))
+
+
+def api_request(
+    method: str,
+    endpoint: str,
+    label: str = None,
+    show_status: bool = True,
+    conditional: bool = False,
+    use_cache: bool = True,
+    **kwargs,
+):
     """
     Make an API request to the configured server.
 
     Args:
         method (str): HTTP method (GET, POST, etc.).
         endpoint (str): API endpoint to call.
-        **kwargs: Additional parameters for the request.
+        label (str): Spinner label. Defaults to the module and function of the caller.
+        show_status (bool): Show a spinner while the request is in flight. Disable it when
+            the caller renders its own progress display.
+        conditional (bool): Bypass the on-disk cache and revalidate the last response for
+            this URL with If-None-Match/If-Modified-Since. On 304 the previous response is
+            returned with not_modified=True. Meant for callers that poll an endpoint.
+        use_cache (bool): Answer from the on-disk cache when it holds a fresh response.
+            Disable it where a stale answer does harm, e.g. before deleting by id. The
+            response still refreshes the cache.
+        **kwargs: Additional parameters for the request. With stream=True the body is not
+            read up front, so it can be parsed incrementally (see cli.jsonstream).
+
+    Requests are sent through the shared session from cli.session, so the
+    connection to the server is kept alive and reused between calls, or through
+    the background agent when one is running (see cli.agent), which keeps them
+    alive between commands as well. Read timeouts follow the latency of every endpoint,
+    read-only requests that take longer than their endpoint usually does are hedged, and
+    endpoints that keep failing fail fast with CircuitOpenError (see cli.latency). Responses
+    of the read-only inventory endpoints are served from response_cache while
+    they are fresh, and successful mutating requests invalidate them.
 
     Returns:
         Response: The response object from the requests library.
     """
-    # Get caller information
-    stack = inspect.stack()
-    caller_frame = stack[1]  # The frame of the function that called api_request
-    caller_file = caller_frame.filename
-    caller_function = caller_frame.function
+    if show_status and label is None:
+        label = caller_label()
+
+    from cli.config import Config
 
-    config = Config.load()
+    with profiler.span("config.load"):
+        config = Config.load()
     if not config or not config.access_token:
         raise AuthError("No valid token found. Please login first.")
 
@@ -110,112 +202,357 @@ def api_request(method: str, endpoint: str, **kwargs):
 
     url = f"{config.target_server}{endpoint}"
 
-    with console.status(f"Processing {Path(caller_file).stem}.{caller_function}..."):
-        return requests.request(method, url, headers=headers, **kwargs)
+    with profiler.span(f"{method.upper()} {endpoint.split('?', 1)[0]}", category="http") as span:
+        cached = None if conditional or not use_cache else response_cache.get(config.target_server, method, endpoint, kwargs)
+        if cached is not None:
+            span.update(status=cached.status_code, cached=True, bytes_received=len(cached.content))
+            _log_request(method, endpoint, cached)
+            return cached
+
+        if conditional:
+            headers.update(conditional_cache.headers_for(url))
+
+        from cli.latency import endpoint_key
+
+        key = endpoint_key(method, config.target_server, endpoint)
+        # Read-only requests with a replayable body may be sent twice when hedged
+        idempotent = (
+            method.upper() in ("GET", "HEAD") or response_cache.ttl_for(method, endpoint) is not None
+        ) and response_cache.payload_of(kwargs) is not None
+        if show_status:
+            with request_status(label):
+                response = _send(method, url, headers, kwargs, key, idempotent)
+        else:
+            response = _send(method, url, headers, kwargs, key, idempotent)
+
+        if profiler.enabled:
+            span.update(
+                status=response.status_code,
+                bytes_sent=_request_size(response.request.body),
+                bytes_received=_response_size(response),
+            )
+
+        if conditional:
+            response = conditional_cache.resolve(url, response)
+            span.update(not_modified=response.not_modified)
+
+    if response_cache.ttl_for(method, endpoint) is not None:
+        if kwargs.get("stream") and not response._content_consumed:
+            # Cache the body once the caller has read it, without loading it up front
+            response.raw = _TeeReader(
+                response.raw,
+                lambda content: response_cache.set(
+                    config.target_server, method, endpoint, kwargs, response, content=content
+                ),
+            )
+        else:
+            response_cache.set(config.target_server, method, endpoint, kwargs, response)
+    elif method.upper() != "GET" and response.ok:
+        response_cache.invalidate(config.target_server, endpoint)
+    _log_request(method, endpoint, response)
+    return response
+
+
+def _send(method: str, url: str, headers: dict, kwargs: dict, key: str = None, idempotent: bool = False):
+    from cli.agent import agent_client
+    from cli.latency import endpoint_monitor
+    from cli.session import get_session, session_settings
+    from urllib3.util.retry import Retry
+
+    monitored = key is not None and endpoint_monitor.enabled
+    if monitored and kwargs.get("timeout") is None:
+        # Give up waiting for the answer after a multiple of what the endpoint usually takes.
+        # urllib3 only retries reads of idempotent methods.
+        settings = session_settings()
+        retries = settings["retries"] if method.upper() in Retry.DEFAULT_ALLOWED_METHODS else 0
+        timeout = endpoint_monitor.timeout_for(key, settings["timeout"], retries)
+        if timeout is not None:
+            kwargs = {**kwargs, "timeout": (settings["timeout"], timeout)}
+
+    def send():
+        response = agent_client.request(method, url, headers=dict(headers), **kwargs)
+        if response is None:
+            response = get_session().request(method, url, headers=dict(headers), **kwargs)
+        return response
+
+    if not monitored:
+        return send()
+    return endpoint_monitor.send(key, send, idempotent=idempotent)
+
+
+class _TeeReader:
+    """
+    Wrapper of a streamed response's raw body that hands the complete body to a callback.
+
+    The chunks read through stream() are collected and passed to on_complete once the
+    body has been read to the end, which lets streamed responses still be cached.
+    """
+
+    def __init__(self, raw, on_complete):
+        self._raw = raw
+        self._on_complete = on_complete
+
+    def stream(self, amt=None, decode_content=None):
+        chunks = []
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            chunks.append(chunk)
+            yield chunk
+        self._on_complete(b"".join(chunks))
 
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
 
-def parse_filter_condition(condition):
-    """Parse a filter condition into key, operator, and value."""
-    for operator in [">=", "<=", "!=", ">", "<", "="]:
-        if operator in condition:
-            key, value = condition.split(operator, 1)
-            return key.strip(), operator, value.strip()
-    raise ValueError("Invalid filter condition")
 
+def _log_request(method: str, endpoint: str, response) -> None:
+    log = request_log.get()
+    if log is not None:
+        log.append((method.upper(), endpoint.split("?", 1)[0], response.status_code))
+
+
+SIZE_UNITS = {"": 1, "K": 1024, "M": 1024**2, "G": 1024**3, "T": 1024**4}
+
+
+def parse_size(value: str) -> int:
+    """
+    Parse a byte size with an optional binary unit suffix, e.g. "512K", "64M" or "1G".
 
-def compare_values(item, value, operator):
-    """Compare two values with the given operator, supporting float, version, and string comparisons."""
+    Args:
+        value (str): The size to parse.
+
+    Returns:
+        int: The size in bytes.
+    """
+    text = str(value).strip().upper()
+    for suffix in ("IB", "B"):
+        if text.endswith(suffix) and len(text) > len(suffix):
+            text = text[: -len(suffix)]
+            break
+
+    unit = text[-1] if text and text[-1] in SIZE_UNITS else ""
+    number = text[: len(text) - len(unit)]
     try:
-        # Attempt to interpret the values as float or version
-        if operator in [">=", "<=", ">", "<"]:
+        size = int(float(number) * SIZE_UNITS[unit])
+    except ValueError:
+        raise ValueError(f"Invalid size: {value}")
+    if size <= 0:
+        raise ValueError(f"Size must be positive: {value}")
+    return size
+
+
+def fetch_concurrently(calls: dict, max_workers: int = None, parse=None):
+    """
+    Run independent API requests in parallel on a thread pool.
+
+    Args:
+        calls (dict): Mapping of a name to the keyword arguments for api_request.
+        max_workers (int): Maximum number of requests in flight. Defaults to one per call.
+        parse (callable): Function called with the name and every successful response in
+            the worker thread, e.g. to parse a streamed body while other requests are in
+            flight. Its result is stored as response.parsed.
+
+    Yields:
+        tuple: (name, result) pairs in the order the requests finish. The result is the
+            response, or the RequestException (or ValueError from parse) raised by the call.
+    """
+    import requests
+
+    if not calls:
+        return
+
+    caller = caller_label()
+    for name, kwargs in calls.items():
+        kwargs.setdefault("label", f"{caller}:{name}")
+
+    with ThreadPoolExecutor(max_workers=max_workers or len(calls)) as executor:
+        # Each request runs in a copy of the caller's context, so context variables such as
+        # request_log follow it into the worker thread
+        futures = {
+            executor.submit(contextvars.copy_context().run, _request_and_parse, name, kwargs, parse): name
+            for name, kwargs in calls.items()
+        }
+        for future in as_completed(futures):
             try:
-                # Try comparing as float
-                item = float(item)
-                value = float(value)
-
-            except ValueError:
-                try:
-                    # If not float, compare as version
-                    item = Version(str(item))
-                    value = Version(str(value))
-                except ValueError:
-                    # If not version, compare as string (dictionary order)
-                    item = str(item)
-                    value = str(value)
-            except TypeError:
-                return False
-
-        # Perform comparison
-        if operator == ">=":
-            return item >= value
-        elif operator == "<=":
-            return item <= value
-        elif operator == "!=":
-            return str(item) != str(value)
-        elif operator == ">":
-            return item > value
-        elif operator == "<":
-            return item < value
-        elif operator == "=":
-            return str(item) == str(value)
-    except (ValueError, TypeError) as e:
-        import traceback
-
-        print(traceback.format_exc())
-        click.secho(f"Error comparing values: {e}")
-        return False
-    return False
-
-
-def evaluate_condition(item, key, operator, value):
-    """Evaluate a filter condition, supporting nested keys."""
+                yield futures[future], future.result()
+            except (requests.exceptions.RequestException, ValueError) as e:
+                yield futures[future], e
+
+
+def _request_and_parse(name, kwargs: dict, parse):
+    response = api_request(**kwargs)
+    if parse is not None:
+        if response.ok:
+            response.parsed = parse(name, response)
+        else:
+            # Read the error body so a streamed response releases its connection
+            response.content
+    return response
+
+
+def run_on_clusters(clusters: list, func, timeout: float = None) -> list:
+    """
+    Call func once per cluster, concurrently, with api_request talking to that cluster.
+
+    Every call runs on its own thread in a copy of the caller's context with
+    current_cluster set, so the requests it sends, including those it fans out with
+    fetch_concurrently, use the login of its cluster. The threads are daemon threads: a
+    cluster that has not answered when the timeout expires is given up on without
+    holding up the others or the exit of the process.
+
+    Args:
+        clusters (list): Names of the clusters.
+        func (callable): Function called without arguments.
+        timeout (float): Seconds to wait for all clusters. None waits for every one.
+
+    Returns:
+        list: (cluster, result) pairs in the order of clusters. The result is the return
+            value of func, the exception it raised, or a TimeoutError.
+    """
+    futures = {}
+    for cluster in clusters:
+        future = futures[cluster] = Future()
+        threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(_call_on_cluster, cluster, func, future),
+            name=f"cluster-{cluster}",
+            daemon=True,
+        ).start()
+
+    wait(futures.values(), timeout=timeout)
+
+    results = []
+    for cluster, future in futures.items():
+        if not future.done():
+            results.append((cluster, TimeoutError(f"no answer within {timeout:g}s")))
+        elif future.exception() is not None:
+            results.append((cluster, future.exception()))
+        else:
+            results.append((cluster, future.result()))
+    return results
+
+
+def _call_on_cluster(cluster: str, func, future: Future) -> None:
+    current_cluster.set(cluster)
     try:
-        # Resolve nested keys (e.g., "power.status")
-        keys = key.split(".")
-        for k in keys:
-            if isinstance(item, dict):
-                item = item.get(k)
-            else:
-                return False
-        # Use the compare_values function for comparison
-        return compare_values(item, value, operator)
-    except (ValueError, TypeError) as e:
-        click.secho(f"Error evaluating condition: {e}", fg="red")
-        return False
+        future.set_result(func())
+    except Exception as e:
+        future.set_exception(e)
+
+
+def fetch_sharded(
+    calls: dict, batch_size: int = 0, parallel: int = 4, retries: int = 2, backoff: float = 0.5, parse=None
+):
+    """
+    Fetch per-item maps for large item lists in shards, with bounded parallelism.
+
+    The JSON list of every call is split into shards of at most batch_size items.
+    All shards are fetched concurrently and their JSON objects merged into one map
+    per call. A shard that fails is retried on its own, unless its endpoint has an open
+    circuit breaker; shards that still fail after all retries are reported instead of
+    aborting the whole fetch.
+
+    Args:
+        calls (dict): Mapping of a name to the keyword arguments for api_request. The
+            "json" argument must be the list of items to split.
+        batch_size (int): Maximum number of items per shard. 0 sends each list in one request.
+        parallel (int): Maximum number of shard requests in flight.
+        retries (int): Number of times a failed shard is retried.
+        backoff (float): Base delay in seconds between retry rounds, doubled every round.
+        parse (callable): Function called with the name of the call and a response,
+            returning the map to merge. It runs in the worker threads. Defaults to
+            response.json().
+
+    Returns:
+        tuple: (results, failures) where results maps each name to the merged map and
+            failures is a list of (name, items, error) for shards that could not be fetched.
+    """
+    import requests
+
+    from cli.latency import CircuitOpenError
+
+    caller = caller_label()
+
+    results = {name: {} for name in calls}
+    pending = {}
+    for name, kwargs in calls.items():
+        items = kwargs.get("json") or []
+        size = batch_size if batch_size and batch_size > 0 else max(len(items), 1)
+        shards = [items[start : start + size] for start in range(0, len(items), size)] or [items]
+        for index, shard in enumerate(shards):
+            label = f"{caller}:{name}[{index + 1}/{len(shards)}]" if len(shards) > 1 else f"{caller}:{name}"
+            pending[(name, index)] = (shard, {"label": label, **kwargs, "json": shard})
+
+    errors = {}
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+
+        shard_calls = {key: dict(call) for key, (_, call) in pending.items()}
+        shard_parse = (lambda key, res: parse(key[0], res)) if parse is not None else None
+        for key, res in fetch_concurrently(shard_calls, max_workers=parallel, parse=shard_parse):
+            try:
+                if isinstance(res, Exception):
+                    raise res
+                res.raise_for_status()
+                results[key[0]].update(res.parsed if parse is not None else res.json())
+            except (requests.exceptions.RequestException, ValueError) as e:
+                errors[key] = e
+                continue
+
+            errors.pop(key, None)
+            del pending[key]
+
+        if all(isinstance(errors[key], CircuitOpenError) for key in pending):
+            # Retrying only fails fast again until the breaker closes
+            break
+
+    failures = [(key[0], shard, errors[key]) for key, (shard, _) in pending.items()]
+    return results, failures
 
 
 def apply_filters(data, filter_conditions):
-    """Apply filter conditions to a list of data items."""
+    """
+    Apply filter conditions to a list of data items or a ColumnTable.
+
+    The conditions are compiled once into a single predicate (see cli.query.compile_filter)
+    and then evaluated for every item. A ColumnTable is filtered on its columns, returning
+    a table of the matching rows.
+    """
     if not filter_conditions:
         return data
 
-    filtered_data = []
-    for item in data:
-        include_item = True
-        for condition in filter_conditions:
-            try:
-                key, operator, value = parse_filter_condition(condition)
+    try:
+        if isinstance(data, ColumnTable):
+            return data.where(compile_filters(filter_conditions, getter=data.getter))
+        predicate = compile_filters(filter_conditions)
+    except FilterSyntaxError as e:
+        click.secho(f"Invalid filter condition: {e}", fg="red")
+        return []
 
-                if not evaluate_condition(item, key, operator, value):
-                    include_item = False
-                    break
-            except ValueError:
-                click.secho(f"Invalid filter condition: {condition}", fg="red")
-                return []
+    return [item for item in data if predicate(item)]
 
-        if include_item:
-            filtered_data.append(item)
 
-    return filtered_data
+def apply_sorting(data, sort_key, reverse=False, limit=None):
+    """
+    Sort data based on one or more keys.
 
+    Args:
+        data (list): The items to sort, or a ColumnTable.
+        sort_key (str): Comma-separated dotted keys, each optionally suffixed with
+            ":asc"/":desc" and a type, e.g. "Status,BMC IPv4:desc".
+        reverse (bool): Sort keys without an explicit order in descending order.
+        limit (int): Only return the first limit items.
 
-def apply_sorting(data, sort_key, reverse=False):
-    """Sort data based on a specified key."""
+    Returns:
+        list: The sorted items, or a ColumnTable of the sorted rows.
+    """
     if not sort_key:
-        return data
+        return data[:limit] if limit is not None else data
 
     try:
-        return sorted(data, key=lambda x: x.get(sort_key, ""), reverse=reverse)
+        keys = parse_sort_keys(sort_key, default_order="desc" if reverse else "asc")
+        if isinstance(data, ColumnTable):
+            return data.sorted(keys, limit=limit)
+        return sort_rows(data, keys, limit=limit)
     except Exception as e:
         click.secho(f"Error sorting data: {e}", fg="red")
         return data